@@ -1,169 +1,507 @@
-from flask import Flask, request, jsonify  # For creating and handling Flask API requests/responses
-from search import search_questions        # Custom module to search for questions
-from generate_response import generate_response  # Custom module to generate AI-powered responses
-import psycopg2                            # PostgreSQL database adapter
-import random                              # For shuffling question options
-from flask_cors import CORS                # For enabling Cross-Origin Resource Sharing (CORS)
-
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes in the Flask app
-
-# --------------------------------------------------------------------
-# Database Connection:
-#   - Connect to the local PostgreSQL database 'ccna_db'
-#   - Update the credentials (dbname, user, password, host) as needed
-# --------------------------------------------------------------------
-conn = psycopg2.connect(
-    dbname="ccna_db",
-    user="*********",
-    password="*******",
-    host="localhost"
-)
-
-# --------------------------------------------------------------------
-# SEARCH Endpoint (/search):
-#   - Expects a JSON payload with a "query" field.
-#   - Performs a search for CCNA-related questions using ChromaDB (or another search mechanism).
-#   - Returns up to 5 relevant questions, along with their correct/incorrect answers.
-# --------------------------------------------------------------------
-@app.route('/search', methods=['POST'])
-def search_endpoint():
-    data = request.json
-    query = data.get("query", "")
-
-    # If no query is provided, return a 400 Bad Request response
-    if not query:
-        return jsonify({"error": "Query is required"}), 400
-
-    # ------------------------------------------------------------------ #
-    # Tokenize the user's query into a set of words (for a relevance check)
-    # ------------------------------------------------------------------ #
-    query_words = set(query.lower().split())
-
-    # Fetch results from the search_questions function with top_k=5
-    results = search_questions(query, top_k=5)
-
-    # If the results are nested (as a list of lists from ChromaDB), flatten them
-    if len(results) > 0 and isinstance(results[0], list):
-        questions_flat = results[0]
-    else:
-        questions_flat = results
-
-    # If no results are found, respond with an error message
-    if not questions_flat:
-        return jsonify({"error": "No CCNA-related topics found. Try a different CCNA topic."}), 400
-
-    # ----------------------------------------------------------------------- #
-    # Check if at least one question is "relevant" to the user's query:
-    #   - If no question intersects with the query_words set, 
-    #     assume the topic is not CCNA-related and return a 400 response.
-    # ----------------------------------------------------------------------- #
-    found_relevant = False
-    for question_text in questions_flat:
-        question_words = set(question_text.lower().split())
-        if query_words.intersection(question_words):
-            found_relevant = True
-            break
-
-    if not found_relevant:
-        return jsonify({
-            "error": "The topic should be related to CCNA. "
-                     "Please try again with a valid CCNA-related topic."
-        }), 400
-
-    # Prepare a list to store the final questions with their correct and incorrect answers
-    questions_with_answers = []
-
-    try:
-        # For each question retrieved, find its correct and incorrect answers in the database
-        for idx, question_text in enumerate(questions_flat, start=1):
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT correct_answer, incorrect_answers 
-                    FROM questions 
-                    WHERE question = %s
-                    """,
-                    (question_text,)
-                )
-                result = cur.fetchone()
-
-                # If the question exists in the database, extract its answers
-                if result:
-                    correct_answer, incorrect_answers = result
-                    # Ensure incorrect_answers is a list; handle if it's None or another data type
-                    if not isinstance(incorrect_answers, list):
-                        incorrect_answers = []
-                else:
-                    # If the question does not exist, provide placeholders
-                    correct_answer = "Correct Answer Not Found"
-                    incorrect_answers = ["Incorrect 1", "Incorrect 2", "Incorrect 3"]
-
-                # Add the question data (including answers) to the list
-                questions_with_answers.append({
-                    "id": idx,
-                    "question": question_text,
-                    "correct_answer": correct_answer,
-                    "incorrect_answers": incorrect_answers
-                })
-
-    except Exception as e:
-        # Return a 500 Internal Server Error if there's any issue retrieving answers
-        return jsonify({"error": f"Error retrieving answers: {e}"}), 500
-
-    # Shuffle the final list of options for each question for randomness
-    for question in questions_with_answers:
-        options = [question['correct_answer']] + question['incorrect_answers']
-        random.shuffle(options)
-        question['options'] = options
-
-    # Return the query, along with the question data, as JSON
-    return jsonify({"query": query, "results": questions_with_answers})
-
-# --------------------------------------------------------------------
-# VALIDATE Endpoint (/validate):
-#   - Expects JSON payload with "query", "questions", "correct_answers", "user_answers"
-#   - Compares user answers to the correct answers
-#   - Uses generate_response to produce feedback
-# --------------------------------------------------------------------
-@app.route('/validate', methods=['POST'])
-def validate_endpoint():
-    try:
-        # Parse the JSON data from the request
-        data = request.json
-        # Ensure all required fields are present
-        if not data or not all(k in data for k in ("query", "questions", "correct_answers", "user_answers")):
-            return jsonify({"error": "Invalid input data. Ensure query, questions, correct_answers, and user_answers are provided."}), 400
-
-        query = data["query"]
-        questions = data["questions"]
-        correct_answers = data["correct_answers"]
-        user_answers = data["user_answers"]
-
-        # Check that the lists of questions, correct_answers, and user_answers have the same length
-        if not (len(questions) == len(correct_answers) == len(user_answers)):
-            return jsonify({"error": "Mismatch in the length of questions, correct_answers, and user_answers."}), 400
-
-        # Generate feedback (e.g., explanations, correctness checks) from a custom AI or logic
-        feedback = generate_response({
-            "query": query,
-            "questions": questions,
-            "correct_answers": correct_answers,
-            "user_answers": user_answers
-        })
-
-        # Return the generated feedback to the client
-        return jsonify({"feedback": feedback})
-
-    except Exception as e:
-        # Log the error and return a 500 Internal Server Error
-        print(f"Error in /validate endpoint: {e}")
-        return jsonify({"error": "Internal server error"}), 500
-
-# --------------------------------------------------------------------
-# Main Server Entry Point:
-#   - Runs the Flask app in debug mode.
-#   - Remove debug=True in production for security/performance.
-# --------------------------------------------------------------------
-if __name__ == '__main__':
-    app.run(debug=True)
+from flask import Flask, request, jsonify, Response, stream_with_context  # For creating and handling Flask API requests/responses
+from search import search_questions, search_questions_batch, is_relevant, check_index_version, lookup_answers, exclude_hits  # Custom module to search for questions
+from generate_response import generate_response, generate_response_stream, grade  # Custom module to generate AI-powered responses
+import db                                  # Pooled PostgreSQL connections
+from sessions import create_session_store  # Server-side exam sessions
+from topics import TopicIndex              # Precomputed topic clusters for /exam
+from banks import BANKS, table_name        # Question banks served by this process
+import json                                # Server-Sent Event payloads
+import os                                  # Exam size limits
+import time                                # Request latency
+import metrics                             # Prometheus metrics, Server-Timing, profiler
+from metrics import span                   # Per-stage timing
+import random                              # For shuffling question options
+from flask_cors import CORS                # For enabling Cross-Origin Resource Sharing (CORS)
+
+app = Flask(__name__)
+CORS(app)  # Enable CORS for all routes in the Flask app
+
+# Exam sessions: grading data stays on the server, clients only get a token
+sessions = create_session_store()
+
+# Topic buckets built by preprocess.py, per question bank; loaded on first use
+topic_indexes = {bank: TopicIndex(bank) for bank in BANKS}
+
+# --------------------------------------------------------------------
+# Request instrumentation:
+#   - Every request collects the spans (metrics.span) run on its thread and
+#     reports them in a Server-Timing header, e.g.
+#       Server-Timing: encode;dur=7.91, vector;dur=2.10, db;dur=1.45, total;dur=14.02
+#     which browser dev tools and curl -v show next to the response.
+#   - Latency per endpoint and status goes to ccna_request_seconds.
+# --------------------------------------------------------------------
+@app.before_request
+def start_timing():
+    metrics.start_request()
+    request.started_at = time.perf_counter()
+
+
+@app.after_request
+def report_timing(response):
+    started = getattr(request, "started_at", None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    timings = metrics.request_timings() + [("total", elapsed)]
+    response.headers["Server-Timing"] = metrics.server_timing_header(timings)
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.REQUEST_SECONDS.labels(endpoint, str(response.status_code)).observe(elapsed)
+    return response
+
+
+# --------------------------------------------------------------------
+# METRICS Endpoint (/metrics):
+#   - Prometheus text exposition of every counter and histogram in
+#     metrics.py (all workers combined when served by gunicorn).
+# --------------------------------------------------------------------
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    body, content_type = metrics.exposition()
+    return Response(body, content_type=content_type)
+
+# --------------------------------------------------------------------
+# fetch_answers:
+#   - Borrows a connection from the thread-safe pool in db.py (credentials
+#     and pool sizes are configured there through CCNA_DB_* env vars).
+#   - Looks up the answers of many questions, given as (bank, id) pairs, by
+#     primary key in one query per question bank.
+#   - Returns {(bank, id): (correct_answer, incorrect_answers)}; questions
+#     that are not in their bank's table are simply missing from the result.
+#   - With the artifact retrieval backend the answers are read from the
+#     memory-mapped artifacts instead, so /search keeps working while
+#     PostgreSQL is down; only ids missing from them (e.g. right after a new
+#     artifact was published) go to the database.
+# --------------------------------------------------------------------
+def fetch_answers(keys):
+    by_bank = {}
+    for bank, qid in keys:
+        by_bank.setdefault(bank, []).append(qid)
+
+    answers = {}
+    for bank, question_ids in by_bank.items():
+        found = lookup_answers(bank, question_ids) or {}
+        answers.update(((bank, qid), value) for qid, value in found.items())
+        missing = [qid for qid in question_ids if qid not in found]
+        if not missing:
+            continue
+
+        with db.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT id, correct_answer, incorrect_answers
+                FROM {table_name(bank)}
+                WHERE id = ANY(%s)
+                """,
+                (missing,)
+            )
+            rows = cur.fetchall()
+
+        for qid, correct_answer, incorrect_answers in rows:
+            # Ensure incorrect_answers is a list; handle if it's None or another data type
+            if not isinstance(incorrect_answers, list):
+                incorrect_answers = []
+            answers[(bank, qid)] = (correct_answer, incorrect_answers)
+    return answers
+
+# fetch_questions: like fetch_answers, but for exams that are not built from
+# search hits: returns the hits ({"id", "bank", "question"}, in the order of
+# question_ids) together with their answers, from one query.
+def fetch_questions(bank, question_ids):
+    if not question_ids:
+        return [], {}
+
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT id, question, correct_answer, incorrect_answers
+            FROM {table_name(bank)}
+            WHERE id = ANY(%s)
+            """,
+            (list(question_ids),)
+        )
+        rows = cur.fetchall()
+
+    texts, answers = {}, {}
+    for qid, question, correct_answer, incorrect_answers in rows:
+        if not isinstance(incorrect_answers, list):
+            incorrect_answers = []
+        texts[qid] = question
+        answers[(bank, qid)] = (correct_answer, incorrect_answers)
+    hits = [{"id": qid, "bank": bank, "question": texts[qid]} for qid in question_ids if qid in texts]
+    return hits, answers
+
+# --------------------------------------------------------------------
+# build_exam:
+#   - Combines retrieved hits with their answers (from fetch_answers) and
+#     shuffles the options of every question.
+#   - Stores the grading data (shuffled options and the index of the
+#     correct one) in an exam session; the client only receives the
+#     session token, the question texts and the options.
+#   - The session also remembers the questions handed out so far on the
+#     topic ("seen": `seen` plus this exam's), for /search's exclude_session.
+# --------------------------------------------------------------------
+def build_exam(query, hits, answers, seen=()):
+    results = []
+    session_questions = []
+    for idx, hit in enumerate(hits, start=1):
+        # If the question exists in the database, use its answers; otherwise provide placeholders
+        correct_answer, incorrect_answers = answers.get(
+            (hit["bank"], hit["id"]),
+            ("Correct Answer Not Found", ["Incorrect 1", "Incorrect 2", "Incorrect 3"])
+        )
+
+        # Shuffle the options of each question for randomness
+        options = [correct_answer] + incorrect_answers
+        random.shuffle(options)
+
+        results.append({"id": idx, "question": hit["question"], "options": options})
+        session_questions.append({
+            "question_id": hit["id"],
+            "bank": hit["bank"],
+            "question": hit["question"],
+            "options": options,
+            "correct": options.index(correct_answer),
+        })
+
+    with span("session"):
+        token = sessions.create({
+            "query": query,
+            "questions": session_questions,
+            "seen": [list(key) for key in seen] + [[hit["bank"], hit["id"]] for hit in hits],
+        })
+    return {"query": query, "session": token, "results": results}
+
+# Error messages shared by /search and /search/batch
+NO_RESULTS_ERROR = "No CCNA-related topics found. Try a different CCNA topic."
+OFF_TOPIC_ERROR = ("The topic should be related to CCNA. "
+                   "Please try again with a valid CCNA-related topic.")
+UNKNOWN_BANK_ERROR = f"Unknown question bank. Choose one of: {', '.join(BANKS)}"
+
+# --------------------------------------------------------------------
+# SEARCH Endpoint (/search):
+#   - Expects a JSON payload with a "query" field and an optional "bank"
+#     (one of CCNA_BANKS); without it every question bank is searched and
+#     the best questions of all banks are returned.
+#   - Performs a search for CCNA-related questions using ChromaDB (or another search mechanism).
+#   - Returns up to 5 relevant questions with their shuffled options and an
+#     exam session token; the answers are kept server-side (see build_exam).
+#   - With "exclude_session" (the token of the previous exam on the topic)
+#     the questions handed out in that session chain are skipped, so "next
+#     questions" returns a new set. Once the topic runs out of relevant
+#     questions, or after MAX_SEEN of them, it starts over.
+# --------------------------------------------------------------------
+SEARCH_TOP_K = 5
+MAX_SEEN = 45
+
+
+# The questions already handed out in an earlier exam session chain
+def seen_questions(token):
+    session = sessions.get(token) if isinstance(token, str) else None
+    seen = [tuple(key) for key in (session or {}).get("seen", [])]
+    return seen if len(seen) <= MAX_SEEN else []
+
+
+@app.route('/search', methods=['POST'])
+def search_endpoint():
+    data = request.json
+    query = data.get("query", "")
+    bank = data.get("bank")
+
+    # If no query is provided, return a 400 Bad Request response
+    if not query:
+        return jsonify({"error": "Query is required"}), 400
+    if bank is not None and bank not in BANKS:
+        return jsonify({"error": UNKNOWN_BANK_ERROR}), 400
+
+    with span("session"):
+        seen = seen_questions(data.get("exclude_session"))
+
+    # Fetch results (id + bank + question text) from the search_questions function: top 5, plus
+    # as many as were already handed out
+    hits = search_questions(query, top_k=SEARCH_TOP_K + len(seen), bank=bank)
+
+    # If no results are found (e.g. no word of the query occurs in the bank), respond with an error message
+    if not hits:
+        return jsonify({"error": NO_RESULTS_ERROR}), 400
+
+    # If the best vector/BM25 scores are below the calibrated thresholds, the topic is not CCNA-related
+    if not is_relevant(hits):
+        return jsonify({"error": OFF_TOPIC_ERROR}), 400
+
+    hits = exclude_hits(hits, seen, SEARCH_TOP_K)
+    if not hits:
+        # Every relevant question was handed out already: start over
+        hits, seen = search_questions(query, top_k=SEARCH_TOP_K, bank=bank), []
+
+    try:
+        # Fetch the answers of every retrieved question in a single round trip
+        with span("db"):
+            answers = fetch_answers([(hit["bank"], hit["id"]) for hit in hits])
+    except Exception as e:
+        # Return a 500 Internal Server Error if there's any issue retrieving answers
+        return jsonify({"error": f"Error retrieving answers: {e}"}), 500
+
+    # Return the query, the session token and the question data as JSON
+    exam = build_exam(query, hits, answers, seen)
+    with span("serialize"):
+        return jsonify(exam)
+
+# --------------------------------------------------------------------
+# BATCH SEARCH Endpoint (/search/batch):
+#   - Expects a JSON payload with a "queries" list and optional "top_k" and
+#     "bank" (as for /search).
+#   - Encodes every topic in one forward pass, runs one multi-query vector
+#     search and fetches all answers in one database round trip.
+#   - Returns one entry per topic: either its "session" and "results" or
+#     its "error"; every topic is a separate exam session.
+# --------------------------------------------------------------------
+MAX_BATCH_QUERIES = 50
+MAX_TOP_K = 50
+
+@app.route('/search/batch', methods=['POST'])
+def search_batch_endpoint():
+    data = request.json or {}
+    queries = data.get("queries")
+    top_k = data.get("top_k", 5)
+    bank = data.get("bank")
+
+    if not isinstance(queries, list) or not queries:
+        return jsonify({"error": "A non-empty list of queries is required"}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({"error": f"At most {MAX_BATCH_QUERIES} queries per batch"}), 400
+    if not isinstance(top_k, int) or not 1 <= top_k <= MAX_TOP_K:
+        return jsonify({"error": f"top_k must be an integer between 1 and {MAX_TOP_K}"}), 400
+    if bank is not None and bank not in BANKS:
+        return jsonify({"error": UNKNOWN_BANK_ERROR}), 400
+
+    # Only non-empty string topics are searched; the others get a per-topic error
+    valid = [isinstance(query, str) and query.strip() != "" for query in queries]
+    searched = [query for query, ok in zip(queries, valid) if ok]
+    hit_lists = iter(search_questions_batch(searched, top_k=top_k, bank=bank) if searched else [])
+
+    entries = []
+    for query, ok in zip(queries, valid):
+        if not ok:
+            entries.append({"query": query, "error": "Query is required"})
+            continue
+        hits = next(hit_lists)
+        if not hits:
+            entries.append({"query": query, "error": NO_RESULTS_ERROR})
+        elif not is_relevant(hits):
+            entries.append({"query": query, "error": OFF_TOPIC_ERROR})
+        else:
+            entries.append({"query": query, "hits": hits})
+
+    try:
+        # One round trip for the answers of every topic
+        with span("db"):
+            answers = fetch_answers({(hit["bank"], hit["id"]) for entry in entries for hit in entry.get("hits", [])})
+    except Exception as e:
+        return jsonify({"error": f"Error retrieving answers: {e}"}), 500
+
+    for i, entry in enumerate(entries):
+        if "hits" in entry:
+            entries[i] = build_exam(entry["query"], entry["hits"], answers)
+
+    return jsonify({"results": entries})
+
+# --------------------------------------------------------------------
+# Practice exams from the precomputed topic clusters (see topics.py):
+#   - Each question bank has its own clusters: every endpoint takes a "bank"
+#     (a query parameter for GET /topics), by default the first of CCNA_BANKS.
+#   - GET /topics lists the clusters: {"topics": [{"id", "label", "size"}]}.
+#   - POST /exam with {"size": N, "topics": [ids]} (both optional) samples N
+#     distinct questions, spread evenly over the topics, and returns them as
+#     one exam session like /search does. No vector query is made.
+#   - POST /topics/<id>/questions with {"page", "page_size"} returns one page
+#     of a topic's full question list as an exam session, plus "page",
+#     "page_size", "total" and "pages".
+# --------------------------------------------------------------------
+EXAM_DEFAULT_SIZE = 100
+EXAM_MAX_SIZE = int(os.getenv("CCNA_EXAM_MAX_SIZE", "200"))
+TOPIC_PAGE_SIZE = 20
+TOPIC_MAX_PAGE_SIZE = 100
+NO_TOPICS_ERROR = "No topic clusters yet. Run preprocess.py to build them."
+
+
+def is_positive_int(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 1
+
+
+def is_topic_id(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+@app.route('/topics', methods=['GET'])
+def topics_endpoint():
+    bank = request.args.get("bank", BANKS[0])
+    if bank not in BANKS:
+        return jsonify({"error": UNKNOWN_BANK_ERROR}), 400
+
+    try:
+        return jsonify({"topics": topic_indexes[bank].topics(check_index_version(bank))})
+    except Exception as e:
+        return jsonify({"error": f"Error loading topics: {e}"}), 500
+
+
+@app.route('/exam', methods=['POST'])
+def exam_endpoint():
+    data = request.json or {}
+    size = data.get("size", EXAM_DEFAULT_SIZE)
+    topics = data.get("topics")
+    bank = data.get("bank", BANKS[0])
+
+    if bank not in BANKS:
+        return jsonify({"error": UNKNOWN_BANK_ERROR}), 400
+    if not is_positive_int(size) or size > EXAM_MAX_SIZE:
+        return jsonify({"error": f"size must be an integer between 1 and {EXAM_MAX_SIZE}"}), 400
+    if topics is not None and (not isinstance(topics, list) or not all(is_topic_id(t) for t in topics)):
+        return jsonify({"error": "topics must be a list of topic ids"}), 400
+
+    try:
+        with span("topics"):
+            picked = topic_indexes[bank].sample(size, set(topics) if topics is not None else None,
+                                                check_index_version(bank))
+        if not picked:
+            return jsonify({"error": NO_TOPICS_ERROR}), 400
+        with span("db"):
+            hits, answers = fetch_questions(bank, [qid for _, qid in picked])
+    except Exception as e:
+        return jsonify({"error": f"Error retrieving questions: {e}"}), 500
+
+    exam = build_exam("Practice exam", hits, answers)
+    counts = {}
+    for cluster, _ in picked:
+        counts[cluster] = counts.get(cluster, 0) + 1
+    exam["bank"] = bank
+    exam["topics"] = [{"id": cluster, "questions": count} for cluster, count in sorted(counts.items())]
+    with span("serialize"):
+        return jsonify(exam)
+
+
+@app.route('/topics/<int:topic_id>/questions', methods=['POST'])
+def topic_questions_endpoint(topic_id):
+    data = request.json or {}
+    page = data.get("page", 1)
+    page_size = data.get("page_size", TOPIC_PAGE_SIZE)
+    bank = data.get("bank", BANKS[0])
+
+    if bank not in BANKS:
+        return jsonify({"error": UNKNOWN_BANK_ERROR}), 400
+    if not is_positive_int(page):
+        return jsonify({"error": "page must be a positive integer"}), 400
+    if not is_positive_int(page_size) or page_size > TOPIC_MAX_PAGE_SIZE:
+        return jsonify({"error": f"page_size must be an integer between 1 and {TOPIC_MAX_PAGE_SIZE}"}), 400
+
+    try:
+        result = topic_indexes[bank].page(topic_id, page, page_size, check_index_version(bank))
+        if result is None:
+            return jsonify({"error": "Unknown topic."}), 404
+        with span("db"):
+            hits, answers = fetch_questions(bank, result["ids"])
+    except Exception as e:
+        return jsonify({"error": f"Error retrieving questions: {e}"}), 500
+
+    exam = build_exam(result["label"], hits, answers) if hits else {"query": result["label"], "results": []}
+    exam.update({
+        "bank": bank,
+        "page": page,
+        "page_size": page_size,
+        "total": result["total"],
+        "pages": -(-result["total"] // page_size),
+    })
+    return jsonify(exam)
+
+# --------------------------------------------------------------------
+# VALIDATE Endpoint (/validate):
+#   - Expects JSON payload with "session" (the token returned by /search)
+#     and "answers": the index of the chosen option for every question
+#   - Looks up the questions and correct answers of the session and
+#     compares them to the chosen options
+#   - Uses generate_response to produce feedback
+#   - Grading is local and deterministic: "score" is part of every response,
+#     and with "grade_only": true it is returned at once without feedback
+#   - With "stream": true the feedback is sent as Server-Sent Events while
+#     it is generated (see sse_feedback), starting with the score; otherwise
+#     as one JSON response
+# --------------------------------------------------------------------
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def sse_feedback(input_data):
+    try:
+        for event, payload in generate_response_stream(input_data):
+            yield sse_event(event, payload)
+    except Exception as e:
+        print(f"Error in /validate stream: {e}")
+        yield sse_event("error", {"error": "Internal server error"})
+
+
+@app.route('/validate', methods=['POST'])
+def validate_endpoint():
+    try:
+        # Parse the JSON data from the request
+        data = request.json
+        # Ensure all required fields are present
+        if not data or not isinstance(data.get("session"), str) or not isinstance(data.get("answers"), list):
+            return jsonify({"error": "Invalid input data. Ensure session and answers are provided."}), 400
+
+        with span("session"):
+            session = sessions.get(data["session"])
+        if session is None:
+            return jsonify({"error": "Unknown or expired exam session. Please fetch the questions again."}), 404
+
+        # Check that there is one valid option index per question of the session
+        questions = session["questions"]
+        choices = data["answers"]
+        if len(choices) != len(questions):
+            return jsonify({"error": "Mismatch in the number of questions and answers."}), 400
+        if not all(isinstance(choice, int) and not isinstance(choice, bool) and 0 <= choice < len(question["options"])
+                   for choice, question in zip(choices, questions)):
+            return jsonify({"error": "Every answer must be the index of one of the question's options."}), 400
+
+        input_data = {
+            "query": session["query"],
+            "questions": [question["question"] for question in questions],
+            "correct_answers": [question["options"][question["correct"]] for question in questions],
+            "user_answers": [question["options"][choice] for choice, question in zip(choices, questions)]
+        }
+
+        # Graded locally, so the score does not depend on the model call succeeding
+        score = grade(list(zip(
+            input_data["questions"], input_data["correct_answers"], input_data["user_answers"]
+        )))
+        if data.get("grade_only"):
+            return jsonify({"score": score})
+
+        # Stream tokens to the client as they are generated; X-Accel-Buffering
+        # keeps reverse proxies (nginx) from buffering the event stream
+        if data.get("stream"):
+            return Response(
+                stream_with_context(sse_feedback(input_data)),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        # Generate feedback (e.g., explanations, correctness checks) from a custom AI or logic
+        feedback = generate_response(input_data)
+
+        # Return the generated feedback to the client
+        return jsonify({"feedback": feedback, "score": score})
+
+    except Exception as e:
+        # Log the error and return a 500 Internal Server Error
+        print(f"Error in /validate endpoint: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+# --------------------------------------------------------------------
+# Main Server Entry Point:
+#   - Runs the Flask development server in debug mode.
+#   - In production use the preforked multi-worker setup instead:
+#       gunicorn -c gunicorn.conf.py app:app
+# --------------------------------------------------------------------
+if __name__ == '__main__':
+    # Sampling profiler, only when CCNA_PROFILE=1 (gunicorn starts it in each worker)
+    metrics.start_profiler()
+    app.run(debug=True)
@@ -0,0 +1,262 @@
+import argparse                # Command-line options of the build step
+import json                    # Artifact header and packed answers
+import mmap                    # Shared, zero-copy read-only mapping
+import os                      # Artifact directory and atomic renames
+import struct                  # Fixed-size file preamble
+import time                    # Version names
+import numpy as np             # Views over the mapped sections
+from banks import DEFAULT_BANK, check_bank, collection_name, table_name  # Per-bank sources and directories
+
+# -------------------------------------------------------------------------
+# Question-bank artifact:
+#   - One binary file, bank-<version>.bin, built offline from the Chroma
+#     collection (embeddings, question texts) and PostgreSQL (answers):
+#       preamble    : MAGIC, format version (uint32), header length (uint32)
+#       header      : JSON with the embedding backend id, the row count and
+#                     the offset/dtype/shape of every section
+#       sections    : 64-byte aligned arrays
+#         embeddings       float16 (n, dim), L2-normalized
+#         ids              int64, sorted (rows are looked up by binary search)
+#         question_offsets int64 (n + 1) / question_bytes uint8
+#         answer_offsets   int64 (n + 1) / answer_bytes uint8, where each entry
+#                          is the JSON [correct_answer, [incorrect answers]]
+#   - Processes open it with mmap: nothing is parsed or copied at startup, and
+#     every worker shares the same page-cache pages.
+#   - CURRENT in CCNA_ARTIFACT_DIR names the live file. A build writes the new
+#     file, then replaces CURRENT atomically; running processes switch to it on
+#     their next index version check (search.py), without a restart.
+#   - The artifact answers /search on its own: no Chroma, no PostgreSQL.
+#   - Each question bank has its own directory: CCNA_ARTIFACT_DIR for the
+#     default bank (unchanged), CCNA_ARTIFACT_DIR/<bank> for the others.
+# -------------------------------------------------------------------------
+ARTIFACT_DIR = os.getenv("CCNA_ARTIFACT_DIR", "./bank_artifact")
+ARTIFACT_KEEP = int(os.getenv("CCNA_ARTIFACT_KEEP", "3"))
+CURRENT_NAME = "CURRENT"
+MAGIC = b"CCNABANK"
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct("<8sII")
+ALIGNMENT = 64
+
+
+def artifact_dir(bank=DEFAULT_BANK):
+    if check_bank(bank) == DEFAULT_BANK:
+        return ARTIFACT_DIR
+    return os.path.join(ARTIFACT_DIR, bank)
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _pack_strings(strings):
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+# Read-only sequence over offset-packed utf-8 strings
+class PackedStrings:
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return self.data[start:end].tobytes().decode("utf-8")
+
+
+# -------------------------------------------------------------------------
+# write_artifact: writes the sections to `path` (through a temporary file, so
+# a reader never sees a partial artifact).
+# -------------------------------------------------------------------------
+def write_artifact(path, ids, embeddings, questions, answers, metadata):
+    ids = np.asarray(ids, dtype=np.int64)
+    order = np.argsort(ids, kind="stable")
+    matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)[order]
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+    question_offsets, question_bytes = _pack_strings([questions[i] for i in order])
+    answer_offsets, answer_bytes = _pack_strings([json.dumps(answers[i]) for i in order])
+    sections = {
+        "embeddings": matrix.astype(np.float16),
+        "ids": ids[order],
+        "question_offsets": question_offsets,
+        "question_bytes": question_bytes,
+        "answer_offsets": answer_offsets,
+        "answer_bytes": answer_bytes,
+    }
+
+    # Section offsets are relative to the (aligned) end of the header
+    layout, offset = {}, 0
+    for name, array in sections.items():
+        layout[name] = {"offset": offset, "dtype": array.dtype.str, "shape": list(array.shape)}
+        offset = _align(offset + array.nbytes)
+    header = json.dumps({**metadata, "rows": len(ids), "sections": layout}).encode("utf-8")
+    data_start = _align(PREAMBLE.size + len(header))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for name, array in sections.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.truncate(data_start + offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# -------------------------------------------------------------------------
+# BankArtifact: read-only, memory-mapped view of one artifact file.
+# -------------------------------------------------------------------------
+class BankArtifact:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, format_version, header_length = PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} question-bank artifact")
+        self.metadata = json.loads(self._mmap[PREAMBLE.size:PREAMBLE.size + header_length])
+        data_start = _align(PREAMBLE.size + header_length)
+
+        arrays = {}
+        for name, section in self.metadata["sections"].items():
+            dtype = np.dtype(section["dtype"])
+            count = int(np.prod(section["shape"], dtype=np.int64))
+            arrays[name] = np.frombuffer(
+                self._mmap, dtype=dtype, count=count, offset=data_start + section["offset"]
+            ).reshape(section["shape"])
+
+        self.embeddings = arrays["embeddings"]
+        self.ids = arrays["ids"]
+        self.questions = PackedStrings(arrays["question_offsets"], arrays["question_bytes"])
+        self._answers = PackedStrings(arrays["answer_offsets"], arrays["answer_bytes"])
+
+    @property
+    def version(self):
+        return self.metadata.get("version")
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Row of a question id, or None
+    def position(self, question_id):
+        i = int(np.searchsorted(self.ids, question_id))
+        if i < len(self.ids) and self.ids[i] == question_id:
+            return i
+        return None
+
+    # {id: (correct_answer, incorrect_answers)} for the ids present in the artifact
+    def answers(self, question_ids):
+        found = {}
+        for question_id in question_ids:
+            i = self.position(question_id)
+            if i is not None:
+                correct_answer, incorrect_answers = json.loads(self._answers[i])
+                found[question_id] = (correct_answer, incorrect_answers)
+        return found
+
+
+# -------------------------------------------------------------------------
+# Version pointer helpers
+# -------------------------------------------------------------------------
+def current_name(directory=ARTIFACT_DIR):
+    try:
+        with open(os.path.join(directory, CURRENT_NAME), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def open_current(directory=ARTIFACT_DIR):
+    name = current_name(directory)
+    if name is None:
+        raise FileNotFoundError(f"No question-bank artifact in {directory}; build one with artifact.py")
+    return BankArtifact(os.path.join(directory, name))
+
+
+def publish(directory, name):
+    tmp_path = os.path.join(directory, CURRENT_NAME + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(tmp_path, os.path.join(directory, CURRENT_NAME))
+
+
+# Deletes all but the newest `keep` artifacts; processes still mapping an
+# older file keep reading it until they switch (the pages live on until unmapped)
+def prune_versions(directory, keep=ARTIFACT_KEEP):
+    live = current_name(directory)
+    names = sorted(name for name in os.listdir(directory) if name.startswith("bank-") and name.endswith(".bin"))
+    for name in names[:-keep] if keep > 0 else names:
+        if name != live:
+            os.remove(os.path.join(directory, name))
+
+
+# -------------------------------------------------------------------------
+# build_artifact (offline):
+#   - Reads every embedding and question text from the Chroma collection and
+#     all answers from PostgreSQL, writes a new version and publishes it.
+#   - Questions without a row in PostgreSQL, and those marked as
+#     near-duplicates by dedupe.py, are left out.
+# -------------------------------------------------------------------------
+def build_artifact(directory=ARTIFACT_DIR, chroma_path="./chroma_db", page_size=5000, bank=DEFAULT_BANK):
+    import chromadb
+    import db
+    from embeddings import backend_id
+
+    client = chromadb.PersistentClient(path=chroma_path)
+    collection = client.get_or_create_collection(name=collection_name(bank))
+    embedding_backend = (collection.metadata or {}).get("embedding_backend") or backend_id()
+
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute(f"SELECT id, correct_answer, incorrect_answers FROM {table_name(bank)}")
+        answers_by_id = {
+            qid: [correct_answer, incorrect_answers if isinstance(incorrect_answers, list) else []]
+            for qid, correct_answer, incorrect_answers in cur.fetchall()
+        }
+
+    ids, questions, answers, embeddings = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        if not len(page["ids"]):
+            break
+        keep = [i for i, (doc_id, metadata) in enumerate(zip(page["ids"], page["metadatas"]))
+                if int(doc_id) in answers_by_id and (metadata or {}).get("duplicate_of", -1) < 0]
+        ids.extend(int(page["ids"][i]) for i in keep)
+        questions.extend(page["documents"][i] for i in keep)
+        answers.extend(answers_by_id[int(page["ids"][i])] for i in keep)
+        embeddings.append(np.asarray(page["embeddings"], dtype=np.float32)[keep])
+        offset += len(page["ids"])
+
+    if not ids:
+        raise RuntimeError("The collection has no indexed questions; run preprocess.py first")
+
+    version = str(time.time_ns())
+    name = f"bank-{version}.bin"
+    os.makedirs(directory, exist_ok=True)
+    write_artifact(os.path.join(directory, name), ids, np.vstack(embeddings), questions, answers,
+                   {"version": version, "embedding_backend": embedding_backend})
+    publish(directory, name)
+    prune_versions(directory)
+    return name, len(ids)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and publish a memory-mapped question-bank artifact.")
+    parser.add_argument("--bank", default=DEFAULT_BANK, help="Question bank to build the artifact of.")
+    parser.add_argument("--dir", default=None,
+                        help="Artifact directory (default: CCNA_ARTIFACT_DIR, or CCNA_ARTIFACT_DIR/<bank> for other banks).")
+    parser.add_argument("--chroma-path", default="./chroma_db")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    name, rows = build_artifact(args.dir or artifact_dir(args.bank), args.chroma_path, bank=args.bank)
+    print(f"Published {name} for bank {args.bank!r} with {rows} questions in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,48 @@
+import os                      # Bank list from the environment
+import re                      # Bank name validation
+
+# ----------------------------------------------------------------------------------------
+# Question banks:
+#   - Each certification bank is a separate shard: its own Chroma collection
+#     ("<bank>_embeddings"), PostgreSQL table ("questions_<bank>") and index files
+#     next to the Chroma data. The default "ccna" bank keeps the original names
+#     (ccna_embeddings, questions, bm25_index.npz, ...), so existing data stays valid.
+#   - CCNA_BANKS lists the banks served by this process (comma separated, default
+#     "ccna"); populate_db.py and preprocess.py take --bank.
+#   - Bank names end up in table and file names, hence the strict pattern.
+#     Dataset/populate_db.py imports this module, so the loader and the server
+#     always agree on table names.
+# ----------------------------------------------------------------------------------------
+DEFAULT_BANK = "ccna"
+_bank_pattern = re.compile(r"[a-z][a-z0-9_]{0,31}")
+
+
+def check_bank(bank):
+    if not isinstance(bank, str) or not _bank_pattern.fullmatch(bank):
+        raise ValueError(f"Invalid bank name {bank!r}: use lowercase letters, digits and underscores")
+    return bank
+
+
+BANKS = tuple(dict.fromkeys(
+    check_bank(bank.strip()) for bank in os.getenv("CCNA_BANKS", DEFAULT_BANK).split(",") if bank.strip()
+))
+
+
+def collection_name(bank=DEFAULT_BANK):
+    return f"{check_bank(bank)}_embeddings"
+
+
+def table_name(bank=DEFAULT_BANK):
+    return "questions" if check_bank(bank) == DEFAULT_BANK else f"questions_{bank}"
+
+
+def topics_table_name(bank=DEFAULT_BANK):
+    return "topic_clusters" if check_bank(bank) == DEFAULT_BANK else f"topic_clusters_{bank}"
+
+
+# Per-bank file name: "bm25_index.npz" -> "bm25_index_<bank>.npz", unchanged for ccna
+def bank_file(bank, name):
+    if check_bank(bank) == DEFAULT_BANK:
+        return name
+    stem, extension = os.path.splitext(name)
+    return f"{stem}_{bank}{extension}"
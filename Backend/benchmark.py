@@ -0,0 +1,385 @@
+import argparse                                   # Command-line options
+import json                                       # Results file and request bodies
+import os                                         # Paths and subprocess environments
+import random                                     # Random answers for /validate
+import re                                         # Parsing the output of the indexing job
+import shutil                                     # Locating Postgres binaries, cleanup
+import socket                                     # Free local ports
+import subprocess                                 # Postgres, the indexing jobs and the app
+import sys
+import tempfile                                   # Throwaway working directory
+import threading                                  # Stub LLM server thread
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np                                # Percentiles
+import requests                                   # HTTP load generation
+from compare_backends import TOPIC_QUERIES        # Typical student queries
+from llm_stub import make_server                  # Offline Azure OpenAI stand-in
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET_DIR = os.path.join(BACKEND_DIR, "..", "Dataset")
+DEFAULT_DATASET = os.path.join(DATASET_DIR, "CCNA.json")
+
+# ----------------------------------------------------------------------------
+# Offline benchmark suite:
+#   - Sets up a throwaway environment in a temporary directory:
+#       * PostgreSQL: a temporary cluster (initdb/pg_ctl on PATH), or a
+#         temporary database on the server given by --db-host/CCNA_DB_*
+#       * the question bank loaded with Dataset/populate_db.py
+#       * a fresh Chroma directory built by preprocess.py (indexing throughput)
+#       * the stub Azure OpenAI server of llm_stub.py with --llm-latency
+#       * the app itself (gunicorn with gunicorn.conf.py, or the Flask server)
+#   - Reports recall@k of the retrieval backends (compare_backends.py).
+#   - Drives concurrent load against /search, /validate and streamed
+#     /validate and reports throughput and p50/p95/p99 latency per endpoint.
+#   - Writes everything to one JSON file; --baseline compares the run with
+#     an earlier file and fails on regressions beyond --max-regression.
+#   - Needs no network access once the embedding model is in the local
+#     Hugging Face cache.
+# ----------------------------------------------------------------------------
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentiles_ms(samples):
+    if not samples:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None}
+    values = np.asarray(samples) * 1000.0
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+    }
+
+
+def run(command, env, cwd, timeout=None):
+    result = subprocess.run(command, env=env, cwd=cwd, capture_output=True, text=True, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed:\n{result.stdout}\n{result.stderr}")
+    return result.stdout
+
+
+# ----------------------------------------------------------------------------
+# Database: a temporary cluster listening on a Unix socket in the work
+# directory, or a temporary database on an existing server.
+# ----------------------------------------------------------------------------
+class TemporaryDatabase:
+    def __init__(self, workdir, host=None, port=None, user=None, password=None):
+        self.workdir = workdir
+        self.cluster = None
+        self.name = f"ccna_bench_{os.getpid()}"
+        self.params = {"host": host, "port": port, "user": user, "password": password}
+
+    def start(self):
+        import psycopg2
+
+        if not self.params["host"]:
+            initdb, pg_ctl = shutil.which("initdb"), shutil.which("pg_ctl")
+            if not initdb or not pg_ctl:
+                raise RuntimeError("initdb/pg_ctl not found: install PostgreSQL or pass --db-host")
+            self.cluster = os.path.join(self.workdir, "pgdata")
+            port = free_port()
+            run([initdb, "-D", self.cluster, "-A", "trust", "-U", "postgres"], os.environ, self.workdir)
+            run([pg_ctl, "-D", self.cluster, "-w", "-l", os.path.join(self.workdir, "postgres.log"),
+                 "-o", f"-p {port} -k {self.workdir} -c listen_addresses=''", "start"],
+                os.environ, self.workdir)
+            self.params = {"host": self.workdir, "port": port, "user": "postgres", "password": ""}
+
+        conn = psycopg2.connect(dbname="postgres", **self.params)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"DROP DATABASE IF EXISTS {self.name}")
+            cur.execute(f"CREATE DATABASE {self.name}")
+        conn.close()
+
+    def env(self):
+        return {
+            "CCNA_DB_NAME": self.name,
+            "CCNA_DB_HOST": str(self.params["host"]),
+            "CCNA_DB_PORT": str(self.params["port"]),
+            "CCNA_DB_USER": self.params["user"] or "",
+            "CCNA_DB_PASSWORD": self.params["password"] or "",
+        }
+
+    def stop(self):
+        import psycopg2
+
+        try:
+            conn = psycopg2.connect(dbname="postgres", **self.params)
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"DROP DATABASE IF EXISTS {self.name}")
+            conn.close()
+        except Exception as e:
+            print(f"Could not drop {self.name}: {e}")
+        if self.cluster:
+            subprocess.run([shutil.which("pg_ctl"), "-D", self.cluster, "-m", "fast", "stop"],
+                           capture_output=True)
+
+
+# ----------------------------------------------------------------------------
+# The app under test, started in the work directory (so ./chroma_db and the
+# feedback cache are the temporary ones) and polled until it answers.
+# ----------------------------------------------------------------------------
+def start_app(server, port, env, workdir, workers):
+    if server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "-c", os.path.join(BACKEND_DIR, "gunicorn.conf.py"), "app:app"]
+        env = dict(env, CCNA_BIND=f"127.0.0.1:{port}", CCNA_WORKERS=str(workers))
+    else:
+        command = [sys.executable, "-c",
+                   f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    log = open(os.path.join(workdir, "app.log"), "w")
+    process = subprocess.Popen(command, env=env, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The app exited with status {process.returncode}, see {log.name} (run with --keep)")
+        try:
+            requests.post(f"http://127.0.0.1:{port}/search", json={"query": "OSPF"}, timeout=5)
+            return process
+        except requests.RequestException:
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("The app did not start within 300s")
+
+
+# ----------------------------------------------------------------------------
+# Load generation: `requests` calls of `call(session, i)` over `concurrency`
+# threads (one keep-alive session per thread).
+# ----------------------------------------------------------------------------
+def drive(call, requests_total, concurrency):
+    local = threading.local()
+
+    def timed(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            extra = call(session, i)
+            return time.perf_counter() - started, None, extra
+        except Exception as e:
+            return time.perf_counter() - started, f"{type(e).__name__}: {e}", None
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, range(requests_total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for latency, error, _ in results if error is None]
+    errors = [error for _, error, _ in results if error is not None]
+    report = {
+        "requests": requests_total,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        **percentiles_ms(latencies),
+    }
+    if errors:
+        report["first_error"] = errors[0]
+    extras = [extra for _, error, extra in results if error is None and isinstance(extra, float)]
+    if extras:
+        report["time_to_first_token"] = percentiles_ms(extras)
+    return report
+
+
+def load_test(base_url, requests_total, concurrency, seed):
+    rng = random.Random(seed)
+    queries = [rng.choice(TOPIC_QUERIES) for _ in range(requests_total)]
+
+    def search(session, i):
+        response = session.post(f"{base_url}/search", json={"query": queries[i]}, timeout=60)
+        response.raise_for_status()
+
+    # Exam sessions are created up front, so /validate is measured on its own
+    exams = []
+    with requests.Session() as session:
+        for i in range(requests_total):
+            response = session.post(f"{base_url}/search", json={"query": queries[i]}, timeout=60)
+            response.raise_for_status()
+            exam = response.json()
+            answers = [rng.randrange(len(question["options"])) for question in exam["results"]]
+            exams.append({"session": exam["session"], "answers": answers})
+
+    def validate(session, i):
+        response = session.post(f"{base_url}/validate", json=exams[i], timeout=300)
+        response.raise_for_status()
+
+    def validate_stream(session, i):
+        started = time.perf_counter()
+        first_token = None
+        with session.post(f"{base_url}/validate", json=dict(exams[i], stream=True),
+                          stream=True, timeout=300) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if first_token is None and line == "event: token":
+                    first_token = time.perf_counter() - started
+                elif line == "event: error":
+                    raise RuntimeError("error event in the feedback stream")
+        return first_token
+
+    return {
+        "search": drive(search, requests_total, concurrency),
+        "validate": drive(validate, requests_total, concurrency),
+        "validate_stream": drive(validate_stream, requests_total, concurrency),
+    }
+
+
+# ----------------------------------------------------------------------------
+# compare_to_baseline: relative change of throughput and p95 per endpoint;
+# returns the list of regressions larger than max_regression.
+# ----------------------------------------------------------------------------
+def compare_to_baseline(report, baseline, max_regression):
+    regressions = []
+    for endpoint, current in report["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        if not previous:
+            continue
+        for metric, higher_is_better in (("throughput_rps", True), ("p95_ms", False)):
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            print(f"{endpoint:>16} {metric:>15}: {old:10.2f} -> {new:10.2f} ({change:+.1%})")
+            if worse > max_regression:
+                regressions.append(f"{endpoint} {metric} {change:+.1%}")
+    return regressions
+
+
+def benchmark(args):
+    workdir = tempfile.mkdtemp(prefix="ccna_bench_")
+    database = TemporaryDatabase(workdir, args.db_host, args.db_port, args.db_user, args.db_password)
+    llm_server = app = None
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("db_password", "baseline")},
+    }
+    try:
+        database.start()
+
+        llm_port = free_port()
+        llm_server = make_server("127.0.0.1", llm_port, args.llm_latency, args.llm_token_delay)
+        threading.Thread(target=llm_server.serve_forever, daemon=True).start()
+
+        env = dict(
+            os.environ,
+            **database.env(),
+            PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])),
+            AZURE_OPENAI_ENDPOINT=f"http://127.0.0.1:{llm_port}",
+            AZURE_OPENAI_API_KEY="benchmark",
+            OPENAI_API_VERSION="2024-02-01",
+            CCNA_FEEDBACK_CACHE=args.feedback_cache,
+            CCNA_LLM_RPM=str(args.llm_rpm),
+            CCNA_LLM_TPM=str(args.llm_tpm),
+        )
+        env.pop("CCNA_LLM_STUB", None)
+
+        # 1. Load the question bank
+        started = time.perf_counter()
+        run([sys.executable, os.path.join(DATASET_DIR, "populate_db.py"), os.path.abspath(args.dataset)],
+            env, workdir)
+        report["populate_seconds"] = time.perf_counter() - started
+
+        # 2. Build the index from scratch; the job prints its own scan time,
+        #    which excludes loading the model
+        started = time.perf_counter()
+        output = run([sys.executable, os.path.join(BACKEND_DIR, "preprocess.py"),
+                      "--batch-size", str(args.batch_size)], env, workdir)
+        total = time.perf_counter() - started
+        match = re.search(r"Scanned (\d+) questions, embedded (\d+).* in ([\d.]+)s", output)
+        if not match:
+            raise RuntimeError(f"Unexpected preprocess.py output:\n{output}")
+        scanned, embedded, seconds = int(match.group(1)), int(match.group(2)), float(match.group(3))
+        report["indexing"] = {
+            "questions": scanned,
+            "embedded": embedded,
+            "seconds": seconds,
+            "seconds_with_startup": total,
+            "questions_per_second": embedded / seconds if seconds else None,
+        }
+        print(f"Indexed {embedded} questions in {seconds:.1f}s")
+
+        # 3. Retrieval quality of the backends
+        recall_path = os.path.join(workdir, "recall.json")
+        run([sys.executable, os.path.join(BACKEND_DIR, "compare_backends.py"), "--top-k", str(args.top_k),
+             "--samples", str(args.recall_samples), "--json", recall_path], env, workdir)
+        with open(recall_path, encoding="utf-8") as f:
+            report["retrieval"] = json.load(f)
+        print(f"Chroma recall@{args.top_k}: {report['retrieval']['chroma_recall_at_k']:.4f}")
+
+        # 4. Load test of the endpoints
+        app_port = free_port()
+        app = start_app(args.server, app_port, env, workdir, args.workers)
+        base_url = f"http://127.0.0.1:{app_port}"
+        # Warm-up requests are not measured
+        drive(lambda session, i: session.post(f"{base_url}/search", json={"query": TOPIC_QUERIES[i % len(TOPIC_QUERIES)]},
+                                              timeout=60), min(args.requests, 20), args.concurrency)
+        report["endpoints"] = load_test(base_url, args.requests, args.concurrency, args.seed)
+        for endpoint, stats in report["endpoints"].items():
+            print(f"{endpoint:>16}: {stats['throughput_rps']:8.1f} req/s  p50 {stats['p50_ms']:.1f} ms  "
+                  f"p95 {stats['p95_ms']:.1f} ms  p99 {stats['p99_ms']:.1f} ms  errors {stats['errors']}"
+                  if stats["p50_ms"] is not None else f"{endpoint:>16}: all {stats['errors']} requests failed")
+    finally:
+        if app is not None:
+            app.terminate()
+            try:
+                app.wait(30)
+            except subprocess.TimeoutExpired:
+                app.kill()
+        if llm_server is not None:
+            llm_server.shutdown()
+        database.stop()
+        if args.keep:
+            print(f"Kept the work directory {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of indexing, retrieval, /search and /validate.")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET)
+    parser.add_argument("--output", help="Results file (default: benchmark-results/<timestamp>.json).")
+    parser.add_argument("--baseline", help="Earlier results file to compare with.")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Exit with status 1 if throughput or p95 is this much worse than the baseline.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint.")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--server", choices=("gunicorn", "flask"), default="gunicorn")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes.")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Stub LLM seconds per completion.")
+    parser.add_argument("--llm-token-delay", type=float, default=0.0, help="Stub LLM seconds between streamed words.")
+    parser.add_argument("--llm-rpm", type=int, default=100000, help="Client-side RPM quota during the run.")
+    parser.add_argument("--llm-tpm", type=int, default=10000000, help="Client-side TPM quota during the run.")
+    parser.add_argument("--feedback-cache", choices=("off", "sqlite", "postgres"), default="off")
+    parser.add_argument("--batch-size", type=int, default=256, help="preprocess.py batch size.")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--recall-samples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db-host", default=os.getenv("CCNA_BENCH_DB_HOST"),
+                        help="Use this PostgreSQL server instead of a temporary cluster.")
+    parser.add_argument("--db-port", type=int, default=int(os.getenv("CCNA_BENCH_DB_PORT", "5432")))
+    parser.add_argument("--db-user", default=os.getenv("CCNA_BENCH_DB_USER", "postgres"))
+    parser.add_argument("--db-password", default=os.getenv("CCNA_BENCH_DB_PASSWORD", ""))
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary work directory.")
+    args = parser.parse_args()
+
+    report = benchmark(args)
+
+    output = args.output or os.path.join("benchmark-results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_to_baseline(report, json.load(f), args.max_regression)
+        if regressions:
+            print("Regressions: " + ", ".join(regressions))
+            raise SystemExit(1)
@@ -0,0 +1,144 @@
+import threading                      # Locks and per-key events for request coalescing
+import time                           # TTL bookkeeping
+from collections import OrderedDict   # LRU ordering
+from metrics import record_cache      # Prometheus hit/miss counters
+
+# -------------------------------------------------------------------------
+# LRUCache:
+#   - Bounded, thread-safe LRU cache with an optional per-entry TTL.
+#   - get_or_compute() coalesces concurrent lookups of the same key: the first
+#     caller computes the value, every other caller waits for that result
+#     instead of computing it again.
+#   - Hit / miss / eviction / coalesced counters are exposed via stats();
+#     a named cache also counts hits and misses in ccna_cache_events_total.
+# -------------------------------------------------------------------------
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=None, name=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data = OrderedDict()      # key -> (value, expires_at)
+        self._inflight = {}             # key -> _Pending
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.coalesced = 0
+
+    def _lookup(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._data[key]
+            self.evictions += 1
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def _store(self, key, value, now, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = now + ttl if ttl else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            found, value = self._lookup(key, time.monotonic())
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if self.name:
+            record_cache(self.name, found)
+        return value if found else default
+
+    # ttl overrides the cache-wide TTL for this entry (e.g. what is left of it)
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, time.monotonic(), ttl)
+
+    # ---------------------------------------------------------------------
+    # get_or_compute: return the cached value, or compute it exactly once
+    # even when many threads ask for the same missing key at the same time.
+    # ---------------------------------------------------------------------
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            found, value = self._lookup(key, time.monotonic())
+            if found:
+                self.hits += 1
+            else:
+                pending = self._inflight.get(key)
+                if pending is None:
+                    pending = self._inflight[key] = _Pending()
+                    owner = True
+                    self.misses += 1
+                else:
+                    owner = False
+                    self.coalesced += 1
+
+        if self.name:
+            record_cache(self.name, found)
+        if found:
+            return value
+        if not owner:
+            return pending.wait()
+
+        try:
+            value = compute()
+        except BaseException as exc:
+            with self._lock:
+                if self._inflight.get(key) is pending:
+                    del self._inflight[key]
+            pending.fail(exc)
+            raise
+
+        with self._lock:
+            # A clear() while computing means the value may be stale: do not keep it
+            if self._inflight.get(key) is pending:
+                del self._inflight[key]
+                self._store(key, value, time.monotonic())
+        pending.resolve(value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._inflight.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "coalesced": self.coalesced,
+            }
+
+
+# A computation in progress that other threads can wait on
+class _Pending:
+    def __init__(self):
+        self._event = threading.Event()
+        self._value = None
+        self._error = None
+
+    def resolve(self, value):
+        self._value = value
+        self._event.set()
+
+    def fail(self, error):
+        self._error = error
+        self._event.set()
+
+    def wait(self):
+        self._event.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
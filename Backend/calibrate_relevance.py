@@ -0,0 +1,128 @@
+import argparse                               # Command-line options
+import numpy as np                            # Threshold sweep
+from compare_backends import TOPIC_QUERIES    # Typical (positive) student queries
+from lexical import tokenize                  # Pre-check simulation
+
+# ----------------------------------------------------------------------------
+# Held-out positive queries:
+#   - Paraphrases of CCNA topics, worded the way students ask rather than the
+#     way the bank's questions are written, so they do not inherit the bank's
+#     vocabulary (fragments of bank questions would inflate the BM25 scores
+#     and bias the thresholds). --positives adds more, one per line.
+# ----------------------------------------------------------------------------
+PARAPHRASE_QUERIES = [
+    "how routers pick the best path", "link state routing protocol", "splitting a network into smaller networks",
+    "loop prevention between switches", "sharing one public address for many hosts",
+    "automatic address assignment for clients", "filtering traffic on a router interface",
+    "128 bit addresses", "carrying several virtual lans over one link", "bundling physical links together",
+    "securing a wifi network", "reliable versus connectionless transport", "seven layer networking model",
+    "finding the mac address of an ip", "where hosts send traffic for other networks",
+    "manually configured routes", "first hop redundancy", "port security on a switch",
+    "network device remote management protocol", "quality of service for voice traffic",
+]
+
+# ----------------------------------------------------------------------------
+# Off-topic queries the relevance gate must reject.
+# ----------------------------------------------------------------------------
+NEGATIVE_QUERIES = [
+    "chocolate cake recipe", "best football team", "french revolution", "how to train a puppy",
+    "taylor swift songs", "photosynthesis", "stock market tips", "learn to play guitar",
+    "world war 2 history", "weight loss diet", "knitting patterns", "pokemon evolution",
+    "shakespeare sonnets", "tax return deadline", "yoga for beginners", "mars rover",
+    "italian grammar", "car engine oil", "wedding dress", "quantum chromodynamics",
+]
+
+
+# ----------------------------------------------------------------------------
+# best_thresholds:
+#   - search.is_relevant accepts a query when its vector score OR its BM25
+#     score reaches its threshold, so the two thresholds are chosen together:
+#     every pair of observed scores (plus "never", i.e. +inf, for each) is
+#     tried and the pair that maximizes balanced accuracy of that combined
+#     rule (mean of accept rate on positives and reject rate on negatives)
+#     is returned.
+#   - Returns (balanced accuracy, vector threshold, BM25 threshold).
+# ----------------------------------------------------------------------------
+def best_thresholds(positive_scores, negative_scores):
+    positive_scores = np.asarray(positive_scores, dtype=np.float64).reshape(-1, 2)
+    negative_scores = np.asarray(negative_scores, dtype=np.float64).reshape(-1, 2)
+    both = np.concatenate([positive_scores, negative_scores])
+    vector_candidates = np.append(np.unique(both[:, 0]), np.inf)
+    lexical_candidates = np.append(np.unique(both[:, 1]), np.inf)
+
+    best = (0.0, float("inf"), float("inf"))
+    for vector_threshold in vector_candidates:
+        # One row per query, one column per BM25 threshold
+        positive_accept = ((positive_scores[:, :1] >= vector_threshold)
+                           | (positive_scores[:, 1:] >= lexical_candidates)).mean(axis=0)
+        negative_reject = 1.0 - ((negative_scores[:, :1] >= vector_threshold)
+                                 | (negative_scores[:, 1:] >= lexical_candidates)).mean(axis=0)
+        accuracy = (positive_accept + negative_reject) / 2
+        i = int(np.argmax(accuracy))
+        if accuracy[i] > best[0]:
+            best = (float(accuracy[i]), float(vector_threshold), float(lexical_candidates[i]))
+    return best
+
+
+# Fraction of queries search.is_relevant accepts with these thresholds; queries
+# rejected by the lexical pre-check (no hits) are never accepted
+def accept_rate(scores, vector_threshold, lexical_threshold):
+    accepted = sum(1 for vector, lexical, found in scores
+                   if found and (vector >= vector_threshold or lexical >= lexical_threshold))
+    return accepted / len(scores) if scores else 0.0
+
+
+def best_scores(search, query, top_k):
+    key = search.normalize_query(query)
+    hits = search._search_many([key], top_k)[key]
+    vector = max((hit.get("score", -1.0) for hit in hits), default=-1.0)
+    lexical = max((hit.get("bm25", 0.0) for hit in hits), default=0.0)
+    return vector, lexical, bool(hits)
+
+
+# Whether the lexical pre-check (CCNA_LEXICAL_PRECHECK=1) would let the query through
+def passes_precheck(search, query):
+    tokens = tokenize(query)
+    return any(shard.bm25 is None or shard.bm25.known_terms(tokens) for shard in search.shards.values())
+
+
+def calibrate(top_k=5, extra_positives=()):
+    import search
+
+    positive_queries = TOPIC_QUERIES + PARAPHRASE_QUERIES + list(extra_positives)
+    positives = [best_scores(search, query, top_k) for query in positive_queries]
+    negatives = [best_scores(search, query, top_k) for query in NEGATIVE_QUERIES]
+
+    # Queries rejected by the pre-check never reach the score gate
+    def gated(scores):
+        return [(vector, lexical) if found else (-np.inf, -np.inf) for vector, lexical, found in scores]
+
+    accuracy, vector_threshold, lexical_threshold = best_thresholds(gated(positives), gated(negatives))
+    return {
+        "positives": len(positives),
+        "negatives": len(negatives),
+        # What turning the pre-check on would cost (positives) and save (negatives)
+        "positives_failing_precheck": sum(1 for query in positive_queries if not passes_precheck(search, query)),
+        "negatives_failing_precheck": sum(1 for query in NEGATIVE_QUERIES if not passes_precheck(search, query)),
+        "CCNA_MIN_VECTOR_SCORE": vector_threshold,
+        "CCNA_MIN_BM25_SCORE": lexical_threshold,
+        "balanced_accuracy": accuracy,
+        # Joint rates of the combined rule, pre-check included
+        "false_accept_rate": accept_rate(negatives, vector_threshold, lexical_threshold),
+        "false_reject_rate": 1.0 - accept_rate(positives, vector_threshold, lexical_threshold),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Suggest relevance thresholds for the hybrid search gate.")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--positives", help="File of additional held-out positive queries, one per line.")
+    args = parser.parse_args()
+
+    extra = []
+    if args.positives:
+        with open(args.positives, "r", encoding="utf-8") as f:
+            extra = [line.strip() for line in f if line.strip()]
+
+    for key, value in calibrate(args.top_k, extra).items():
+        print(f"{key}={value:.4f}" if isinstance(value, float) else f"{key}={value}")
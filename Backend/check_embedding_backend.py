@@ -0,0 +1,96 @@
+import argparse                               # Command-line options
+import json                                   # Dataset loading and optional report
+import os                                     # Default dataset path
+import time                                   # Encoding throughput
+import numpy as np                            # Similarity computations
+from embeddings import load_model             # Torch / ONNX embedding backends
+from retrieval import NumpyBackend            # Exact search used for the overlap check
+from compare_backends import TOPIC_QUERIES    # Typical student queries
+
+DEFAULT_DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Dataset", "CCNA.json")
+
+
+# ----------------------------------------------------------------------------
+# Quantization check:
+#   - Embeds the whole CCNA bank and a set of queries with the float32 PyTorch
+#     baseline and with the candidate backend (int8 ONNX by default,
+#     optionally stored as float16).
+#   - For every query, compares the exact top-k ids of both indexes
+#     (candidate queries against the candidate index, exactly as search.py
+#     would run) and reports the mean overlap@k.
+#   - Also reports the cosine similarity between baseline and candidate
+#     vectors of the same text, and the encoding throughput of both.
+# ----------------------------------------------------------------------------
+def encode_timed(model, texts, batch_size):
+    started = time.perf_counter()
+    embeddings = model.encode(texts, batch_size=batch_size)
+    return embeddings, len(texts) / (time.perf_counter() - started)
+
+
+def check(dataset=DEFAULT_DATASET, candidate="onnx", dtype="float32", top_k=5, num_queries=300, batch_size=64):
+    with open(dataset, "r", encoding="utf-8") as f:
+        questions = [item["question"] for item in json.load(f)]
+    ids = list(range(len(questions)))
+
+    # Topic queries plus every n-th question, used as a query about itself
+    step = max(len(questions) // max(num_queries, 1), 1)
+    queries = TOPIC_QUERIES + questions[::step][:num_queries]
+
+    baseline_model = load_model("torch")
+    candidate_model = load_model(candidate)
+
+    baseline_docs, baseline_rate = encode_timed(baseline_model, questions, batch_size)
+    candidate_docs, candidate_rate = encode_timed(candidate_model, questions, batch_size)
+    baseline_queries = baseline_model.encode(queries, batch_size=batch_size)
+    candidate_queries = candidate_model.encode(queries, batch_size=batch_size)
+
+    baseline_index = NumpyBackend(embeddings=baseline_docs, ids=ids, documents=questions, dtype="float32")
+    candidate_index = NumpyBackend(embeddings=candidate_docs, ids=ids, documents=questions, dtype=dtype)
+
+    baseline_hits = baseline_index.query(baseline_queries, top_k)
+    candidate_hits = candidate_index.query(candidate_queries, top_k)
+    overlaps = [
+        len({hit["id"] for hit in expected} & {hit["id"] for hit in actual}) / top_k
+        for expected, actual in zip(baseline_hits, candidate_hits)
+    ]
+    cosines = np.sum(baseline_docs * candidate_docs, axis=1)
+
+    return {
+        "candidate": candidate,
+        "dtype": dtype,
+        "questions": len(questions),
+        "queries": len(queries),
+        "top_k": top_k,
+        "mean_overlap_at_k": float(np.mean(overlaps)),
+        "min_overlap_at_k": float(np.min(overlaps)),
+        "mean_cosine_to_baseline": float(np.mean(cosines)),
+        "min_cosine_to_baseline": float(np.min(cosines)),
+        "baseline_texts_per_second": baseline_rate,
+        "candidate_texts_per_second": candidate_rate,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check top-k agreement of an embedding backend with float32 PyTorch.")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET)
+    parser.add_argument("--backend", default="onnx", help="Candidate embedding backend (torch or onnx).")
+    parser.add_argument("--dtype", default="float32", choices=("float32", "float16"),
+                        help="Storage dtype of the candidate index.")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=300, help="Number of bank questions used as queries.")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--min-overlap", type=float, default=0.0,
+                        help="Exit with status 1 if the mean overlap@k is below this value.")
+    parser.add_argument("--json", help="Also write the report to this file.")
+    args = parser.parse_args()
+
+    report = check(args.dataset, args.backend, args.dtype, args.top_k, args.queries, args.batch_size)
+    for key, value in report.items():
+        print(f"{key:>28}: {value:.4f}" if isinstance(value, float) else f"{key:>28}: {value}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if report["mean_overlap_at_k"] < args.min_overlap:
+        raise SystemExit(1)
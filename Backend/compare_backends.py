@@ -0,0 +1,99 @@
+import argparse                       # Command-line options
+import json                           # Optional machine-readable report
+import random                         # Sampling of evaluation queries
+import time                           # Latency measurements
+import numpy as np                    # Percentiles
+from retrieval import ChromaBackend, NumpyBackend
+
+# ----------------------------------------------------------------------------
+# Topic queries resembling what students type into the search box.
+# Question texts sampled from the bank are added on top of these.
+# ----------------------------------------------------------------------------
+TOPIC_QUERIES = [
+    "OSPF", "EIGRP", "VLAN", "subnetting", "spanning tree", "STP root bridge",
+    "NAT", "DHCP", "access control lists", "IPv6 addressing", "routing table",
+    "switching", "trunking 802.1Q", "EtherChannel", "wireless security",
+    "TCP vs UDP", "OSI model", "ARP", "default gateway", "static routes",
+]
+
+
+def percentile_ms(samples, pct):
+    return float(np.percentile(np.asarray(samples) * 1000.0, pct))
+
+
+# ----------------------------------------------------------------------------
+# time_backend:
+#   - Runs every query through the backend one at a time (like /search does)
+#     and returns the per-query hit id lists and latencies.
+# ----------------------------------------------------------------------------
+def time_backend(backend, embeddings, top_k):
+    hits, latencies = [], []
+    for embedding in embeddings:
+        started = time.perf_counter()
+        result = backend.query([embedding], top_k)[0]
+        latencies.append(time.perf_counter() - started)
+        hits.append([hit["id"] for hit in result])
+    return hits, latencies
+
+
+# ----------------------------------------------------------------------------
+# compare:
+#   - The NumPy backend is exact, so its results are the ground truth.
+#   - recall@k is the fraction of exact top-k ids that Chroma also returned.
+# ----------------------------------------------------------------------------
+def compare(num_samples=200, top_k=5, seed=0):
+    # Imported here so TOPIC_QUERIES can be reused without loading the model
+    from search import encoder, collection
+
+    numpy_backend = NumpyBackend(collection)
+    chroma_backend = ChromaBackend(collection)
+
+    documents = collection.get(include=["documents"])["documents"]
+    rng = random.Random(seed)
+    queries = TOPIC_QUERIES + rng.sample(documents, min(num_samples, len(documents)))
+    embeddings = encoder.encode(queries)
+
+    # Warm both backends up so one-off initialization is not measured
+    numpy_backend.query(embeddings[:1], top_k)
+    chroma_backend.query(embeddings[:1], top_k)
+
+    exact_hits, numpy_latencies = time_backend(numpy_backend, embeddings, top_k)
+    approx_hits, chroma_latencies = time_backend(chroma_backend, embeddings, top_k)
+
+    recalls = [
+        len(set(exact) & set(approx)) / max(len(exact), 1)
+        for exact, approx in zip(exact_hits, approx_hits)
+    ]
+
+    report = {"queries": len(queries), "top_k": top_k, "documents": len(numpy_backend),
+              "chroma_recall_at_k": float(np.mean(recalls))}
+    for name, latencies in (("numpy", numpy_latencies), ("chroma", chroma_latencies)):
+        report[name] = {
+            "p50_ms": percentile_ms(latencies, 50),
+            "p95_ms": percentile_ms(latencies, 95),
+            "p99_ms": percentile_ms(latencies, 99),
+            "mean_ms": float(np.mean(latencies) * 1000.0),
+        }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare recall and latency of the retrieval backends.")
+    parser.add_argument("--samples", type=int, default=200, help="Question texts sampled as extra queries.")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the report to this file.")
+    args = parser.parse_args()
+
+    report = compare(args.samples, args.top_k, args.seed)
+
+    print(f"{report['queries']} queries against {report['documents']} questions, top_k={report['top_k']}")
+    print(f"Chroma recall@{report['top_k']} vs exact NumPy search: {report['chroma_recall_at_k']:.4f}")
+    for name in ("numpy", "chroma"):
+        stats = report[name]
+        print(f"{name:>6}: p50 {stats['p50_ms']:.3f} ms  p95 {stats['p95_ms']:.3f} ms  "
+              f"p99 {stats['p99_ms']:.3f} ms  mean {stats['mean_ms']:.3f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,239 @@
+import os                                   # Environment variables for database settings
+import threading                            # Locks/conditions guarding the pool state
+import time                                 # Checkout timeouts and idle tracking
+from contextlib import contextmanager       # For the "with connection() as conn" helper
+import psycopg2                             # PostgreSQL database adapter
+from psycopg2 import extensions             # Transaction status constants
+from metrics import span, DB_POOL_IN_USE, DB_POOL_TIMEOUTS  # Pool wait time and usage
+
+# --------------------------------------------------------------------
+# Database settings:
+#   - Every value can be overridden through an environment variable.
+#   - Update the defaults (dbname, user, password, host) as needed.
+# --------------------------------------------------------------------
+DB_SETTINGS = {
+    "dbname": os.getenv("CCNA_DB_NAME", "ccna_db"),
+    "user": os.getenv("CCNA_DB_USER", "*********"),
+    "password": os.getenv("CCNA_DB_PASSWORD", "*******"),
+    "host": os.getenv("CCNA_DB_HOST", "localhost"),
+    "port": int(os.getenv("CCNA_DB_PORT", "5432")),
+}
+
+# --------------------------------------------------------------------
+# Pool settings:
+#   - POOL_MIN_SIZE connections are opened up front, at most POOL_MAX_SIZE
+#     are ever open at the same time.
+#   - POOL_TIMEOUT is how long (seconds) a checkout waits for a free
+#     connection before giving up.
+#   - Borrowed connections are pinged with "SELECT 1" before being handed
+#     out, so a database restart or failover costs reconnects instead of
+#     failed requests. POOL_VALIDATE_AFTER (seconds, default 0 = always) can
+#     skip the ping for connections returned more recently than that.
+# --------------------------------------------------------------------
+POOL_MIN_SIZE = int(os.getenv("CCNA_DB_POOL_MIN", "1"))
+POOL_MAX_SIZE = int(os.getenv("CCNA_DB_POOL_MAX", "10"))
+POOL_TIMEOUT = float(os.getenv("CCNA_DB_POOL_TIMEOUT", "5"))
+POOL_VALIDATE_AFTER = float(os.getenv("CCNA_DB_POOL_VALIDATE_AFTER", "0"))
+
+
+# Raised when no connection becomes available within the checkout timeout
+class PoolTimeout(Exception):
+    pass
+
+
+# --------------------------------------------------------------------
+# ConnectionPool:
+#   - Thread-safe pool of psycopg2 connections.
+#   - Connections are validated on borrow (closed, or idle for too long),
+#     transparently replaced when they are dead, and rolled back before
+#     they go back into the pool.
+# --------------------------------------------------------------------
+class ConnectionPool:
+    def __init__(self, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT,
+                 validate_after=POOL_VALIDATE_AFTER, **connect_kwargs):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: need 0 <= min_size <= max_size and max_size >= 1")
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.validate_after = validate_after
+        self.connect_kwargs = connect_kwargs or dict(DB_SETTINGS)
+
+        self._cond = threading.Condition()
+        self._idle = []         # (connection, last_returned_at) pairs, most recent last
+        self._size = 0          # Open connections, idle or checked out
+        self._closed = False
+
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        return psycopg2.connect(**self.connect_kwargs)
+
+    @staticmethod
+    def _is_alive(conn):
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    # ----------------------------------------------------------------
+    # getconn: borrow a connection, waiting up to `timeout` seconds.
+    # ----------------------------------------------------------------
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Connection pool is closed")
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        create = False
+                        break
+                    if self._size < self.max_size:
+                        # Reserve a slot, then connect outside the lock
+                        self._size += 1
+                        conn, returned_at, create = None, None, True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            f"No database connection available within {timeout:.1f}s "
+                            f"(pool size {self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+
+            if create:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+
+            # Validate on borrow: drop dead connections and try again
+            stale = time.monotonic() - returned_at >= self.validate_after
+            if conn.closed or (stale and not self._is_alive(conn)):
+                self._discard(conn)
+                continue
+            return conn
+
+    # ----------------------------------------------------------------
+    # putconn: return a connection; broken ones are closed instead.
+    # ----------------------------------------------------------------
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                # Never hand out a connection with an open or aborted transaction
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        if discard or conn.closed:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                conn.close()
+                return
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    # ----------------------------------------------------------------
+    # connection: context manager that commits on success, rolls back on
+    # error, and always returns the connection to the pool.
+    # ----------------------------------------------------------------
+    @contextmanager
+    def connection(self, timeout=None):
+        try:
+            with span("db_pool_wait"):
+                conn = self.getconn(timeout)
+        except PoolTimeout:
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        DB_POOL_IN_USE.inc()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # The server went away (restart, failover): never reuse this one
+            broken = True
+            raise
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            DB_POOL_IN_USE.dec()
+            self.putconn(conn, discard=broken)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+    def stats(self):
+        with self._cond:
+            return {"size": self._size, "idle": len(self._idle), "max_size": self.max_size}
+
+
+# --------------------------------------------------------------------
+# Process-wide pool:
+#   - Created lazily on first use so importing this module never touches
+#     the database.
+#   - reset_pool() drops it. A freshly forked worker passes close=False:
+#     the inherited sockets belong to the parent and must not be closed
+#     (closing them would terminate the parent's sessions).
+# --------------------------------------------------------------------
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(**DB_SETTINGS)
+    return _pool
+
+
+def reset_pool(close=True):
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None and close:
+        pool.closeall()
+
+
+def connection(timeout=None):
+    return get_pool().connection(timeout)
@@ -0,0 +1,254 @@
+import argparse                                     # Command-line options
+import json                                         # Report file
+import os                                           # Threshold default from the environment
+import time                                         # Timing information
+import numpy as np                                  # Blocked similarity search
+from lexical import fingerprint                     # Normalized-text hashes
+from banks import DEFAULT_BANK, collection_name, table_name  # Per-bank collection and table
+
+# ----------------------------------------------------------------------------
+# Near-duplicate detection:
+#   - Two questions are near-duplicates when their normalized texts have the
+#     same fingerprint (case, punctuation and spacing ignored) or when their
+#     embeddings (from preprocess.py) reach --threshold cosine similarity.
+#   - By default they must also have the same correct answer, so that
+#     look-alike questions asking for different things are kept apart.
+#   - Near-duplicates are grouped transitively; the oldest question (lowest
+#     id) of a group is its canonical question.
+#   - The groups are written to a JSON report. --apply mark records
+#     duplicate_of (the canonical id) in PostgreSQL and in the Chroma metadata,
+#     which takes the duplicates out of the search indexes and the topic
+#     clusters; --apply merge deletes them from both stores.
+#   - mark is the only persistent mode: populate_db.py keys rows on the question
+#     text, so it inserts merged-away duplicates again on its next run. merge
+#     therefore refuses to run without --allow-reinsert, for banks that are
+#     never reloaded.
+#   - Run preprocess.py first, so every question has an embedding. --bank
+#     selects the question bank (duplicates are never looked for across banks).
+# ----------------------------------------------------------------------------
+CHROMA_PATH = "./chroma_db"
+DEFAULT_THRESHOLD = float(os.getenv("CCNA_DUPLICATE_THRESHOLD", "0.95"))
+DEFAULT_REPORT = "dedupe-report.json"
+LOAD_PAGE_SIZE = 5000
+BLOCK_ROWS = 2048
+
+# "Not a duplicate": written when a mark is cleared, since Chroma metadata
+# updates cannot reliably remove a key
+NOT_DUPLICATE = -1
+
+
+def is_duplicate(metadata):
+    return (metadata or {}).get("duplicate_of", NOT_DUPLICATE) >= 0
+
+
+class UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i != root_j:
+            self.parent[max(root_i, root_j)] = min(root_i, root_j)
+
+
+# ----------------------------------------------------------------------------
+# load_bank: every question of the collection with its embedding, metadata
+# and correct answer, sorted by id.
+# ----------------------------------------------------------------------------
+def load_bank(collection, table="questions"):
+    import db
+
+    ids, documents, metadatas, embeddings = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=LOAD_PAGE_SIZE, offset=offset)
+        if not len(page["ids"]):
+            break
+        ids.extend(int(doc_id) for doc_id in page["ids"])
+        documents.extend(page["documents"])
+        metadatas.extend(metadata or {} for metadata in page["metadatas"])
+        embeddings.append(np.asarray(page["embeddings"], dtype=np.float32))
+        offset += len(page["ids"])
+
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute(f"SELECT id, correct_answer FROM {table}")
+        correct_answers = dict(cur.fetchall())
+
+    order = sorted(range(len(ids)), key=ids.__getitem__)
+    matrix = np.vstack(embeddings)[order] if embeddings else np.zeros((0, 0), dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    return {
+        "ids": [ids[i] for i in order],
+        "documents": [documents[i] for i in order],
+        "metadatas": [metadatas[i] for i in order],
+        "answers": [correct_answers.get(ids[i]) for i in order],
+        "matrix": matrix,
+    }
+
+
+# ----------------------------------------------------------------------------
+# find_groups:
+#   - Exact fingerprint matches first, then all pairs above the threshold,
+#     scored BLOCK_ROWS rows at a time so memory stays O(BLOCK_ROWS * n).
+#   - Returns lists of positions, each sorted (canonical first).
+# ----------------------------------------------------------------------------
+def find_groups(bank, threshold=DEFAULT_THRESHOLD, same_answer=True):
+    n = len(bank["ids"])
+    answer_keys = [fingerprint(answer) if answer is not None else None for answer in bank["answers"]]
+    groups = UnionFind(n)
+
+    def compatible(i, j):
+        return not same_answer or (answer_keys[i] is not None and answer_keys[i] == answer_keys[j])
+
+    first_by_text = {}
+    for i, document in enumerate(bank["documents"]):
+        j = first_by_text.setdefault((fingerprint(document), answer_keys[i] if same_answer else None), i)
+        if j != i:
+            groups.union(i, j)
+
+    matrix = bank["matrix"]
+    for start in range(0, n, BLOCK_ROWS):
+        similarities = matrix[start:start + BLOCK_ROWS] @ matrix.T
+        rows, columns = np.nonzero(similarities >= threshold)
+        for row, column in zip(rows.tolist(), columns.tolist()):
+            i = start + row
+            if column > i and compatible(i, column):
+                groups.union(i, column)
+
+    members = {}
+    for i in range(n):
+        members.setdefault(groups.find(i), []).append(i)
+    return [sorted(group) for group in members.values() if len(group) > 1]
+
+
+def build_report(bank, groups, threshold, same_answer):
+    ids, documents, matrix = bank["ids"], bank["documents"], bank["matrix"]
+    entries = []
+    for group in groups:
+        canonical = group[0]
+        entries.append({
+            "canonical": {"id": ids[canonical], "question": documents[canonical]},
+            "duplicates": [
+                {
+                    "id": ids[i],
+                    "question": documents[i],
+                    "similarity": round(float(matrix[i] @ matrix[canonical]), 4),
+                    "same_text": fingerprint(documents[i]) == fingerprint(documents[canonical]),
+                }
+                for i in group[1:]
+            ],
+        })
+    return {
+        "threshold": threshold,
+        "same_answer": same_answer,
+        "questions": len(ids),
+        "groups": len(groups),
+        "duplicates": sum(len(group) - 1 for group in groups),
+        "clusters": entries,
+    }
+
+
+# ----------------------------------------------------------------------------
+# mark_duplicates: duplicate_of = canonical id on every duplicate, in both
+# stores; earlier marks that no longer apply are cleared.
+# ----------------------------------------------------------------------------
+def mark_duplicates(collection, bank, groups, table="questions"):
+    import db
+
+    duplicate_of = {bank["ids"][i]: bank["ids"][group[0]] for group in groups for i in group[1:]}
+
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS duplicate_of INTEGER")
+        cur.execute(f"UPDATE {table} SET duplicate_of = NULL WHERE duplicate_of IS NOT NULL")
+        cur.execute(
+            f"""
+            UPDATE {table} q
+               SET duplicate_of = v.canonical
+              FROM unnest(%s::int[], %s::int[]) AS v(id, canonical)
+             WHERE q.id = v.id
+            """,
+            (list(duplicate_of), list(duplicate_of.values()))
+        )
+
+    changed_ids, changed_meta = [], []
+    for qid, metadata in zip(bank["ids"], bank["metadatas"]):
+        target = duplicate_of.get(qid, NOT_DUPLICATE)
+        if metadata.get("duplicate_of", NOT_DUPLICATE) != target:
+            changed_ids.append(str(qid))
+            changed_meta.append({**metadata, "duplicate_of": target})
+    for start in range(0, len(changed_ids), LOAD_PAGE_SIZE):
+        collection.update(ids=changed_ids[start:start + LOAD_PAGE_SIZE],
+                          metadatas=changed_meta[start:start + LOAD_PAGE_SIZE])
+    return len(duplicate_of)
+
+
+# merge_duplicates: deletes every duplicate, keeping the canonical questions
+# (not persistent: populate_db.py inserts the deleted rows again)
+def merge_duplicates(collection, bank, groups, table="questions"):
+    import db
+
+    duplicate_ids = [bank["ids"][i] for group in groups for i in group[1:]]
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {table} WHERE id = ANY(%s)", (duplicate_ids,))
+    for start in range(0, len(duplicate_ids), LOAD_PAGE_SIZE):
+        collection.delete(ids=[str(qid) for qid in duplicate_ids[start:start + LOAD_PAGE_SIZE]])
+    return len(duplicate_ids)
+
+
+# Rebuilds what depends on the set of searchable questions and tells running
+# servers to reload (imported lazily: preprocess.py loads the embedding model)
+def refresh_indexes(bank=DEFAULT_BANK):
+    import preprocess
+    from topics import cluster_topics
+
+    preprocess.use_bank(bank)
+    preprocess.build_bm25_index()
+    cluster_topics(preprocess.collection, bank=bank)
+    preprocess.bump_index_version()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find near-duplicate CCNA questions.")
+    parser.add_argument("--bank", default=DEFAULT_BANK, help="Question bank to deduplicate.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Cosine similarity from which two questions are near-duplicates.")
+    parser.add_argument("--ignore-answers", action="store_true",
+                        help="Group near-duplicates even when their correct answers differ.")
+    parser.add_argument("--report", default=DEFAULT_REPORT, help="Where to write the JSON report.")
+    parser.add_argument("--apply", choices=["mark", "merge"], default=None,
+                        help="mark: record duplicate_of in PostgreSQL and Chroma; merge: delete the duplicates.")
+    parser.add_argument("--allow-reinsert", action="store_true",
+                        help="Allow --apply merge although populate_db.py inserts the deleted rows again.")
+    args = parser.parse_args()
+    if args.apply == "merge" and not args.allow_reinsert:
+        parser.error("--apply merge is undone by the next populate_db.py run; use --apply mark, "
+                     "or pass --allow-reinsert if the bank is never reloaded")
+
+    import chromadb
+
+    started = time.perf_counter()
+    table = table_name(args.bank)
+    collection = chromadb.PersistentClient(path=CHROMA_PATH).get_or_create_collection(name=collection_name(args.bank))
+    bank = load_bank(collection, table)
+    groups = find_groups(bank, args.threshold, same_answer=not args.ignore_answers)
+    report = build_report(bank, groups, args.threshold, not args.ignore_answers)
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(
+        f"Scanned {report['questions']} questions: {report['duplicates']} near-duplicates in "
+        f"{report['groups']} groups ({time.perf_counter() - started:.1f}s), report written to {args.report}"
+    )
+
+    if args.apply == "mark":
+        print(f"Marked {mark_duplicates(collection, bank, groups, table)} duplicates")
+    elif args.apply == "merge":
+        print(f"Deleted {merge_duplicates(collection, bank, groups, table)} duplicates")
+    if args.apply:
+        refresh_indexes(args.bank)
+        print("Rebuilt the BM25 index and topic clusters; rebuild the artifact with artifact.py if it is used")
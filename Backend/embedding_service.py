@@ -0,0 +1,288 @@
+import argparse                                      # Command-line options for the sidecar server
+import http.client                                   # Persistent connections to the sidecar
+import json                                          # Request/response bodies of the sidecar
+import os                                            # Service settings from environment variables
+import queue                                         # Hand-off between callers and the batching thread
+import threading                                     # Batching thread and per-thread client connections
+import time                                          # Flush deadlines and queue-wait metrics
+from concurrent.futures import Future                # One result slot per encode request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import numpy as np                                   # Embedding arrays
+from embeddings import load_model                    # Torch or ONNX embedding backend
+
+# -------------------------------------------------------------------------
+# Embedding service settings:
+#   - MAX_BATCH_SIZE: flush as soon as this many texts are queued.
+#   - MAX_WAIT_MS: flush at the latest this long after the first queued text.
+#   - SERVICE_URL: when set (e.g. http://127.0.0.1:5001), queries are encoded
+#     by the shared sidecar instead of a model loaded in this process.
+# -------------------------------------------------------------------------
+MAX_BATCH_SIZE = int(os.getenv("CCNA_EMBEDDING_MAX_BATCH", "64"))
+MAX_WAIT_MS = float(os.getenv("CCNA_EMBEDDING_MAX_WAIT_MS", "5"))
+SERVICE_URL = os.getenv("CCNA_EMBEDDING_SERVICE_URL", "")
+REQUEST_TIMEOUT = float(os.getenv("CCNA_EMBEDDING_TIMEOUT", "10"))
+
+
+# -------------------------------------------------------------------------
+# MicroBatcher:
+#   - Callers submit lists of texts and block on a Future.
+#   - One background thread drains the queue: it waits for the first request,
+#     keeps collecting until MAX_BATCH_SIZE texts or MAX_WAIT_MS have passed,
+#     encodes everything in a single forward pass and hands each caller its
+#     slice of the result.
+# -------------------------------------------------------------------------
+class MicroBatcher:
+    def __init__(self, encode_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "requests": 0, "texts": 0, "batches": 0, "max_batch_size": 0,
+            "queue_wait_seconds_total": 0.0, "max_queue_wait_seconds": 0.0,
+            "encode_seconds_total": 0.0,
+        }
+        self._start()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    # Threads do not survive fork(): a forked worker gets a fresh queue, locks
+    # and batching thread (requests queued in the parent are not carried over)
+    def restart_after_fork(self):
+        self._queue = queue.Queue()
+        self._metrics_lock = threading.Lock()
+        self._start()
+
+    def encode(self, texts, timeout=REQUEST_TIMEOUT):
+        future = Future()
+        self._queue.put((list(texts), future, time.monotonic()))
+        return future.result(timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        count = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while count < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            count += len(item[0])
+        return batch, count
+
+    def _run(self):
+        while True:
+            batch, count = self._collect()
+            started = time.monotonic()
+            texts = [text for item_texts, _, _ in batch for text in item_texts]
+            try:
+                embeddings = np.asarray(self.encode_fn(texts), dtype=np.float32)
+            except Exception as exc:
+                for _, future, _ in batch:
+                    future.set_exception(exc)
+                continue
+
+            offset = 0
+            for item_texts, future, _ in batch:
+                future.set_result(embeddings[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+            finished = time.monotonic()
+            waits = [started - queued_at for _, _, queued_at in batch]
+            with self._metrics_lock:
+                metrics = self._metrics
+                metrics["requests"] += len(batch)
+                metrics["texts"] += count
+                metrics["batches"] += 1
+                metrics["max_batch_size"] = max(metrics["max_batch_size"], count)
+                metrics["queue_wait_seconds_total"] += sum(waits)
+                metrics["max_queue_wait_seconds"] = max(metrics["max_queue_wait_seconds"], max(waits))
+                metrics["encode_seconds_total"] += finished - started
+
+    def metrics(self):
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        batches = metrics["batches"] or 1
+        requests = metrics["requests"] or 1
+        metrics["mean_batch_size"] = metrics["texts"] / batches
+        metrics["mean_queue_wait_seconds"] = metrics["queue_wait_seconds_total"] / requests
+        metrics["queue_depth"] = self._queue.qsize()
+        return metrics
+
+
+# -------------------------------------------------------------------------
+# RemoteEncoder:
+#   - Client for the sidecar started with `python embedding_service.py`.
+#   - Keeps one keep-alive HTTP connection per calling thread.
+# -------------------------------------------------------------------------
+class RemoteEncoder:
+    def __init__(self, url=SERVICE_URL, timeout=REQUEST_TIMEOUT):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def encode(self, texts):
+        body = json.dumps({"texts": list(texts)})
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request("POST", "/encode", body, {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                payload = json.loads(response.read())
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # Stale keep-alive connection: reconnect once
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+        if response.status != 200:
+            raise RuntimeError(f"Embedding service error {response.status}: {payload.get('error')}")
+        return np.asarray(payload["embeddings"], dtype=np.float32)
+
+    def reset_after_fork(self):
+        self._local = threading.local()
+
+    def metrics(self):
+        conn = self._connection()
+        conn.request("GET", "/metrics")
+        return json.loads(conn.getresponse().read())
+
+
+# -------------------------------------------------------------------------
+# LocalEncoder:
+#   - Loads the model (CCNA_EMBEDDING_BACKEND) in this process and
+#     micro-batches concurrent callers (e.g. the threads of one web worker).
+# -------------------------------------------------------------------------
+class LocalEncoder:
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.model = load_model()
+        self.batcher = MicroBatcher(self._encode, max_batch_size, max_wait_ms)
+
+    def _encode(self, texts):
+        return self.model.encode(texts, batch_size=len(texts))
+
+    def encode(self, texts):
+        return self.batcher.encode(texts)
+
+    def reset_after_fork(self, threads=None):
+        # The model weights stay shared with the parent (copy-on-write); only
+        # the batching thread is recreated. `threads` caps the intra-op threads
+        # of the torch backend so that forked workers do not oversubscribe cores.
+        if threads and self.model.name == "torch":
+            import torch
+            torch.set_num_threads(threads)
+        self.batcher.restart_after_fork()
+
+    def metrics(self):
+        return self.batcher.metrics()
+
+
+# -------------------------------------------------------------------------
+# get_encoder: the process-wide encoder (sidecar client or local model).
+# -------------------------------------------------------------------------
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def get_encoder():
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                _encoder = RemoteEncoder(SERVICE_URL) if SERVICE_URL else LocalEncoder()
+    return _encoder
+
+
+# -------------------------------------------------------------------------
+# reset_after_fork: called in every forked web worker (see gunicorn.conf.py)
+# when the encoder was created before the fork (preload_app).
+# -------------------------------------------------------------------------
+def reset_after_fork(threads=None):
+    if _encoder is None:
+        return
+    if isinstance(_encoder, LocalEncoder):
+        _encoder.reset_after_fork(threads)
+    else:
+        _encoder.reset_after_fork()
+
+
+# -------------------------------------------------------------------------
+# Sidecar HTTP server:
+#   - POST /encode {"texts": [...]} -> {"embeddings": [[...], ...]}
+#   - GET /metrics -> batch-size and queue-wait statistics
+#   - Every request thread feeds the same MicroBatcher, so requests coming
+#     from all web workers are encoded together by one model instance.
+# -------------------------------------------------------------------------
+class EmbeddingRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive
+    encoder = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path != "/encode":
+            return self._send_json(404, {"error": "Not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            texts = json.loads(self.rfile.read(length))["texts"]
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                raise ValueError("texts must be a list of strings")
+        except (ValueError, KeyError, TypeError) as e:
+            return self._send_json(400, {"error": f"Invalid request: {e}"})
+
+        try:
+            embeddings = self.encoder.encode(texts) if texts else np.zeros((0, 0), dtype=np.float32)
+        except Exception as e:
+            return self._send_json(500, {"error": str(e)})
+        self._send_json(200, {"embeddings": embeddings.tolist()})
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            return self._send_json(404, {"error": "Not found"})
+        self._send_json(200, self.encoder.metrics())
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host, port, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+    EmbeddingRequestHandler.encoder = LocalEncoder(max_batch_size, max_wait_ms)
+    server = ThreadingHTTPServer((host, port), EmbeddingRequestHandler)
+    server.daemon_threads = True
+    print(f"Embedding service listening on http://{host}:{port} "
+          f"(max batch {max_batch_size}, max wait {max_wait_ms} ms)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared micro-batching embedding service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS)
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.max_batch_size, args.max_wait_ms)
@@ -0,0 +1,133 @@
+import os                      # Backend selection through environment variables
+import numpy as np             # Embedding arrays
+
+# -------------------------------------------------------------------------
+# Embedding backends:
+#   - "torch": the PyTorch SentenceTransformer model (float32 baseline).
+#   - "onnx" : the same model exported to ONNX and int8 dynamically quantized
+#              (see export_onnx.py), run with onnxruntime on the CPU.
+#   - CCNA_EMBEDDING_BACKEND selects the backend. preprocess.py records the
+#     backend id on the collection, and search.py refuses to query an index
+#     built with a different backend, so vectors always stay comparable.
+#   - CCNA_EMBEDDING_DTYPE=float16 stores the in-memory search matrix in half
+#     precision (queries are still scored in float32).
+# -------------------------------------------------------------------------
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+EMBEDDING_BACKEND = os.getenv("CCNA_EMBEDDING_BACKEND", "torch")
+EMBEDDING_DTYPE = os.getenv("CCNA_EMBEDDING_DTYPE", "float32")
+ONNX_MODEL_DIR = os.getenv("CCNA_ONNX_MODEL_DIR", "./onnx_model")
+ONNX_MODEL_FILE = "model_int8.onnx"
+MAX_SEQ_LENGTH = 256
+
+
+def _normalize(embeddings):
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (embeddings / norms).astype(np.float32)
+
+
+# -------------------------------------------------------------------------
+# TorchEmbedder: the original SentenceTransformer path.
+# -------------------------------------------------------------------------
+class TorchEmbedder:
+    name = "torch"
+
+    def __init__(self, model_name=MODEL_NAME):
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts, batch_size=64):
+        embeddings = self.model.encode(
+            list(texts), batch_size=batch_size, show_progress_bar=False, normalize_embeddings=True
+        )
+        return np.asarray(embeddings, dtype=np.float32)
+
+
+# -------------------------------------------------------------------------
+# OnnxEmbedder:
+#   - Runs the exported, int8-quantized graph with onnxruntime.
+#   - Reproduces the SentenceTransformer pipeline of all-MiniLM-L6-v2:
+#     tokenizer -> transformer -> attention-masked mean pooling -> L2 norm.
+# -------------------------------------------------------------------------
+class OnnxEmbedder:
+    name = "onnx"
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, model_file=ONNX_MODEL_FILE, model_name=MODEL_NAME):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        model_path = os.path.join(model_dir, model_file)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"{model_path} not found; run export_onnx.py first")
+
+        self.model_name = model_name
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def encode(self, texts, batch_size=64):
+        texts = list(texts)
+        chunks = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(
+                texts[start:start + batch_size], padding=True, truncation=True,
+                max_length=MAX_SEQ_LENGTH, return_tensors="np"
+            )
+            feed = {name: tokens[name].astype(np.int64) for name in tokens if name in self.input_names}
+            token_embeddings = self.session.run(None, feed)[0]
+
+            # Mean pooling over real (non-padding) tokens
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            summed = (token_embeddings * mask).sum(axis=1)
+            chunks.append(summed / np.clip(mask.sum(axis=1), 1e-9, None))
+
+        if not chunks:
+            return np.zeros((0, 0), dtype=np.float32)
+        return _normalize(np.vstack(chunks))
+
+
+EMBEDDERS = {
+    TorchEmbedder.name: TorchEmbedder,
+    OnnxEmbedder.name: OnnxEmbedder,
+}
+
+
+# -------------------------------------------------------------------------
+# backend_id: identifies the vector space produced by a backend. It is part
+# of the content hashes in preprocess.py and of the collection metadata.
+# The torch id is the bare model name, which is what indexes built before
+# the ONNX backend existed were hashed with.
+# -------------------------------------------------------------------------
+def backend_id(backend=None):
+    backend = backend or EMBEDDING_BACKEND
+    return MODEL_NAME if backend == "torch" else f"{backend}-int8:{MODEL_NAME}"
+
+
+def load_model(backend=None):
+    backend = backend or EMBEDDING_BACKEND
+    if backend not in EMBEDDERS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; choose one of {sorted(EMBEDDERS)}")
+    return EMBEDDERS[backend]()
+
+
+# -------------------------------------------------------------------------
+# Collection metadata helpers shared by preprocess.py and search.py.
+# -------------------------------------------------------------------------
+def record_backend(collection, backend=None):
+    # hnsw:* settings cannot be changed after creation, so they are not resent
+    metadata = {key: value for key, value in (collection.metadata or {}).items() if not key.startswith("hnsw:")}
+    metadata["embedding_backend"] = backend_id(backend)
+    collection.modify(metadata=metadata)
+
+
+def check_backend(collection, backend=None):
+    indexed = (collection.metadata or {}).get("embedding_backend")
+    expected = backend_id(backend)
+    if indexed and indexed != expected:
+        raise RuntimeError(
+            f"Collection {collection.name!r} was embedded with {indexed!r} but this process uses "
+            f"{expected!r}; rebuild the index with preprocess.py or set CCNA_EMBEDDING_BACKEND"
+        )
@@ -0,0 +1,55 @@
+import argparse                                   # Command-line options
+import os                                         # Output paths
+from embeddings import MODEL_NAME, ONNX_MODEL_DIR, ONNX_MODEL_FILE
+
+# ----------------------------------------------------------------------------
+# ONNX export:
+#   1. Export the transformer of all-MiniLM-L6-v2 (token embeddings output)
+#      to ONNX with dynamic batch and sequence axes.
+#   2. Apply int8 dynamic quantization to the weights (MatMul/Gather), which
+#      is what makes the graph fast on CPU-only nodes.
+#   3. Save the tokenizer next to the graph so OnnxEmbedder is self-contained.
+# Pooling and normalization are done in NumPy by OnnxEmbedder.
+# ----------------------------------------------------------------------------
+def export(output_dir=ONNX_MODEL_DIR, opset=17):
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    model = AutoModel.from_pretrained(MODEL_NAME)
+    model.eval()
+
+    sample = tokenizer(["How does OSPF elect a designated router?"], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+
+    float_path = os.path.join(output_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            float_path,
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+
+    quantized_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    quantize_dynamic(float_path, quantized_path, weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(output_dir)
+
+    print(f"Exported {MODEL_NAME}: {float_path} ({os.path.getsize(float_path) / 1e6:.1f} MB), "
+          f"{quantized_path} ({os.path.getsize(quantized_path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export all-MiniLM-L6-v2 to an int8-quantized ONNX graph.")
+    parser.add_argument("--output-dir", default=ONNX_MODEL_DIR)
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+
+    export(args.output_dir, args.opset)
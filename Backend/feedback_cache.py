@@ -0,0 +1,129 @@
+import hashlib                 # Content-hash cache keys
+import os                      # Cache backend selection
+import sqlite3                 # Default, zero-setup persistent store
+import threading               # One SQLite connection per thread
+
+# ----------------------------------------------------------------------------------------
+# Feedback cache settings:
+#   - CCNA_FEEDBACK_CACHE selects the store: "sqlite" (default), "postgres" or "off".
+#   - CCNA_FEEDBACK_CACHE_PATH is the SQLite database file.
+# ----------------------------------------------------------------------------------------
+FEEDBACK_CACHE = os.getenv("CCNA_FEEDBACK_CACHE", "sqlite")
+FEEDBACK_CACHE_PATH = os.getenv("CCNA_FEEDBACK_CACHE_PATH", "./feedback_cache.sqlite3")
+
+
+# ----------------------------------------------------------------------------------------
+# feedback_key:
+#   - One explanation unit is identified by (question, correct answer, chosen answer)
+#     plus the prompt version, so editing the prompt invalidates old explanations.
+# ----------------------------------------------------------------------------------------
+def feedback_key(prompt_version, question, correct_answer, chosen_answer):
+    payload = "\x1f".join((prompt_version, question.strip(), correct_answer.strip(), chosen_answer.strip()))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ----------------------------------------------------------------------------------------
+# SQLiteFeedbackCache: local file, WAL mode so readers never block the writer.
+# ----------------------------------------------------------------------------------------
+class SQLiteFeedbackCache:
+    def __init__(self, path=FEEDBACK_CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS feedback_cache (
+                    key TEXT PRIMARY KEY,
+                    prompt_version TEXT NOT NULL,
+                    explanation TEXT NOT NULL,
+                    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get_many(self, keys):
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        rows = self._connection().execute(
+            f"SELECT key, explanation FROM feedback_cache WHERE key IN ({placeholders})", keys
+        ).fetchall()
+        return dict(rows)
+
+    # items: iterable of (key, prompt_version, explanation)
+    def put_many(self, items):
+        items = list(items)
+        if not items:
+            return
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO feedback_cache (key, prompt_version, explanation) VALUES (?, ?, ?)",
+                items
+            )
+
+
+# ----------------------------------------------------------------------------------------
+# PostgresFeedbackCache: shared by every backend instance through the db.py pool.
+# ----------------------------------------------------------------------------------------
+class PostgresFeedbackCache:
+    def __init__(self):
+        import db
+        self.db = db
+        with db.connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS feedback_cache (
+                    key TEXT PRIMARY KEY,
+                    prompt_version TEXT NOT NULL,
+                    explanation TEXT NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """)
+
+    def get_many(self, keys):
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        with self.db.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT key, explanation FROM feedback_cache WHERE key = ANY(%s)", (keys,))
+            return dict(cur.fetchall())
+
+    def put_many(self, items):
+        from psycopg2.extras import execute_values
+        items = list(items)
+        if not items:
+            return
+        with self.db.connection() as conn, conn.cursor() as cur:
+            execute_values(
+                cur,
+                "INSERT INTO feedback_cache (key, prompt_version, explanation) VALUES %s "
+                "ON CONFLICT (key) DO NOTHING",
+                items
+            )
+
+
+# ----------------------------------------------------------------------------------------
+# NullFeedbackCache: caching disabled.
+# ----------------------------------------------------------------------------------------
+class NullFeedbackCache:
+    def get_many(self, keys):
+        return {}
+
+    def put_many(self, items):
+        pass
+
+
+def create_feedback_cache(kind=FEEDBACK_CACHE):
+    if kind == "sqlite":
+        return SQLiteFeedbackCache()
+    if kind == "postgres":
+        return PostgresFeedbackCache()
+    if kind == "off":
+        return NullFeedbackCache()
+    raise ValueError(f"Unknown feedback cache {kind!r}; choose sqlite, postgres or off")
@@ -1,119 +1,525 @@
-import logging
-from openai import AzureOpenAI, RateLimitError, OpenAIError
-
-# ----------------------------------------------------------------------------------------
-# Azure OpenAI API settings:
-#   - Replace with your actual API key, Azure endpoint, and API version if necessary.
-#   - Make sure to keep these sensitive values secure.
-# ----------------------------------------------------------------------------------------
-api_key = "************************************"
-azure_endpoint = "*************************************"
-api_version = "**********************************"
-
-# ----------------------------------------------------------------------------------------
-# Initialize the Azure OpenAI client:
-#   - This client communicates with the Azure OpenAI service.
-#   - It leverages the provided endpoint, API key, and version.
-# ----------------------------------------------------------------------------------------
-client = AzureOpenAI(
-    azure_endpoint=azure_endpoint,
-    api_key=api_key,
-    api_version=api_version,
-)
-
-# ----------------------------------------------------------------------------------------
-# Configure logging:
-#   - Logging level set to INFO to capture standard info, warnings, and errors.
-# ----------------------------------------------------------------------------------------
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-# ----------------------------------------------------------------------------------------
-# generate_response function:
-#   - Accepts input_data (dict) containing 'query', 'questions', 'correct_answers', and 'user_answers'.
-#   - Constructs a prompt for GPT-4 to provide feedback for each question.
-#   - Returns feedback or error messages in a dictionary.
-# ----------------------------------------------------------------------------------------
-def generate_response(input_data):
-    
-    # Extract relevant fields from the input_data dictionary
-    query = input_data.get("query", "")
-    questions = input_data.get("questions", [])
-    correct_answers = input_data.get("correct_answers", [])
-    user_answers = input_data.get("user_answers", [])
-
-    # ------------------------------------------------------------------------------------
-    # Validate input data:
-    #   - Ensure questions, correct_answers, and user_answers are non-empty lists.
-    #   - Ensure these lists all have the same length.
-    # ------------------------------------------------------------------------------------
-    if not questions or not correct_answers or not user_answers:
-        logger.error("Invalid input data. Ensure questions, correct_answers, and user_answers are provided.")
-        return {"error": "Invalid input data."}
-
-    if len(questions) != len(correct_answers) or len(questions) != len(user_answers):
-        logger.error("Mismatch in the length of questions, correct_answers, and user_answers.")
-        return {"error": "Length mismatch in input data."}
-
-    # ------------------------------------------------------------------------------------
-    # Construct the prompt for GPT-4:
-    #   - Provide context to GPT-4: "You are a CCNA exam coach..."
-    #   - Include each question, the correct answer, and the user's answer.
-    #   - Ask GPT-4 to provide detailed feedback for each question.
-    # ------------------------------------------------------------------------------------
-    feedback_prompt = (
-        "You are a CCNA exam coach. I'm attempting a practice test with questions, here is my query: \"{}\". "
-        "For each question, provide detailed feedback. Include the following: \n"
-        "- Whether my answer is correct or incorrect. \n"
-        "- If incorrect, explain why the chosen answer is wrong. \n"
-        "- Offer specific advice on what I should focus on learning to improve. \n"
-        "At the end, recommend areas of study based on my answers."
-    ).format(query)
-
-    # Append each question block to the feedback prompt
-    for i, (question, correct_answer, user_answer) in enumerate(zip(questions, correct_answers, user_answers), 1):
-        feedback_prompt += (
-            f"\n\nQuestion {i}: {question}\n"
-            f"Correct Answer: {correct_answer}\n"
-            f"My Answer: {user_answer}\n"
-        )
-
-    # Add final instructions for overall performance summary
-    feedback_prompt += "\n\nProvide a summary of the overall performance and learning recommendations."
-
-    # ------------------------------------------------------------------------------------
-    # Make the API call to the GPT-4 model via the Azure OpenAI client:
-    #   - We pass a list of messages: a system prompt followed by the user prompt.
-    #   - The system prompt sets the context that GPT-4 is a CCNA coach.
-    #   - The user prompt includes the constructed feedback_prompt with all questions/answers.
-    # ------------------------------------------------------------------------------------
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4",  # Replace this with the specific engine/model name if required
-            messages=[
-                {"role": "system", "content": "You are a CCNA exam coach."},
-                {"role": "user", "content": feedback_prompt},
-            ]
-        )
-
-        # Extract the response text from GPT-4
-        feedback = response.choices[0].message.content.strip()
-        return {"feedback": feedback}
-
-    # ------------------------------------------------------------------------------------
-    # Handle rate limiting or other known OpenAI exceptions:
-    # ------------------------------------------------------------------------------------
-    except RateLimitError as e:
-        logger.error(f"Rate limit error: {e}")
-        return {"error": "Rate limit exceeded. Please try again later."}
-
-    except OpenAIError as e:
-        logger.error(f"OpenAI error: {e}")
-        return {"error": "An error occurred with the OpenAI API."}
-
-    # ------------------------------------------------------------------------------------
-    # Catch-all for any other unexpected exceptions:
-    # ------------------------------------------------------------------------------------
-    except Exception as e:
-        logger.error(f"Unexpected error: {e}")
-        return {"error": "An unexpected error occurred."}
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from openai import AzureOpenAI, RateLimitError, OpenAIError
+from feedback_cache import create_feedback_cache, feedback_key
+from llm_stub import StubChatClient
+from rate_limit import RateLimiter, QuotaTimeout, call_with_retry, LLM_CONCURRENCY
+from tokens import count_message_tokens, count_tokens, truncate_tokens
+from metrics import span, record_llm_usage, LLM_CALLS
+
+# ----------------------------------------------------------------------------------------
+# Azure OpenAI API settings:
+#   - Replace with your actual API key, Azure endpoint, and API version if necessary,
+#     or set AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT and OPENAI_API_VERSION.
+#   - Make sure to keep these sensitive values secure.
+# ----------------------------------------------------------------------------------------
+api_key = os.getenv("AZURE_OPENAI_API_KEY", "************************************")
+azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", "*************************************")
+api_version = os.getenv("OPENAI_API_VERSION", "**********************************")
+
+# ----------------------------------------------------------------------------------------
+# Initialize the Azure OpenAI client:
+#   - This client communicates with the Azure OpenAI service.
+#   - It leverages the provided endpoint, API key, and version.
+#   - With CCNA_LLM_STUB=1 a local stub (llm_stub.py) is used instead, so the
+#     service and the offline jobs run without network access or API keys.
+#   - The SDK's own retries are disabled; rate_limit.py owns the retry policy.
+# ----------------------------------------------------------------------------------------
+if os.getenv("CCNA_LLM_STUB") == "1":
+    client = StubChatClient(latency=float(os.getenv("CCNA_LLM_STUB_LATENCY", "0")))
+else:
+    client = AzureOpenAI(
+        azure_endpoint=azure_endpoint,
+        api_key=api_key,
+        api_version=api_version,
+        max_retries=0,
+    )
+
+# ----------------------------------------------------------------------------------------
+# Configure logging:
+#   - Logging level set to INFO to capture standard info, warnings, and errors.
+# ----------------------------------------------------------------------------------------
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# ----------------------------------------------------------------------------------------
+# Feedback units:
+#   - Feedback is produced per (question, chosen answer) "explanation unit".
+#   - Units are cached persistently (see feedback_cache.py), keyed by a content hash
+#     of the unit plus PROMPT_VERSION. Bump PROMPT_VERSION whenever UNIT_PROMPT or
+#     SYSTEM_PROMPT changes so stale explanations are not reused.
+#   - The final feedback is assembled locally from the units, so a submission whose
+#     units are all cached needs no LLM call at all.
+# ----------------------------------------------------------------------------------------
+MODEL = os.getenv("CCNA_LLM_MODEL", "gpt-4")  # Replace this with the specific engine/model name if required
+PROMPT_VERSION = "1"
+SYSTEM_PROMPT = "You are a CCNA exam coach."
+UNIT_PROMPT = (
+    "A student is taking a CCNA practice test.\n\n"
+    "Question: {question}\n"
+    "Correct Answer: {correct_answer}\n"
+    "Student's Answer: {chosen_answer}\n\n"
+    "In 2-4 sentences: say whether the student's answer is correct; if it is incorrect, "
+    "explain why the chosen answer is wrong and why the correct answer is right; "
+    "then give specific advice on what to focus on learning.\n"
+    "Finish with one final line of the form \"Study: <CCNA topic>\"."
+)
+STUDY_PREFIX = "Study:"
+UNIT_MAX_TOKENS = int(os.getenv("CCNA_LLM_UNIT_MAX_TOKENS", "300"))
+
+# ----------------------------------------------------------------------------------------
+# Prompt token budgets (measured with tokens.py):
+#   - CCNA_LLM_PROMPT_TOKEN_BUDGET caps the prompt of one explanation unit; an
+#     oversized question or answer is truncated to fit.
+#   - CCNA_LLM_SUMMARY_TOKEN_BUDGET caps the summarization prompt; notes that do not
+#     fit are left out.
+# ----------------------------------------------------------------------------------------
+PROMPT_TOKEN_BUDGET = int(os.getenv("CCNA_LLM_PROMPT_TOKEN_BUDGET", "800"))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("CCNA_LLM_SUMMARY_TOKEN_BUDGET", "600"))
+
+# ----------------------------------------------------------------------------------------
+# Optional summarization pass:
+#   - With CCNA_LLM_SUMMARY_MODEL set (a cheap deployment, e.g. gpt-35-turbo), the
+#     study topics and the first sentence of every missed unit are merged into a short
+#     study plan that is appended to the locally assembled summary.
+#   - Without it, the summary is assembled locally only (no extra call).
+# ----------------------------------------------------------------------------------------
+SUMMARY_MODEL = os.getenv("CCNA_LLM_SUMMARY_MODEL", "")
+SUMMARY_MAX_TOKENS = int(os.getenv("CCNA_LLM_SUMMARY_MAX_TOKENS", "150"))
+SUMMARY_PROMPT = (
+    "A student missed these CCNA practice questions. For each: the study topic and the "
+    "key point of the explanation.\n\n{notes}\n\n"
+    "Write a study plan of at most 3 sentences that groups related topics and says what "
+    "to review first."
+)
+
+# ----------------------------------------------------------------------------------------
+# Concurrent model calls:
+#   - Missing units are explained in parallel on llm_executor, so a submission takes
+#     about as long as its slowest unit instead of the sum of all of them.
+#   - Every call passes through one process-wide RateLimiter (RPM/TPM buckets and a
+#     concurrency bound, see rate_limit.py): bursts queue instead of failing, and
+#     throttled calls are retried with jittered backoff honoring Retry-After.
+# ----------------------------------------------------------------------------------------
+limiter = RateLimiter()
+llm_executor = ThreadPoolExecutor(max_workers=LLM_CONCURRENCY, thread_name_prefix="llm")
+
+feedback_cache = create_feedback_cache()
+
+
+def is_correct(correct_answer, chosen_answer):
+    return correct_answer.strip() == chosen_answer.strip()
+
+
+# ----------------------------------------------------------------------------------------
+# grade: deterministic local scoring of a submission, available before (and without)
+# any model call.
+# ----------------------------------------------------------------------------------------
+def grade(items):
+    results = [is_correct(correct_answer, user_answer) for _, correct_answer, user_answer in items]
+    correct = sum(results)
+    return {
+        "correct": correct,
+        "total": len(results),
+        "percent": round(100.0 * correct / len(results), 1) if results else 0.0,
+        "results": results,
+    }
+
+
+def _unit_messages(question, correct_answer, chosen_answer):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": UNIT_PROMPT.format(
+            question=question, correct_answer=correct_answer, chosen_answer=chosen_answer
+        )},
+    ]
+
+# ----------------------------------------------------------------------------------------
+# build_unit_messages:
+#   - The chat messages of one explanation unit, within PROMPT_TOKEN_BUDGET.
+#   - When over budget, each answer is cut to at most a quarter of the room left by
+#     the fixed prompt text and the question gets the rest.
+# ----------------------------------------------------------------------------------------
+def build_unit_messages(question, correct_answer, chosen_answer, budget=None):
+    budget = budget or PROMPT_TOKEN_BUDGET
+    messages = _unit_messages(question, correct_answer, chosen_answer)
+    if count_message_tokens(messages, MODEL) <= budget:
+        return messages
+
+    room = budget - count_message_tokens(_unit_messages("", "", ""), MODEL)
+    correct_answer = truncate_tokens(correct_answer, room // 4, MODEL)
+    chosen_answer = truncate_tokens(chosen_answer, room // 4, MODEL)
+    room -= count_tokens(correct_answer, MODEL) + count_tokens(chosen_answer, MODEL)
+    question = truncate_tokens(question, room, MODEL)
+    messages = _unit_messages(question, correct_answer, chosen_answer)
+
+    # Token boundaries can shift where the pieces are joined; trim the last few
+    excess = count_message_tokens(messages, MODEL) - budget
+    while excess > 0 and question:
+        question = truncate_tokens(question, count_tokens(question, MODEL) - excess, MODEL)
+        messages = _unit_messages(question, correct_answer, chosen_answer)
+        excess = count_message_tokens(messages, MODEL) - budget
+    logger.info("Unit prompt truncated to the %d token budget", budget)
+    return messages
+
+
+# Token cost of a call (prompt plus the completion cap) reserved from the TPM bucket
+def estimate_tokens(messages, max_tokens, model=MODEL):
+    return count_message_tokens(messages, model) + max_tokens
+
+
+# Runs one chat completion through the rate limiter and retry policy
+def complete(messages, model=MODEL, max_tokens=UNIT_MAX_TOKENS, llm_client=None, **kwargs):
+    def call():
+        try:
+            with span("llm"):
+                response = (llm_client or client).chat.completions.create(
+                    model=model, messages=messages, max_tokens=max_tokens, **kwargs
+                )
+        except Exception:
+            LLM_CALLS.labels(model, "error").inc()
+            raise
+        LLM_CALLS.labels(model, "ok").inc()
+        usage = getattr(response, "usage", None)
+        record_llm_usage(model, usage)
+        return response, getattr(usage, "total_tokens", None)
+
+    return call_with_retry(limiter, call, estimate_tokens(messages, max_tokens, model),
+                           stream=kwargs.get("stream", False))
+
+# ----------------------------------------------------------------------------------------
+# explain_unit:
+#   - Asks the model for the explanation of one (question, chosen answer) unit.
+#   - OpenAI exceptions that survive the retries propagate to the caller.
+# ----------------------------------------------------------------------------------------
+def explain_unit(question, correct_answer, chosen_answer, llm_client=None):
+    with span("prompt"):
+        messages = build_unit_messages(question, correct_answer, chosen_answer)
+    response = complete(messages, llm_client=llm_client)
+    return response.choices[0].message.content.strip()
+
+
+# Explains many units concurrently; returns {key: explanation} or raises the first error
+def explain_units(missing):
+    futures = {key: llm_executor.submit(explain_unit, *item) for key, item in missing.items()}
+    generated, error = {}, None
+    for key, future in futures.items():
+        try:
+            generated[key] = future.result()
+        except Exception as e:
+            error = error or e
+    if error:
+        # Keep what succeeded; only the failed units are asked again next time
+        store_explanations(generated)
+        raise error
+    return generated
+
+
+# Splits the trailing "Study: <topic>" line off an explanation
+def split_study_topic(explanation):
+    text = explanation.strip()
+    head, _, last = text.rpartition("\n")
+    if last.strip().startswith(STUDY_PREFIX):
+        return head.rstrip(), last.strip()[len(STUDY_PREFIX):].strip()
+    return text, None
+
+# ----------------------------------------------------------------------------------------
+# stream_unit:
+#   - Streaming variant of explain_unit: yields the explanation text as the model
+#     produces it.
+#   - The last line is held back until the stream ends and dropped when it is the
+#     "Study: <topic>" line (it only feeds the summary); the complete, unfiltered
+#     text is appended to `collected` for the cache.
+#   - Only opening the stream is retried; a stream that breaks off midway raises to
+#     the caller. The limiter slot is held until the stream is consumed or closed.
+# ----------------------------------------------------------------------------------------
+def stream_unit(question, correct_answer, chosen_answer, collected, llm_client=None):
+    with span("prompt"):
+        messages = build_unit_messages(question, correct_answer, chosen_answer)
+    stream = complete(
+        messages,
+        llm_client=llm_client,
+        stream=True,
+    )
+
+    # Everything before the last line is final: only the last line can still turn
+    # out to be the study line, so it is held back until the stream ends. The
+    # streamed text is then exactly what split_study_topic keeps.
+    text, sent = "", 0
+    try:
+        for chunk in stream:
+            # Azure may send chunks without choices (e.g. content-filter results)
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            token = chunk.choices[0].delta.content
+            collected.append(token)
+            text += token
+
+            final = text.strip().rpartition("\n")[0].rstrip()
+            if len(final) > sent:
+                yield final[sent:]
+                sent = len(final)
+    finally:
+        # Frees the limiter slot also when the client disconnects midway
+        if hasattr(stream, "close"):
+            stream.close()
+
+    body, _ = split_study_topic(text)
+    if len(body) > sent:
+        yield body[sent:]
+
+
+def section_header(number, question, correct_answer, user_answer):
+    verdict = "Correct" if is_correct(correct_answer, user_answer) else f"Incorrect (correct answer: {correct_answer})"
+    return f"**Question {number}:** {question}\n\n- Your answer: {user_answer} - {verdict}"
+
+# ----------------------------------------------------------------------------------------
+# summarize: the score and the study topics of the missed questions.
+# ----------------------------------------------------------------------------------------
+def summarize(query, items, explanations):
+    study_topics = {}
+    correct_count = 0
+    for i, ((_, correct_answer, user_answer), explanation) in enumerate(zip(items, explanations), 1):
+        correct = is_correct(correct_answer, user_answer)
+        correct_count += correct
+        topic = split_study_topic(explanation)[1] if explanation else None
+        if topic and not correct:
+            study_topics.setdefault(topic, []).append(i)
+
+    summary = (f"### Summary\n\nYou answered {correct_count} of {len(items)} questions correctly"
+               + (f" on \"{query}\"." if query else "."))
+    if study_topics:
+        summary += "\n\nRecommended areas of study:\n" + "\n".join(
+            f"- {topic} (question{'s' if len(numbers) > 1 else ''} {', '.join(map(str, numbers))})"
+            for topic, numbers in study_topics.items()
+        )
+    elif correct_count == len(items):
+        summary += "\n\nGreat work - keep practicing other CCNA topics to stay sharp."
+    return summary
+
+# ----------------------------------------------------------------------------------------
+# study_plan: the optional cheap summarization pass (see SUMMARY_MODEL). Returns None
+# when it is disabled, nothing was missed, or the call fails.
+# ----------------------------------------------------------------------------------------
+def study_plan(items, explanations):
+    if not SUMMARY_MODEL:
+        return None
+
+    notes = []
+    for i, ((_, correct_answer, user_answer), explanation) in enumerate(zip(items, explanations), 1):
+        if is_correct(correct_answer, user_answer) or not explanation:
+            continue
+        body, topic = split_study_topic(explanation)
+        notes.append(f"{i}. {topic or 'CCNA'}: {body.split('. ')[0].strip()}")
+    if not notes:
+        return None
+
+    def summary_messages(notes):
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": SUMMARY_PROMPT.format(notes="\n".join(notes))},
+        ]
+
+    # Drop notes from the end until the prompt fits the budget (keep at least one)
+    while len(notes) > 1 and count_message_tokens(summary_messages(notes), SUMMARY_MODEL) > SUMMARY_TOKEN_BUDGET:
+        notes.pop()
+    messages = summary_messages(notes)
+    try:
+        response = complete(messages, model=SUMMARY_MODEL, max_tokens=SUMMARY_MAX_TOKENS)
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        logger.error(f"Summarization pass failed: {e}")
+        return None
+
+# ----------------------------------------------------------------------------------------
+# assemble_feedback:
+#   - Builds the final Markdown feedback from the explanation units: one section per
+#     question, then a summary with the score and the study topics of the missed
+#     questions.
+# ----------------------------------------------------------------------------------------
+def assemble_feedback(query, items, explanations, plan=None):
+    sections = []
+    for i, (item, explanation) in enumerate(zip(items, explanations), 1):
+        body = split_study_topic(explanation)[0] if explanation else ""
+        sections.append(section_header(i, *item) + (f"\n\n{body}" if body else ""))
+    summary = summarize(query, items, explanations)
+    if plan:
+        summary += f"\n\n**Study plan:** {plan}"
+    return "\n\n".join(sections + [summary])
+
+# ----------------------------------------------------------------------------------------
+# Shared helpers of generate_response and generate_response_stream.
+# ----------------------------------------------------------------------------------------
+
+# ------------------------------------------------------------------------------------
+# Validates input_data; returns (error, query, items, keys). Only incorrect answers
+# need an explanation, so correctly answered items get the key None and are never
+# looked up or sent to the model.
+# ------------------------------------------------------------------------------------
+def prepare_input(input_data):
+    # Extract relevant fields from the input_data dictionary
+    query = input_data.get("query", "")
+    questions = input_data.get("questions", [])
+    correct_answers = input_data.get("correct_answers", [])
+    user_answers = input_data.get("user_answers", [])
+
+    # ------------------------------------------------------------------------------------
+    # Validate input data:
+    #   - Ensure questions, correct_answers, and user_answers are non-empty lists.
+    #   - Ensure these lists all have the same length.
+    # ------------------------------------------------------------------------------------
+    if not questions or not correct_answers or not user_answers:
+        logger.error("Invalid input data. Ensure questions, correct_answers, and user_answers are provided.")
+        return {"error": "Invalid input data."}, query, [], []
+
+    if len(questions) != len(correct_answers) or len(questions) != len(user_answers):
+        logger.error("Mismatch in the length of questions, correct_answers, and user_answers.")
+        return {"error": "Length mismatch in input data."}, query, [], []
+
+    items = list(zip(questions, correct_answers, user_answers))
+    keys = [None if is_correct(item[1], item[2]) else feedback_key(PROMPT_VERSION, *item) for item in items]
+    return None, query, items, keys
+
+
+# Cache lookup: a failing cache only costs extra model calls, never the request
+def lookup_explanations(keys):
+    keys = [key for key in keys if key is not None]
+    if not keys:
+        return {}
+    try:
+        with span("feedback_cache"):
+            return feedback_cache.get_many(keys)
+    except Exception as e:
+        logger.error(f"Feedback cache lookup failed: {e}")
+        return {}
+
+
+def store_explanations(generated):
+    if not generated:
+        return
+    try:
+        with span("feedback_cache"):
+            feedback_cache.put_many((key, PROMPT_VERSION, text) for key, text in generated.items())
+    except Exception as e:
+        logger.error(f"Feedback cache write failed: {e}")
+
+
+# ------------------------------------------------------------------------------------
+# Handle rate limiting or other known OpenAI exceptions (and a catch-all for any
+# other unexpected exception), turning them into the error dictionaries returned
+# to clients.
+# ------------------------------------------------------------------------------------
+def error_response(e):
+    if isinstance(e, (RateLimitError, QuotaTimeout)):
+        logger.error(f"Rate limit error: {e}")
+        return {"error": "Rate limit exceeded. Please try again later."}
+    if isinstance(e, OpenAIError):
+        logger.error(f"OpenAI error: {e}")
+        return {"error": "An error occurred with the OpenAI API."}
+    logger.error(f"Unexpected error: {e}")
+    return {"error": "An unexpected error occurred."}
+
+# ----------------------------------------------------------------------------------------
+# generate_response function:
+#   - Accepts input_data (dict) containing 'query', 'questions', 'correct_answers', and 'user_answers'.
+#   - Grades locally first; only incorrectly answered questions get an explanation,
+#     so a perfect score needs no model call at all.
+#   - Looks up every explanation unit in the feedback cache and asks GPT-4 only for
+#     the missing ones, storing them for next time.
+#   - Returns feedback and score, or error messages, in a dictionary.
+# ----------------------------------------------------------------------------------------
+def generate_response(input_data):
+    error, query, items, keys = prepare_input(input_data)
+    if error:
+        return error
+
+    explanations = lookup_explanations(keys)
+    missing = {key: item for key, item in zip(keys, items) if key is not None and key not in explanations}
+
+    # ------------------------------------------------------------------------------------
+    # Make the API calls for the cache misses via the Azure OpenAI client:
+    #   - One call per missing (question, chosen answer) unit, all in parallel.
+    # ------------------------------------------------------------------------------------
+    try:
+        with span("llm_wait"):
+            generated = explain_units(missing)
+    except Exception as e:
+        return error_response(e)
+
+    store_explanations(generated)
+    explanations.update(generated)
+
+    ordered = [explanations.get(key) for key in keys]
+    feedback = assemble_feedback(query, items, ordered, study_plan(items, ordered))
+    return {"feedback": feedback, "score": grade(items)}
+
+# ----------------------------------------------------------------------------------------
+# generate_response_stream function:
+#   - Same input and feedback as generate_response, delivered incrementally.
+#   - Yields (event, payload) pairs:
+#       ("score", {...})              the local grade (see grade), always first
+#       ("token", {"text": ...})      a piece of the Markdown feedback, in order
+#       ("done",  {"feedback": ...})  the complete feedback text
+#       ("error", {"error": ...})     the stream ends early
+#   - Cached units are emitted at once. The first missing unit is streamed token by
+#     token from the model, so the first words appear as soon as the model produces
+#     them; the other missing units are generated concurrently in the meantime.
+# ----------------------------------------------------------------------------------------
+def generate_response_stream(input_data):
+    error, query, items, keys = prepare_input(input_data)
+    if error:
+        yield "error", error
+        return
+
+    yield "score", grade(items)
+
+    explanations = lookup_explanations(keys)
+    missing = {key: item for key, item in zip(keys, items) if key is not None and key not in explanations}
+    live_key = next(iter(missing), None)
+    prefetched = {key: llm_executor.submit(explain_unit, *item)
+                  for key, item in missing.items() if key != live_key}
+    generated = {}
+    parts = []
+
+    def emit(text):
+        parts.append(text)
+        return "token", {"text": text}
+
+    try:
+        for i, (key, item) in enumerate(zip(keys, items), 1):
+            yield emit(("\n\n" if i > 1 else "") + section_header(i, *item))
+
+            if key is None:
+                continue
+            if key in explanations:
+                body = split_study_topic(explanations[key])[0]
+            elif key in generated:
+                body = split_study_topic(generated[key])[0]
+            elif key in prefetched:
+                generated[key] = prefetched[key].result()
+                body = split_study_topic(generated[key])[0]
+            else:
+                collected = []
+                for n, text in enumerate(stream_unit(*item, collected)):
+                    yield emit(("\n\n" if n == 0 else "") + text)
+                generated[key] = "".join(collected).strip()
+                continue
+            if body:
+                yield emit("\n\n" + body)
+    except Exception as e:
+        for future in prefetched.values():
+            future.cancel()
+        store_explanations(generated)
+        yield "error", error_response(e)
+        return
+
+    store_explanations(generated)
+    explanations.update(generated)
+    ordered = [explanations.get(key) for key in keys]
+    summary = "\n\n" + summarize(query, items, ordered)
+    plan = study_plan(items, ordered)
+    if plan:
+        summary += f"\n\n**Study plan:** {plan}"
+    yield emit(summary)
+    yield "done", {"feedback": "".join(parts)}
@@ -0,0 +1,89 @@
+import multiprocessing          # Default worker count
+import os                       # Serving settings from environment variables
+import tempfile                 # Shared Prometheus metrics directory
+
+# ----------------------------------------------------------------------------------------
+# Production serving (run from the Backend directory):
+#
+#     gunicorn -c gunicorn.conf.py app:app
+#
+#   - Prefork: the master imports app.py once (preload_app), which loads the embedding
+#     model, the Chroma/NumPy index and the BM25 index, then forks the workers. The
+#     workers share those pages copy-on-write instead of loading one copy each.
+#   - Workers are threaded ("gthread") by default: a thread waiting on GPT-4 (or
+#     streaming its tokens) only blocks on I/O, so hundreds of exam submissions can
+#     be in flight while /search keeps being served by the other threads.
+#     CCNA_WORKER_CLASS=gevent switches to green-thread workers (requires gevent);
+#     the standard library is then patched before the app is preloaded.
+#
+# Settings:
+#   - CCNA_BIND                 address to listen on (default 0.0.0.0:5000)
+#   - CCNA_WORKERS              worker processes (default: number of CPUs)
+#   - CCNA_WORKER_CLASS         gthread (default), gevent or sync
+#   - CCNA_WORKER_THREADS       threads per gthread worker (default 64)
+#   - CCNA_WORKER_CONNECTIONS   concurrent clients per gevent worker (default 1000)
+#   - CCNA_WORKER_TIMEOUT       seconds before a silent worker is restarted (default 120)
+#   - CCNA_GRACEFUL_TIMEOUT     seconds to finish requests on restart (default 30)
+#   - CCNA_KEEPALIVE            keep-alive seconds (default 5)
+#   - CCNA_MAX_REQUESTS         recycle a worker after this many requests (0 = never)
+#   - CCNA_TORCH_THREADS        intra-op threads per worker (default: CPUs / workers)
+# ----------------------------------------------------------------------------------------
+bind = os.getenv("CCNA_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("CCNA_WORKERS", str(multiprocessing.cpu_count())))
+worker_class = os.getenv("CCNA_WORKER_CLASS", "gthread")
+threads = int(os.getenv("CCNA_WORKER_THREADS", "64"))
+worker_connections = int(os.getenv("CCNA_WORKER_CONNECTIONS", "1000"))
+timeout = int(os.getenv("CCNA_WORKER_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("CCNA_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("CCNA_KEEPALIVE", "5"))
+max_requests = int(os.getenv("CCNA_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+preload_app = True
+
+torch_threads = int(os.getenv("CCNA_TORCH_THREADS", str(max(multiprocessing.cpu_count() // workers, 1))))
+
+if worker_class == "gevent":
+    # Must happen before app.py (and its locks, sockets and threads) is imported
+    from gevent import monkey
+    monkey.patch_all()
+
+# ----------------------------------------------------------------------------------------
+# Process-wide state that must be shared or split between workers. These defaults
+# are read when the app is preloaded, so they are set here, before that happens.
+#   - Exam sessions must be visible to every worker: with several workers they are
+#     kept in PostgreSQL (sessions.py) unless CCNA_SESSION_STORE says otherwise.
+#   - The LLM quota of the deployment is split evenly between the workers.
+#   - Prometheus metrics are written to a directory shared by the workers, so that
+#     /metrics reports all of them whichever worker serves it.
+# ----------------------------------------------------------------------------------------
+if workers > 1:
+    os.environ.setdefault("CCNA_SESSION_STORE", "postgres")
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="ccna-metrics-"))
+os.environ.setdefault("CCNA_LLM_QUOTA_SHARES", str(workers))
+
+
+# ----------------------------------------------------------------------------------------
+# post_fork:
+#   - Database connections opened by the master while preloading must not be used
+#     by the children: the pool is dropped without closing the sockets (closing
+#     them would terminate the master's sessions), and each worker opens its own.
+#   - Threads do not survive fork(), so the encoder's micro-batching thread is
+#     started again in every worker. The sampling profiler (CCNA_PROFILE=1) is only
+#     started here, so the master, which serves no requests, is never sampled.
+# ----------------------------------------------------------------------------------------
+def post_fork(server, worker):
+    import db
+    import embedding_service
+    import metrics
+
+    db.reset_pool(close=False)
+    embedding_service.reset_after_fork(torch_threads)
+    metrics.start_profiler()
+    server.log.info("Worker %s ready (torch threads: %s)", worker.pid, torch_threads)
+
+
+# Drops the live gauges (DB connections in use) of a worker that exited
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
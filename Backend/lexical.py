@@ -0,0 +1,180 @@
+import hashlib                 # Normalized-text fingerprints
+import os                      # Atomic replacement of the index file
+import re                      # Tokenization
+import numpy as np             # Compact postings arrays and vectorized scoring
+
+# -------------------------------------------------------------------------
+# BM25 lexical index:
+#   - Built once at index time (preprocess.py) and saved as one .npz file:
+#       vocab          : '\n'-joined sorted terms (uint8 bytes)
+#       term_offsets   : postings of term t are [term_offsets[t], term_offsets[t+1])
+#       postings_docs  : document positions (int32)
+#       postings_tf    : term frequencies (uint16)
+#       doc_lengths    : tokens per document (int32)
+#       doc_ids        : PostgreSQL ids (int64)
+#       text_offsets / text_bytes : packed utf-8 question texts
+#   - Queries are scored with one vectorized update per query term, over
+#     the postings of the query terms only.
+# -------------------------------------------------------------------------
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_token_pattern = re.compile(r"[a-z0-9]+")
+
+# Words that carry no topic information; they never count as a lexical match
+STOPWORDS = frozenset("""
+a about an and are as at be by can do does for from how i in is it of on or
+should that the this to what when where which who why with you your me my
+""".split())
+
+
+def tokenize(text):
+    return [token for token in _token_pattern.findall(text.lower()) if token not in STOPWORDS]
+
+
+# Hash of the text with case, punctuation and spacing removed: questions that
+# only differ in those share a fingerprint (used to detect duplicates)
+def fingerprint(text):
+    return hashlib.sha1(" ".join(_token_pattern.findall(text.lower())).encode("utf-8")).hexdigest()
+
+
+def _pack_strings(strings):
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+class BM25Index:
+    def __init__(self, vocab, term_offsets, postings_docs, postings_tf, doc_lengths, doc_ids,
+                 text_offsets, text_bytes):
+        self.vocab = {term: i for i, term in enumerate(vocab)}
+        self.term_offsets = term_offsets
+        self.postings_docs = postings_docs
+        self.postings_tf = postings_tf.astype(np.float32)
+        self.doc_lengths = doc_lengths
+        self.doc_ids = doc_ids
+        self.text_offsets = text_offsets
+        self.text_bytes = text_bytes
+
+        n_docs = len(doc_ids)
+        doc_freq = np.diff(term_offsets).astype(np.float32)
+        self.idf = np.log1p((n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+
+        # Per-document length normalization, precomputed once
+        avg_length = float(doc_lengths.mean()) if n_docs else 1.0
+        self.length_norm = (BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths / max(avg_length, 1e-9))).astype(np.float32)
+
+    # ---------------------------------------------------------------------
+    # build: create an index from parallel lists of ids and texts.
+    # ---------------------------------------------------------------------
+    @classmethod
+    def build(cls, ids, texts):
+        postings = {}
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+        for position, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[position] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.setdefault(token, []).append((position, count))
+
+        vocab = sorted(postings)
+        term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum([len(postings[term]) for term in vocab], out=term_offsets[1:])
+        flat = [entry for term in vocab for entry in postings[term]]
+        postings_docs = np.array([position for position, _ in flat], dtype=np.int32)
+        postings_tf = np.array([min(count, 65535) for _, count in flat], dtype=np.uint16)
+
+        text_offsets, text_bytes = _pack_strings(texts)
+        return cls(vocab, term_offsets, postings_docs, postings_tf, doc_lengths,
+                   np.asarray(ids, dtype=np.int64), text_offsets, text_bytes)
+
+    def save(self, path):
+        vocab = sorted(self.vocab, key=self.vocab.get)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            vocab=np.frombuffer("\n".join(vocab).encode("utf-8"), dtype=np.uint8),
+            term_offsets=self.term_offsets,
+            postings_docs=self.postings_docs,
+            postings_tf=self.postings_tf.astype(np.uint16),
+            doc_lengths=self.doc_lengths,
+            doc_ids=self.doc_ids,
+            text_offsets=self.text_offsets,
+            text_bytes=self.text_bytes,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            raw_vocab = data["vocab"].tobytes().decode("utf-8")
+            return cls(
+                raw_vocab.split("\n") if raw_vocab else [],
+                data["term_offsets"], data["postings_docs"], data["postings_tf"],
+                data["doc_lengths"], data["doc_ids"], data["text_offsets"], data["text_bytes"],
+            )
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def text(self, position):
+        start, end = self.text_offsets[position], self.text_offsets[position + 1]
+        return self.text_bytes[start:end].tobytes().decode("utf-8")
+
+    # Query terms that exist in the bank (the cheap pre-check)
+    def known_terms(self, tokens):
+        return [token for token in dict.fromkeys(tokens) if token in self.vocab]
+
+    # ---------------------------------------------------------------------
+    # query: top_k hits as {"id", "question", "bm25"}, where "bm25" is the
+    # raw score divided by its upper bound (k1 + 1) * sum(idf of known
+    # terms), so it lies in [0, 1] and thresholds carry across queries.
+    # ---------------------------------------------------------------------
+    def query(self, query, top_k):
+        terms = self.known_terms(tokenize(query))
+        if not terms or not len(self.doc_ids):
+            return []
+
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        upper_bound = 0.0
+        for term in terms:
+            t = self.vocab[term]
+            start, end = self.term_offsets[t], self.term_offsets[t + 1]
+            docs = self.postings_docs[start:end]
+            tf = self.postings_tf[start:end]
+            idf = self.idf[t]
+            # docs are unique within one postings list, so fancy-index += is safe
+            scores[docs] += idf * tf * (BM25_K1 + 1) / (tf + self.length_norm[docs])
+            upper_bound += idf * (BM25_K1 + 1)
+
+        k = min(top_k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {"id": int(self.doc_ids[i]), "question": self.text(i), "bm25": float(scores[i] / upper_bound)}
+            for i in top
+        ]
+
+
+# -------------------------------------------------------------------------
+# reciprocal_rank_fusion:
+#   - Merges several ranked hit lists; a hit's fused score is
+#     sum(1 / (k + rank)) over the lists it appears in.
+#   - Fields of the same id coming from different lists are merged, so a
+#     fused hit keeps both its vector "score" and its "bm25" score.
+# -------------------------------------------------------------------------
+def reciprocal_rank_fusion(hit_lists, top_k, k=60):
+    fused = {}
+    for hits in hit_lists:
+        for rank, hit in enumerate(hits, start=1):
+            entry = fused.setdefault(hit["id"], {"rrf": 0.0})
+            entry.update(hit)
+            entry["rrf"] += 1.0 / (k + rank)
+    ranked = sorted(fused.values(), key=lambda hit: hit["rrf"], reverse=True)
+    return ranked[:top_k]
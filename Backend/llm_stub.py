@@ -0,0 +1,163 @@
+import argparse                # Command-line options for the stub server
+import hashlib                 # Deterministic "answers"
+import json                    # Request/response bodies of the stub server
+import time                    # Optional simulated latency
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+
+# Deterministic feedback text for a prompt
+def stub_content(prompt):
+    digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+    return (
+        f"[stub feedback {digest}] Review the concept behind this question and compare "
+        f"the chosen option with the correct one.\n"
+        f"Study: networking fundamentals"
+    )
+
+# ----------------------------------------------------------------------------------------
+# StubChatClient:
+#   - Drop-in stand-in for the AzureOpenAI client (client.chat.completions.create)
+#     that never touches the network.
+#   - Produces deterministic text derived from the prompt, so offline jobs such as
+#     warm_feedback.py and local development run without API keys.
+#   - latency (seconds) is slept on every call to imitate a real model.
+#   - stream=True returns an iterator of chunks (choices[0].delta.content), one per
+#     word, like the streaming API.
+# ----------------------------------------------------------------------------------------
+class StubChatClient:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model=None, messages=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+
+        prompt = messages[-1]["content"] if messages else ""
+        content = stub_content(prompt)
+        if kwargs.get("stream"):
+            return self._stream(content)
+
+        prompt_tokens = len(prompt.split())
+        completion_tokens = len(content.split())
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            ),
+        )
+
+    @staticmethod
+    def _stream(content):
+        for word in content.split(" "):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))])
+
+
+# ----------------------------------------------------------------------------------------
+# Stub Azure OpenAI server:
+#   - Answers POST /openai/deployments/<deployment>/chat/completions like Azure
+#     OpenAI does (plain JSON, or Server-Sent Events chunks with "stream": true),
+#     so the real SDK and HTTP path can be exercised offline, e.g. by
+#     benchmark.py with AZURE_OPENAI_ENDPOINT=http://127.0.0.1:<port>.
+#   - latency is slept before the first byte; token_delay between streamed words.
+# ----------------------------------------------------------------------------------------
+class StubChatRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive
+    latency = 0.0
+    token_delay = 0.0
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        if not path.endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": "Not found"}})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+            messages = request["messages"]
+        except (ValueError, KeyError, TypeError) as e:
+            return self._send_json(400, {"error": {"message": f"Invalid request: {e}"}})
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        prompt = messages[-1]["content"] if messages else ""
+        content = stub_content(prompt)
+        model = request.get("model") or "stub"
+        created = int(time.time())
+        if request.get("stream"):
+            return self._stream(content, model, created)
+
+        prompt_tokens = len(prompt.split())
+        completion_tokens = len(content.split())
+        self._send_json(200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def _stream(self, content, model, created):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            last = i == len(words) - 1
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop" if last else None,
+                             "delta": {"content": word if last else word + " "}}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if self.token_delay:
+                time.sleep(self.token_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host, port, latency=0.0, token_delay=0.0):
+    handler = type("StubChatRequestHandler", (StubChatRequestHandler,),
+                   {"latency": latency, "token_delay": token_delay})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline stand-in for the Azure OpenAI chat completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5002)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before the first byte of a response.")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds between streamed words.")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.token_delay)
+    print(f"Stub chat completions API listening on http://{args.host}:{args.port} "
+          f"(latency {args.latency}s, token delay {args.token_delay}s)")
+    server.serve_forever()
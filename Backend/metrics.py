@@ -0,0 +1,168 @@
+import atexit                                  # Final profile dump
+import contextvars                             # Per-request span list for Server-Timing
+import os                                      # Settings from environment variables
+import sys                                     # Stack sampling
+import threading                               # Sampling profiler thread
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import REGISTRY, multiprocess
+
+# ----------------------------------------------------------------------------------------
+# Instrumentation:
+#   - span(stage) times one stage of a request (encode, vector query, DB
+#     lookup, LLM call, ...). Every span is observed in the
+#     ccna_stage_seconds histogram and, when it runs on the request thread,
+#     added to that response's Server-Timing header (see app.py).
+#   - Counters for cache hits, DB pool usage, LLM tokens and retries.
+#   - Cost on the hot path: two perf_counter() calls and one histogram
+#     observation per span.
+#   - With several gunicorn workers set PROMETHEUS_MULTIPROC_DIR (done by
+#     gunicorn.conf.py) so /metrics aggregates every worker.
+# ----------------------------------------------------------------------------------------
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram("ccna_stage_seconds", "Time spent per request stage", ["stage"], buckets=STAGE_BUCKETS)
+REQUEST_SECONDS = Histogram("ccna_request_seconds", "Request latency per endpoint",
+                            ["endpoint", "status"], buckets=STAGE_BUCKETS)
+CACHE_EVENTS = Counter("ccna_cache_events_total", "Cache lookups by cache and outcome", ["cache", "event"])
+DB_POOL_IN_USE = Gauge("ccna_db_pool_in_use", "Database connections checked out", multiprocess_mode="livesum")
+DB_POOL_TIMEOUTS = Counter("ccna_db_pool_timeouts_total", "Checkouts that timed out waiting for a connection")
+LLM_CALLS = Counter("ccna_llm_calls_total", "Model calls by model and outcome", ["model", "outcome"])
+LLM_TOKENS = Counter("ccna_llm_tokens_total", "Model tokens by direction", ["model", "direction"])
+LLM_RETRIES = Counter("ccna_llm_retries_total", "Retried model calls by error type", ["reason"])
+
+_timings = contextvars.ContextVar("ccna_timings", default=None)
+
+
+# ----------------------------------------------------------------------------------------
+# Request-scoped timings (Server-Timing)
+# ----------------------------------------------------------------------------------------
+def start_request():
+    _timings.set([])
+
+
+def request_timings():
+    return _timings.get() or []
+
+
+def server_timing_header(timings):
+    # Repeated stages (e.g. two DB lookups) are summed into one entry
+    totals = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000.0:.2f}" for stage, seconds in totals.items())
+
+
+@contextmanager
+def span(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def record_cache(cache, hit):
+    CACHE_EVENTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_llm_usage(model, usage):
+    if usage is None:
+        return
+    LLM_TOKENS.labels(model, "prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    LLM_TOKENS.labels(model, "completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+
+# ----------------------------------------------------------------------------------------
+# exposition: Prometheus text format of this process, or of all worker
+# processes in multiprocess mode.
+# ----------------------------------------------------------------------------------------
+def exposition():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+# ----------------------------------------------------------------------------------------
+# Sampling profiler (off unless CCNA_PROFILE=1):
+#   - A daemon thread samples the stacks of all threads every
+#     CCNA_PROFILE_INTERVAL_MS and counts them in collapsed-stack format
+#     ("module:function;module:function count" lines, as consumed by
+#     flamegraph.pl / speedscope).
+#   - The counts are written to CCNA_PROFILE_DIR/profile-<pid>.folded every
+#     CCNA_PROFILE_DUMP_SECONDS and at exit.
+# ----------------------------------------------------------------------------------------
+PROFILE_ENABLED = os.getenv("CCNA_PROFILE") == "1"
+PROFILE_INTERVAL = float(os.getenv("CCNA_PROFILE_INTERVAL_MS", "10")) / 1000.0
+PROFILE_DIR = os.getenv("CCNA_PROFILE_DIR", ".")
+PROFILE_DUMP_SECONDS = float(os.getenv("CCNA_PROFILE_DUMP_SECONDS", "60"))
+
+
+class StackSampler:
+    def __init__(self, interval=PROFILE_INTERVAL, directory=PROFILE_DIR, dump_seconds=PROFILE_DUMP_SECONDS):
+        self.interval = interval
+        self.directory = directory
+        self.dump_seconds = dump_seconds
+        self.stacks = _Tally()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f"profile-{os.getpid()}.folded")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        next_dump = time.monotonic() + self.dump_seconds
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, frame in frames.items():
+                    if thread_id == own:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+                        frame = frame.f_back
+                    self.stacks[";".join(reversed(stack))] += 1
+            if time.monotonic() >= next_dump:
+                self.dump()
+                next_dump = time.monotonic() + self.dump_seconds
+
+    def dump(self):
+        with self._lock:
+            lines = [f"{stack} {count}\n" for stack, count in self.stacks.most_common()]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        os.replace(tmp_path, self.path)
+
+
+_profiler = None
+
+
+# Starts the profiler of this process. Only serving processes call it (gunicorn's
+# post_fork, app.py's dev server), never the preloading gunicorn master.
+def start_profiler():
+    global _profiler
+    if not PROFILE_ENABLED:
+        return None
+    if _profiler is None:
+        _profiler = StackSampler()
+        atexit.register(_profiler.dump)
+        _profiler.start()
+    return _profiler
@@ -1,67 +1,312 @@
-import psycopg2                                     # PostgreSQL database adapter
-from sentence_transformers import SentenceTransformer  # Library for generating sentence embeddings
-import chromadb                                      # ChromaDB for vector storage and querying
-
-# ----------------------------------------------------------------------------
-# 1. Initialize the ChromaDB client:
-#    - PersistentClient stores data on disk at the specified path ("./chroma_db").
-#    - This allows embeddings to persist across script runs.
-# ----------------------------------------------------------------------------
-client = chromadb.PersistentClient(path="./chroma_db")
-
-# ----------------------------------------------------------------------------
-# 2. Get or create a collection in ChromaDB:
-#    - The collection is named "ccna_embeddings".
-#    - If the collection doesn't exist, it's created; otherwise the existing
-#      collection is returned.
-# ----------------------------------------------------------------------------
-collection = client.get_or_create_collection(name="ccna_embeddings")
-
-# ----------------------------------------------------------------------------
-# 3. Initialize the SentenceTransformer model:
-#    - 'all-MiniLM-L6-v2' is a popular lightweight model for embedding sentences.
-# ----------------------------------------------------------------------------
-model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-
-# ----------------------------------------------------------------------------
-# 4. Connect to the PostgreSQL database:
-#    - Update the credentials as needed (dbname, user, password, host).
-# ----------------------------------------------------------------------------
-conn = psycopg2.connect(
-    dbname="ccna_db",
-    user="postgres",
-    password="23058113",
-    host="localhost"
-)
-
-# ----------------------------------------------------------------------------
-# Function: preprocess_questions
-#   - Fetches questions from the PostgreSQL database.
-#   - Creates embeddings for each question using the SentenceTransformer model.
-#   - Inserts the question texts and their embeddings into the ChromaDB collection.
-# ----------------------------------------------------------------------------
-def preprocess_questions():
-    # Open a cursor to perform database operations
-    with conn.cursor() as cur:
-        # Retrieve question IDs and text from the 'questions' table
-        cur.execute("SELECT id, question FROM questions")
-        questions = cur.fetchall()
-
-    # Loop through each question record
-    for qid, question in questions:
-        # Encode the question text into a vector using the Transformer model
-        embedding = model.encode([question])[0]
-        
-        # Add the question text and its embedding to the ChromaDB collection
-        collection.add(
-            documents=[question],
-            embeddings=[embedding],
-            ids=[str(qid)]
-        )
-
-# ----------------------------------------------------------------------------
-# Main entry point:
-#   - Calls the preprocess_questions function when the script is executed.
-# ----------------------------------------------------------------------------
-if __name__ == "__main__":
-    preprocess_questions()
+import argparse                                     # Command-line options for batch size, workers, etc.
+import hashlib                                      # Content hashes to detect unchanged questions
+import json                                         # Checkpoint file serialization
+import os                                           # Filesystem helpers for the checkpoint file
+import time                                         # Timing information for progress reporting
+import db                                           # Pooled PostgreSQL connections
+from lexical import BM25Index                       # BM25 index built alongside the embeddings
+from topics import cluster_topics                   # Topic clusters for /exam
+from banks import DEFAULT_BANK, bank_file, collection_name, table_name  # Per-bank collection, table and files
+from embeddings import TorchEmbedder, backend_id, load_model, record_backend  # Embedding backends
+import chromadb                                      # ChromaDB for vector storage and querying
+
+# ----------------------------------------------------------------------------
+# Indexing settings:
+#   - The embedding backend id (model + torch/onnx) is recorded in every
+#     content hash, so switching models or backends forces a full
+#     re-embedding instead of silently mixing vector spaces.
+#   - CHECKPOINT_PATH remembers the last fully indexed id of an interrupted run.
+#   - One run indexes one question bank (--bank or CCNA_BANK, see banks.py);
+#     use_bank() points the module at that bank's table, collection and files.
+# ----------------------------------------------------------------------------
+EMBEDDING_ID = backend_id()
+CHROMA_PATH = "./chroma_db"
+DEFAULT_BATCH_SIZE = 256
+
+# ----------------------------------------------------------------------------
+# 1. Initialize the ChromaDB client:
+#    - PersistentClient stores data on disk at the specified path ("./chroma_db").
+#    - This allows embeddings to persist across script runs.
+# ----------------------------------------------------------------------------
+client = chromadb.PersistentClient(path=CHROMA_PATH)
+
+# ----------------------------------------------------------------------------
+# 2. Get or create the collection of the bank in ChromaDB:
+#    - The collection is named "<bank>_embeddings" ("ccna_embeddings" by default).
+#    - If the collection doesn't exist, it's created; otherwise the existing
+#      collection is returned.
+# ----------------------------------------------------------------------------
+def use_bank(bank):
+    global BANK, QUESTIONS_TABLE, CHECKPOINT_PATH, INDEX_VERSION_PATH, BM25_INDEX_PATH, collection
+    BANK = bank
+    QUESTIONS_TABLE = table_name(bank)
+    CHECKPOINT_PATH = os.path.join(CHROMA_PATH, bank_file(bank, "preprocess_checkpoint.json"))
+    INDEX_VERSION_PATH = os.path.join(CHROMA_PATH, bank_file(bank, "INDEX_VERSION"))
+    BM25_INDEX_PATH = os.path.join(CHROMA_PATH, bank_file(bank, "bm25_index.npz"))
+    collection = client.get_or_create_collection(name=collection_name(bank))
+
+
+use_bank(os.getenv("CCNA_BANK", DEFAULT_BANK))
+
+# ----------------------------------------------------------------------------
+# 3. Initialize the embedding model:
+#    - 'all-MiniLM-L6-v2' is a popular lightweight model for embedding sentences.
+#    - CCNA_EMBEDDING_BACKEND picks PyTorch or the int8 ONNX graph; search.py
+#      must run with the same setting.
+# ----------------------------------------------------------------------------
+model = load_model()
+
+# ----------------------------------------------------------------------------
+# Content hashing:
+#   - The hash covers the embedding backend and the exact question text.
+#   - It is stored as Chroma metadata, so a re-run can tell which rows are
+#     new or edited without re-encoding anything.
+# ----------------------------------------------------------------------------
+def content_hash(question):
+    return hashlib.sha256(f"{EMBEDDING_ID}\n{question}".encode("utf-8")).hexdigest()
+
+# ----------------------------------------------------------------------------
+# Checkpoint helpers:
+#   - The checkpoint stores the highest id whose batch was fully upserted, and
+#     whether the interrupted run already changed the collection ("dirty"): a
+#     resumed run may then have nothing left to embed, but must still rebuild
+#     the BM25 index and topic clusters and bump the index version.
+#   - Writes go through a temporary file + os.replace so a crash never leaves
+#     a half-written checkpoint behind.
+# ----------------------------------------------------------------------------
+# Returns (last_id, dirty)
+def load_checkpoint():
+    try:
+        with open(CHECKPOINT_PATH, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return 0, False
+
+    dirty = bool(checkpoint.get("dirty", False))
+    # A checkpoint written for another model/backend is useless: start over
+    if checkpoint.get("model") != EMBEDDING_ID:
+        return 0, dirty
+    return int(checkpoint.get("last_id", 0)), dirty
+
+
+def save_checkpoint(last_id, dirty=False):
+    os.makedirs(os.path.dirname(CHECKPOINT_PATH), exist_ok=True)
+    tmp_path = CHECKPOINT_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"model": EMBEDDING_ID, "last_id": last_id, "dirty": dirty}, f)
+    os.replace(tmp_path, CHECKPOINT_PATH)
+
+
+def clear_checkpoint():
+    try:
+        os.remove(CHECKPOINT_PATH)
+    except FileNotFoundError:
+        pass
+
+# ----------------------------------------------------------------------------
+# Index version marker:
+#   - Rewritten whenever a run changed the collection; search.py watches it
+#     to reload its in-memory index and drop cached results.
+# ----------------------------------------------------------------------------
+def bump_index_version():
+    tmp_path = INDEX_VERSION_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(str(time.time_ns()))
+    os.replace(tmp_path, INDEX_VERSION_PATH)
+
+# ----------------------------------------------------------------------------
+# Function: iter_question_batches
+#   - Streams (id, question) rows with a server-side (named) cursor, so the
+#     whole table is never materialized in memory.
+#   - Rows are ordered by id, which is what makes the checkpoint meaningful.
+# ----------------------------------------------------------------------------
+def iter_question_batches(conn, start_after_id, batch_size):
+    with conn.cursor(name="preprocess_questions") as cur:
+        cur.itersize = batch_size
+        cur.execute(
+            f"SELECT id, question FROM {QUESTIONS_TABLE} WHERE id > %s ORDER BY id",
+            (start_after_id,)
+        )
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+
+# ----------------------------------------------------------------------------
+# Function: encode_texts
+#   - Encodes a list of texts in one batched call.
+#   - When a multi-process pool is given (PyTorch backend only), the work is
+#     spread across processes.
+# ----------------------------------------------------------------------------
+def encode_texts(texts, batch_size, pool=None):
+    if pool is not None:
+        return model.model.encode_multi_process(texts, pool, batch_size=batch_size, normalize_embeddings=True)
+    return model.encode(texts, batch_size=batch_size)
+
+# ----------------------------------------------------------------------------
+# Function: index_batch
+#   - Looks up the stored content hashes of one batch in a single Chroma call.
+#   - Re-embeds only the rows whose hash is missing or different.
+#   - Writes all changed rows back with one bulk upsert. The new hash is merged
+#     into the stored metadata, so the duplicate_of (dedupe.py) and
+#     topic_cluster (topics.py) marks of an edited question are kept.
+#   - Returns the number of rows that were (re-)embedded.
+# ----------------------------------------------------------------------------
+def index_batch(rows, batch_size, pool=None):
+    ids = [str(qid) for qid, _ in rows]
+    existing = collection.get(ids=ids, include=["metadatas"])
+    stored = {doc_id: metadata or {} for doc_id, metadata in zip(existing["ids"], existing["metadatas"])}
+
+    changed_ids, changed_docs, changed_meta = [], [], []
+    for doc_id, (_, question) in zip(ids, rows):
+        digest = content_hash(question)
+        metadata = stored.get(doc_id, {})
+        if metadata.get("content_hash") != digest:
+            changed_ids.append(doc_id)
+            changed_docs.append(question)
+            changed_meta.append({**metadata, "content_hash": digest})
+
+    if not changed_ids:
+        return 0
+
+    embeddings = encode_texts(changed_docs, batch_size, pool)
+    collection.upsert(
+        ids=changed_ids,
+        documents=changed_docs,
+        embeddings=[embedding.tolist() for embedding in embeddings],
+        metadatas=changed_meta
+    )
+    return len(changed_ids)
+
+# ----------------------------------------------------------------------------
+# Function: prune_deleted
+#   - Removes embeddings whose question no longer exists in PostgreSQL.
+# ----------------------------------------------------------------------------
+def prune_deleted():
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute(f"SELECT id FROM {QUESTIONS_TABLE}")
+        live_ids = {str(qid) for (qid,) in cur.fetchall()}
+
+    stale_ids = [doc_id for doc_id in collection.get(include=[])["ids"] if doc_id not in live_ids]
+    if stale_ids:
+        collection.delete(ids=stale_ids)
+    return len(stale_ids)
+
+# ----------------------------------------------------------------------------
+# Function: build_bm25_index
+#   - Rebuilds the BM25 lexical index over the whole question bank and saves
+#     it next to the Chroma data, where search.py loads it from.
+#   - Questions marked as near-duplicates by dedupe.py are left out.
+# ----------------------------------------------------------------------------
+def build_bm25_index(batch_size=DEFAULT_BATCH_SIZE):
+    marked = collection.get(where={"duplicate_of": {"$gte": 0}}, include=[])["ids"]
+    duplicates = {int(doc_id) for doc_id in marked}
+
+    ids, texts = [], []
+    with db.connection() as conn:
+        for rows in iter_question_batches(conn, 0, batch_size):
+            ids.extend(qid for qid, _ in rows if qid not in duplicates)
+            texts.extend(question for qid, question in rows if qid not in duplicates)
+
+    BM25Index.build(ids, texts).save(BM25_INDEX_PATH)
+    return len(ids)
+
+# ----------------------------------------------------------------------------
+# Function: preprocess_questions
+#   - Streams questions from the PostgreSQL database in batches.
+#   - Creates embeddings only for new or edited questions.
+#   - Upserts them into the ChromaDB collection and checkpoints after every
+#     batch, so an interrupted run resumes where it stopped.
+#   - Rebuilds the BM25 index and the topic clusters whenever the collection
+#     changed, in this run or in the interrupted run it resumes (or when
+#     recluster is set).
+# ----------------------------------------------------------------------------
+def preprocess_questions(batch_size=DEFAULT_BATCH_SIZE, processes=1, restart=False, prune=False,
+                         recluster=False, clusters=None):
+    start_after_id, dirty = load_checkpoint()
+    if restart:
+        start_after_id = 0
+    if start_after_id:
+        print(f"Resuming bank {BANK} after question id {start_after_id}")
+
+    # Optionally spread encoding across several worker processes
+    pool = None
+    if processes > 1:
+        if isinstance(model, TorchEmbedder):
+            pool = model.model.start_multi_process_pool(target_devices=["cpu"] * processes)
+        else:
+            print("--processes is ignored by the ONNX backend (onnxruntime already uses all cores)")
+
+    scanned = embedded = 0
+    started = time.perf_counter()
+    try:
+        # The named cursor lives inside one transaction on one pooled connection
+        with db.connection() as conn:
+            for rows in iter_question_batches(conn, start_after_id, batch_size):
+                count = index_batch(rows, batch_size, pool)
+                embedded += count
+                scanned += len(rows)
+                dirty = dirty or count > 0
+                start_after_id = rows[-1][0]
+                save_checkpoint(start_after_id, dirty)
+    finally:
+        if pool is not None:
+            model.model.stop_multi_process_pool(pool)
+
+    pruned = prune_deleted() if prune else 0
+    if pruned:
+        dirty = True
+        save_checkpoint(start_after_id, dirty)
+    # Record which backend produced the vectors so search.py can verify it
+    record_backend(collection)
+    changed = dirty or not os.path.exists(BM25_INDEX_PATH)
+    if changed:
+        build_bm25_index(batch_size)
+    topic_count = None
+    if changed or recluster:
+        topic_count = cluster_topics(collection, k=clusters, bank=BANK)
+        print(f"Clustered the questions into {topic_count} topics")
+        bump_index_version()
+
+    # The run completed: the next run should start from the beginning again
+    clear_checkpoint()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Scanned {scanned} questions, embedded {embedded}, "
+        f"skipped {scanned - embedded} unchanged, pruned {pruned} in {elapsed:.1f}s"
+    )
+    return {"scanned": scanned, "embedded": embedded, "pruned": pruned, "topics": topic_count}
+
+# ----------------------------------------------------------------------------
+# Main entry point:
+#   - Parses the command-line options and runs preprocess_questions.
+# ----------------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed CCNA questions into ChromaDB.")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Rows fetched, encoded and upserted per batch.")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Number of encoder processes (1 = encode in this process).")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore any checkpoint and scan the whole table.")
+    parser.add_argument("--prune", action="store_true",
+                        help="Delete embeddings of questions removed from PostgreSQL.")
+    parser.add_argument("--recluster", action="store_true",
+                        help="Recompute the topic clusters even if no question changed.")
+    parser.add_argument("--clusters", type=int, default=None,
+                        help="Number of topic clusters (default: CCNA_TOPIC_CLUSTERS or sqrt(questions / 2)).")
+    parser.add_argument("--bank", default=os.getenv("CCNA_BANK", DEFAULT_BANK),
+                        help="Question bank to index (default: CCNA_BANK or ccna).")
+    args = parser.parse_args()
+
+    use_bank(args.bank)
+    preprocess_questions(
+        batch_size=args.batch_size,
+        processes=args.processes,
+        restart=args.restart,
+        prune=args.prune,
+        recluster=args.recluster,
+        clusters=args.clusters
+    )
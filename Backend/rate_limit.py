@@ -0,0 +1,225 @@
+import email.utils             # HTTP-date form of Retry-After
+import logging
+import os                      # Quota and retry settings
+import random                  # Backoff jitter
+import threading               # Buckets are shared by every request thread
+import time
+from metrics import span, LLM_RETRIES    # Quota wait time and retry counters
+
+# ----------------------------------------------------------------------------------------
+# LLM quota settings (match them to the Azure OpenAI deployment):
+#   - CCNA_LLM_RPM / CCNA_LLM_TPM: requests and tokens per minute of the deployment.
+#   - CCNA_LLM_CONCURRENCY: model calls in flight at once, across all requests of
+#     one process.
+#   - CCNA_LLM_QUEUE_TIMEOUT: how long a call may wait for quota before giving up.
+#   - CCNA_LLM_MAX_RETRIES / CCNA_LLM_BACKOFF_BASE / CCNA_LLM_BACKOFF_MAX: retry
+#     policy for throttled and transient failures (seconds).
+#   - CCNA_LLM_QUOTA_SHARES: number of processes sharing the deployment (e.g. web
+#     workers); each process limits itself to its share of the RPM and TPM quota.
+# ----------------------------------------------------------------------------------------
+QUOTA_SHARES = max(int(os.getenv("CCNA_LLM_QUOTA_SHARES", "1")), 1)
+LLM_RPM = max(int(os.getenv("CCNA_LLM_RPM", "60")) // QUOTA_SHARES, 1)
+LLM_TPM = max(int(os.getenv("CCNA_LLM_TPM", "40000")) // QUOTA_SHARES, 1)
+LLM_CONCURRENCY = int(os.getenv("CCNA_LLM_CONCURRENCY", "8"))
+QUEUE_TIMEOUT = float(os.getenv("CCNA_LLM_QUEUE_TIMEOUT", "60"))
+MAX_RETRIES = int(os.getenv("CCNA_LLM_MAX_RETRIES", "6"))
+BACKOFF_BASE = float(os.getenv("CCNA_LLM_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("CCNA_LLM_BACKOFF_MAX", "30"))
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaTimeout(Exception):
+    pass
+
+
+# ----------------------------------------------------------------------------------------
+# TokenBucket:
+#   - Holds up to `capacity` units and refills at `per_minute` units per minute.
+#   - acquire(amount) blocks until the units are available (FIFO is not guaranteed,
+#     but every waiter is woken on refill) and raises QuotaTimeout after `timeout`.
+#   - A request larger than the capacity is clamped to it, so it can still pass
+#     once the bucket is full.
+# ----------------------------------------------------------------------------------------
+class TokenBucket:
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity or per_minute)
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1, timeout=None):
+        amount = min(float(amount), self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            while True:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait = (amount - self.available) / self.rate
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise QuotaTimeout(f"No LLM quota available within {timeout:g}s")
+                    wait = min(wait, remaining)
+                self.lock.wait(wait)
+
+    # Gives back (or, with a negative amount, takes) units once the real cost is known
+    def adjust(self, amount):
+        with self.lock:
+            self._refill()
+            self.available = min(self.capacity, self.available + amount)
+            self.lock.notify_all()
+
+
+# ----------------------------------------------------------------------------------------
+# RateLimiter:
+#   - One request bucket (RPM) and one token bucket (TPM) plus a semaphore bounding
+#     concurrent calls. Bursts queue here instead of being rejected by Azure.
+#   - Token cost is reserved up front from an estimate and corrected with the
+#     usage the API reports (settle).
+# ----------------------------------------------------------------------------------------
+class RateLimiter:
+    def __init__(self, rpm=LLM_RPM, tpm=LLM_TPM, concurrency=LLM_CONCURRENCY, timeout=QUEUE_TIMEOUT):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.timeout = timeout
+
+    def acquire(self, estimated_tokens):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise QuotaTimeout(f"No free LLM slot within {self.timeout:g}s")
+        try:
+            self.requests.acquire(1, self.timeout)
+            self.tokens.acquire(estimated_tokens, self.timeout)
+        except QuotaTimeout:
+            self.slots.release()
+            raise
+
+    def release(self):
+        self.slots.release()
+
+    def settle(self, estimated_tokens, actual_tokens):
+        if actual_tokens is not None:
+            self.tokens.adjust(estimated_tokens - actual_tokens)
+
+
+# ----------------------------------------------------------------------------------------
+# retry_after: server-requested delay of a failed call, from the Retry-After /
+# retry-after-ms headers of the OpenAI exception's response (None if absent).
+# ----------------------------------------------------------------------------------------
+def retry_after(exc):
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            when = email.utils.parsedate_to_datetime(value)
+            return max(0.0, when.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# Full-jitter exponential backoff, raised to the server's Retry-After when given
+def backoff_delay(attempt, exc=None):
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    server_delay = retry_after(exc) if exc is not None else None
+    if server_delay is not None:
+        delay = server_delay + random.uniform(0, BACKOFF_BASE)
+    return delay
+
+
+# Throttling, timeouts, connection drops and 5xx responses are worth retrying
+def is_retryable(exc):
+    try:
+        from openai import RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+    except ImportError:
+        return False
+    return isinstance(exc, (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError))
+
+
+# ----------------------------------------------------------------------------------------
+# HeldStream:
+#   - Wraps a streamed response so the limiter slot stays taken while the model is
+#     still generating; it is released once the stream is exhausted, fails or is
+#     closed (close() is also called when the wrapper is garbage collected).
+# ----------------------------------------------------------------------------------------
+class HeldStream:
+    def __init__(self, stream, limiter):
+        self.stream = stream
+        self.iterator = iter(stream)
+        self.limiter = limiter
+        self.released = False
+        self.lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.iterator)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        with self.lock:
+            if self.released:
+                return
+            self.released = True
+        try:
+            close = getattr(self.stream, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self.limiter.release()
+
+    def __del__(self):
+        self.close()
+
+
+# ----------------------------------------------------------------------------------------
+# call_with_retry:
+#   - Runs call() inside the limiter, retrying retryable failures with backoff.
+#   - call() returns (result, actual_tokens); actual_tokens may be None when the
+#     API reports no usage (e.g. streaming), in which case the estimate stands.
+#   - With stream=True the result is returned as a HeldStream that keeps the slot
+#     until it is consumed; only opening the stream is retried.
+#   - The last exception is re-raised once MAX_RETRIES is exhausted.
+# ----------------------------------------------------------------------------------------
+def call_with_retry(limiter, call, estimated_tokens, max_retries=MAX_RETRIES, stream=False):
+    attempt = 0
+    while True:
+        with span("llm_quota_wait"):
+            limiter.acquire(estimated_tokens)
+        try:
+            result, actual_tokens = call()
+        except Exception as e:
+            limiter.release()
+            if not is_retryable(e) or attempt >= max_retries:
+                raise
+            delay = backoff_delay(attempt, e)
+            LLM_RETRIES.labels(type(e).__name__).inc()
+            logger.warning(f"LLM call failed ({type(e).__name__}), retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+        else:
+            limiter.settle(estimated_tokens, actual_tokens)
+            if stream:
+                return HeldStream(result, limiter)
+            limiter.release()
+            return result
+        time.sleep(delay)
+        attempt += 1
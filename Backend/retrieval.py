@@ -0,0 +1,271 @@
+import os                      # Backend selection through an environment variable
+import threading               # Guards atomic swaps of the in-memory matrix
+import numpy as np             # Exact in-memory vector search
+from embeddings import EMBEDDING_DTYPE, backend_id  # Search matrix dtype, artifact backend check
+import artifact                # Memory-mapped question-bank artifact
+from banks import DEFAULT_BANK # Per-bank artifact directories
+
+# -------------------------------------------------------------------------
+# Retrieval backends:
+#   - A backend answers "which stored questions are closest to these query
+#     embeddings?" and returns, per query, a list of hits:
+#         {"id": <PostgreSQL id>, "question": <text>, "score": <cosine similarity>}
+#     sorted from best to worst.
+#   - "numpy"  : exact search over one contiguous float32 matrix held in memory.
+#   - "chroma" : approximate search through the Chroma collection.
+#   - "artifact": exact search over the memory-mapped float16 artifact built
+#     by artifact.py; needs neither Chroma nor PostgreSQL.
+#   - CCNA_RETRIEVAL_BACKEND selects the backend used by search.py.
+# -------------------------------------------------------------------------
+DEFAULT_BACKEND = os.getenv("CCNA_RETRIEVAL_BACKEND", "numpy")
+
+# Page size used when reading the whole collection out of Chroma
+LOAD_PAGE_SIZE = 5000
+
+# Rows of a float16 matrix upcast to float32 at a time while scoring
+SCORE_BLOCK_ROWS = 8192
+
+
+class RetrievalBackend:
+    name = "base"
+
+    # Returns one list of hits per row of query_embeddings
+    def query(self, query_embeddings, top_k):
+        raise NotImplementedError
+
+    # Re-reads the underlying index (e.g. after preprocess.py rebuilt it)
+    def reload(self):
+        pass
+
+    # Marker of the index this backend serves, if it changes independently of
+    # preprocess.py's INDEX_VERSION (see search.Shard.read_version)
+    def version(self):
+        return None
+
+    # {id: (correct_answer, incorrect_answers)} for backends that carry the
+    # answers; None means they must come from PostgreSQL
+    def answers(self, question_ids):
+        return None
+
+    # {id: unit-length float32 embedding} of stored questions (used to collapse
+    # near-duplicate hits); ids the backend does not hold are left out
+    def vectors(self, question_ids):
+        return {}
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+# -------------------------------------------------------------------------
+# ChromaBackend:
+#   - Thin wrapper over collection.query.
+#   - Chroma's default space is squared L2; for unit-length embeddings
+#     (all-MiniLM-L6-v2 normalizes its output) cosine = 1 - d / 2, which keeps
+#     scores comparable with the NumPy backend.
+#   - Questions marked duplicate_of by dedupe.py are skipped like in the other
+#     backends. A where filter cannot express "no duplicate_of key" (unmarked
+#     rows have none), so each query asks for top_k + <marked rows> results and
+#     drops the marked ones; the count is re-read by reload().
+# -------------------------------------------------------------------------
+class ChromaBackend(RetrievalBackend):
+    name = "chroma"
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.reload()
+
+    def reload(self):
+        self.marked = len(self.collection.get(where={"duplicate_of": {"$gte": 0}}, include=[])["ids"])
+
+    def query(self, query_embeddings, top_k):
+        results = self.collection.query(
+            query_embeddings=[np.asarray(embedding, dtype=np.float32).tolist() for embedding in query_embeddings],
+            n_results=top_k + self.marked,
+            include=["documents", "distances", "metadatas"]
+        )
+        return [
+            [
+                {"id": int(doc_id), "question": document, "score": 1.0 - float(distance) / 2.0}
+                for doc_id, document, distance, metadata in zip(ids, documents, distances, metadatas)
+                if (metadata or {}).get("duplicate_of", -1) < 0
+            ][:top_k]
+            for ids, documents, distances, metadatas in zip(
+                results["ids"], results["documents"], results["distances"], results["metadatas"]
+            )
+        ]
+
+    def vectors(self, question_ids):
+        if not question_ids:
+            return {}
+        stored = self.collection.get(ids=[str(qid) for qid in question_ids], include=["embeddings"])
+        return {
+            int(doc_id): np.asarray(embedding, dtype=np.float32) / max(float(np.linalg.norm(embedding)), 1e-12)
+            for doc_id, embedding in zip(stored["ids"], stored["embeddings"])
+        }
+
+    def __len__(self):
+        return self.collection.count()
+
+
+# -------------------------------------------------------------------------
+# NumpyBackend:
+#   - Holds L2-normalized embeddings in one C-contiguous float32 matrix, so a
+#     batch of queries is scored with a single BLAS matrix product.
+#   - argpartition selects the top_k in O(n) before sorting only those k.
+#   - The (matrix, ids, documents, id -> row lookup) snapshot is swapped
+#     atomically on reload, so concurrent queries always see a consistent one.
+#   - Questions marked as near-duplicates by dedupe.py (a "duplicate_of"
+#     metadata value >= 0) are not loaded.
+#   - With dtype="float16" the matrix takes half the memory; it is upcast
+#     block by block at query time so scoring still runs through float32 BLAS.
+# -------------------------------------------------------------------------
+class NumpyBackend(RetrievalBackend):
+    name = "numpy"
+
+    def __init__(self, collection=None, embeddings=None, ids=None, documents=None, dtype=EMBEDDING_DTYPE):
+        self.collection = collection
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.Lock()
+        if embeddings is not None:
+            self._set(np.asarray(embeddings, dtype=np.float32), ids, documents)
+        else:
+            self.reload()
+
+    @staticmethod
+    def _normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _set(self, embeddings, ids, documents):
+        if len(ids):
+            matrix = np.ascontiguousarray(self._normalize(embeddings.reshape(len(ids), -1)), dtype=self.dtype)
+        else:
+            matrix = np.zeros((0, 0), dtype=self.dtype)
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = {qid: i for i, qid in enumerate(ids.tolist())}
+        snapshot = (matrix, ids, list(documents), positions.get)
+        with self._lock:
+            self._snapshot = snapshot
+
+    # Reads every embedding out of the Chroma collection, page by page
+    def reload(self):
+        ids, documents, embeddings = [], [], []
+        offset = 0
+        while True:
+            page = self.collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=LOAD_PAGE_SIZE,
+                offset=offset
+            )
+            if not len(page["ids"]):
+                break
+            keep = [i for i, metadata in enumerate(page["metadatas"]) if (metadata or {}).get("duplicate_of", -1) < 0]
+            ids.extend(int(page["ids"][i]) for i in keep)
+            documents.extend(page["documents"][i] for i in keep)
+            embeddings.append(np.asarray(page["embeddings"], dtype=np.float32)[keep])
+            offset += len(page["ids"])
+
+        matrix = np.vstack(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+        self._set(matrix, ids, documents)
+
+    def vectors(self, question_ids):
+        with self._lock:
+            matrix, _, _, locate = self._snapshot
+        found = {}
+        for qid in question_ids:
+            i = locate(qid)
+            if i is not None:
+                found[qid] = matrix[i].astype(np.float32)
+        return found
+
+    def query(self, query_embeddings, top_k):
+        with self._lock:
+            matrix, ids, documents, _ = self._snapshot
+
+        queries = self._normalize(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        if not len(ids):
+            return [[] for _ in range(len(queries))]
+
+        k = min(top_k, len(ids))
+        scores = self._score(queries, matrix)                         # (n_queries, n_docs)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]          # unordered top-k per row
+        results = []
+        for row, candidates in zip(scores, top):
+            ranked = candidates[np.argsort(-row[candidates])]
+            results.append([
+                {"id": int(ids[i]), "question": documents[i], "score": float(row[i])}
+                for i in ranked
+            ])
+        return results
+
+    @staticmethod
+    def _score(queries, matrix):
+        if matrix.dtype == np.float32:
+            return queries @ matrix.T
+        scores = np.empty((len(queries), len(matrix)), dtype=np.float32)
+        for start in range(0, len(matrix), SCORE_BLOCK_ROWS):
+            block = matrix[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        return scores
+
+    def __len__(self):
+        return len(self._snapshot[1])
+
+
+# -------------------------------------------------------------------------
+# ArtifactBackend:
+#   - NumpyBackend scoring over the float16 matrix of the artifact named by
+#     CURRENT, used in place (np.frombuffer over the mmap): loading is O(1)
+#     and the pages are shared by every worker.
+#   - reload() maps the newly published artifact and swaps it in; queries
+#     still running on the old one keep it mapped until they finish.
+# -------------------------------------------------------------------------
+class ArtifactBackend(NumpyBackend):
+    name = "artifact"
+
+    def __init__(self, collection=None, directory=None):
+        self.directory = directory or artifact.ARTIFACT_DIR
+        self.dtype = np.dtype(np.float16)
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        bank = artifact.open_current(self.directory)
+        indexed = bank.metadata.get("embedding_backend")
+        if indexed and indexed != backend_id():
+            raise RuntimeError(
+                f"Artifact {bank.path!r} was embedded with {indexed!r} but this process uses "
+                f"{backend_id()!r}; rebuild it with artifact.py or set CCNA_EMBEDDING_BACKEND"
+            )
+        with self._lock:
+            self._snapshot = (bank.embeddings, bank.ids, bank.questions, bank.position)
+            self._bank = bank
+
+    def version(self):
+        return artifact.current_name(self.directory)
+
+    def answers(self, question_ids):
+        with self._lock:
+            bank = self._bank
+        return bank.answers(question_ids)
+
+
+BACKENDS = {
+    ChromaBackend.name: ChromaBackend,
+    NumpyBackend.name: NumpyBackend,
+    ArtifactBackend.name: ArtifactBackend,
+}
+
+
+# -------------------------------------------------------------------------
+# create_backend: build the backend named `name` on top of a Chroma collection
+# (the artifact backend maps the artifact of `bank` instead).
+# -------------------------------------------------------------------------
+def create_backend(collection, name=None, bank=DEFAULT_BANK):
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown retrieval backend {name!r}; choose one of {sorted(BACKENDS)}")
+    if name == ArtifactBackend.name:
+        return ArtifactBackend(collection, directory=artifact.artifact_dir(bank))
+    return BACKENDS[name](collection)
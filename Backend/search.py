@@ -1,43 +1,372 @@
-from sentence_transformers import SentenceTransformer  # Library for generating sentence embeddings
-import chromadb                                         # ChromaDB for vector storage and querying
-
-# -------------------------------------------------------------------------
-# 1. Initialize the SentenceTransformer model:
-#    - 'all-MiniLM-L6-v2' is a popular, lightweight sentence transformer
-#    - This model will generate embedding vectors for queries/questions.
-# -------------------------------------------------------------------------
-model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-
-# -------------------------------------------------------------------------
-# 2. Create a persistent ChromaDB client:
-#    - 'PersistentClient' ensures that data is stored on disk at './chroma_db'
-#    - This allows for data to persist across sessions.
-# -------------------------------------------------------------------------
-client_chroma = chromadb.PersistentClient(path="./chroma_db")
-
-# -------------------------------------------------------------------------
-# 3. Retrieve or create a collection in ChromaDB for CCNA embeddings:
-#    - The collection is identified by the name "ccna_embeddings".
-#    - If it doesn't exist, it will be created; otherwise, the existing one is returned.
-# -------------------------------------------------------------------------
-collection = client_chroma.get_or_create_collection(name="ccna_embeddings")
-
-# -------------------------------------------------------------------------
-# 4. Define a function to search questions based on a query:
-#    - top_k determines how many results to retrieve from the database (default=5).
-#    - The function encodes the user query into an embedding,
-#      then asks ChromaDB to return the most similar documents.
-# -------------------------------------------------------------------------
-def search_questions(query, top_k=5):
-    # Encode the user query into an embedding vector using the model
-    query_embedding = model.encode([query])[0]
-
-    # Query the ChromaDB collection for the top_k most similar documents
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=top_k,
-        include=["documents"]
-    )
-
-    # Return only the "documents" (i.e., the text data) from the query results
-    return results["documents"]
+import os                                              # Cache settings and the index version marker
+import threading                                        # Serializes index reloads
+import contextvars                                      # Carries request timings into shard threads
+import time                                             # Throttles index version checks
+from concurrent.futures import ThreadPoolExecutor       # Queries the bank shards in parallel
+from embedding_service import get_encoder              # Shared, micro-batched query encoder
+from retrieval import create_backend, DEFAULT_BACKEND  # Pluggable vector search backends (NumPy / Chroma / artifact)
+from cache import LRUCache                              # Bounded LRU/TTL cache with request coalescing
+from embeddings import check_backend                    # Index/query embedding backend consistency
+from lexical import BM25Index, reciprocal_rank_fusion, tokenize, fingerprint  # Lexical index and rank fusion
+from metrics import span                                # Per-stage timings
+from banks import BANKS, bank_file, collection_name     # Question-bank shards
+
+# -------------------------------------------------------------------------
+# 1. Get the query encoder ('all-MiniLM-L6-v2'):
+#    - With CCNA_EMBEDDING_SERVICE_URL set, queries are sent to the shared
+#      embedding sidecar and no model is loaded in this process.
+#    - Otherwise the model is loaded here and concurrent requests of this
+#      process are micro-batched into shared forward passes.
+# -------------------------------------------------------------------------
+encoder = get_encoder()
+
+# -------------------------------------------------------------------------
+# 2. Create a persistent ChromaDB client:
+#    - 'PersistentClient' ensures that data is stored on disk at './chroma_db'
+#    - This allows for data to persist across sessions.
+#    - With CCNA_RETRIEVAL_BACKEND=artifact the memory-mapped artifacts hold
+#      everything /search needs, and Chroma is not opened (nor imported).
+# -------------------------------------------------------------------------
+CHROMA_PATH = "./chroma_db"
+if DEFAULT_BACKEND == "artifact":
+    client_chroma = None
+else:
+    import chromadb                                     # ChromaDB for vector storage and querying
+    client_chroma = chromadb.PersistentClient(path=CHROMA_PATH)
+
+# -------------------------------------------------------------------------
+# Hybrid retrieval and relevance settings:
+#   - CANDIDATE_FACTOR: each retriever contributes top_k * factor candidates
+#     to reciprocal rank fusion.
+#   - A query is CCNA-related when its best vector score (cosine) reaches
+#     MIN_VECTOR_SCORE or its best normalized BM25 score reaches
+#     MIN_BM25_SCORE. calibrate_relevance.py chooses both thresholds together
+#     for this combined rule and reports its joint false-accept rate; "inf"
+#     disables one of the two signals.
+#   - With LEXICAL_PRECHECK on, a query none of whose words occur in the bank
+#     is rejected before any model inference. It also rejects synonyms and
+#     paraphrases the vector score would accept, so it stays off unless
+#     calibrate_relevance.py shows no positives failing it.
+#   - Two hits are near-duplicates when their stored embeddings reach
+#     DUPLICATE_THRESHOLD cosine similarity or their normalized texts match;
+#     only the better ranked one is returned. A threshold above 1 disables
+#     the embedding check.
+# -------------------------------------------------------------------------
+CANDIDATE_FACTOR = int(os.getenv("CCNA_CANDIDATE_FACTOR", "4"))
+DUPLICATE_THRESHOLD = float(os.getenv("CCNA_DUPLICATE_THRESHOLD", "0.95"))
+MIN_VECTOR_SCORE = float(os.getenv("CCNA_MIN_VECTOR_SCORE", "0.35"))
+MIN_BM25_SCORE = float(os.getenv("CCNA_MIN_BM25_SCORE", "0.30"))
+LEXICAL_PRECHECK = os.getenv("CCNA_LEXICAL_PRECHECK", "0") == "1"
+
+# -------------------------------------------------------------------------
+# 5. Query caches:
+#    - embedding_cache maps normalized query text -> query embedding. It never
+#      goes stale for a given model, so it has no TTL.
+#    - result_cache maps (index version, bank, normalized query, top_k) -> hits
+#      and expires after CCNA_RESULT_CACHE_TTL seconds.
+#    - Both coalesce concurrent identical lookups (see cache.py).
+# -------------------------------------------------------------------------
+embedding_cache = LRUCache(maxsize=int(os.getenv("CCNA_EMBEDDING_CACHE_SIZE", "4096")), name="embeddings")
+result_cache = LRUCache(
+    maxsize=int(os.getenv("CCNA_RESULT_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("CCNA_RESULT_CACHE_TTL", "300")),
+    name="search_results"
+)
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+# -------------------------------------------------------------------------
+# is_relevant: score-based accept/reject decision for a list of hits.
+# -------------------------------------------------------------------------
+def is_relevant(hits):
+    best_vector = max((hit.get("score", -1.0) for hit in hits), default=-1.0)
+    best_lexical = max((hit.get("bm25", 0.0) for hit in hits), default=0.0)
+    return best_vector >= MIN_VECTOR_SCORE or best_lexical >= MIN_BM25_SCORE
+
+
+# -------------------------------------------------------------------------
+# collapse_duplicates: the first top_k hits of a ranked candidate list that
+# are not near-duplicates of a better ranked hit. `vectors` maps hit ids to
+# their stored embeddings (from the retrieval backend).
+# -------------------------------------------------------------------------
+def collapse_duplicates(hits, top_k, vectors):
+    kept, kept_vectors, seen = [], [], set()
+    for hit in hits:
+        digest = fingerprint(hit["question"])
+        if digest in seen:
+            continue
+        vector = vectors.get(hit["id"])
+        if vector is not None and any(float(vector @ other) >= DUPLICATE_THRESHOLD for other in kept_vectors):
+            continue
+        seen.add(digest)
+        if vector is not None:
+            kept_vectors.append(vector)
+        kept.append(hit)
+        if len(kept) == top_k:
+            break
+    return kept
+
+
+# -------------------------------------------------------------------------
+# Shard: everything /search needs for one question bank (see banks.py).
+#   3. Its Chroma collection, "<bank>_embeddings" (not opened with the
+#      artifact backend).
+#   4. Its retrieval backend: by default an exact in-memory NumPy index
+#      loaded from the collection; set CCNA_RETRIEVAL_BACKEND=chroma to query
+#      Chroma directly instead, or CCNA_RETRIEVAL_BACKEND=artifact to map the
+#      artifact built by artifact.py.
+#   4b. Its BM25 lexical index built by preprocess.py (if present).
+#   6. Its index version:
+#      - preprocess.py rewrites the bank's INDEX_VERSION file whenever it
+#        changes the index; the artifact backend adds the name of the
+#        published artifact, so publishing a new one is picked up the same way.
+#      - The marker is checked at most every INDEX_CHECK_INTERVAL seconds;
+#        when it changes, the vector and BM25 indexes are reloaded and the
+#        result cache is dropped.
+# -------------------------------------------------------------------------
+INDEX_CHECK_INTERVAL = float(os.getenv("CCNA_INDEX_CHECK_INTERVAL", "1.0"))
+
+
+class Shard:
+    def __init__(self, bank):
+        self.bank = bank
+        if client_chroma is None:
+            self.collection = None
+        else:
+            self.collection = client_chroma.get_or_create_collection(name=collection_name(bank))
+            # Queries must be embedded by the same backend (torch / onnx) as the index
+            check_backend(self.collection)
+        self.backend = create_backend(self.collection, bank=bank)
+        self.bm25_path = os.path.join(CHROMA_PATH, bank_file(bank, "bm25_index.npz"))
+        self.version_path = os.path.join(CHROMA_PATH, bank_file(bank, "INDEX_VERSION"))
+        self.bm25 = self.load_bm25()
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+
+    def load_bm25(self):
+        try:
+            return BM25Index.load(self.bm25_path)
+        except OSError:
+            return None
+
+    def read_version(self):
+        try:
+            with open(self.version_path, "r", encoding="utf-8") as f:
+                version = f.read().strip()
+        except OSError:
+            version = None
+        backend_version = self.backend.version()
+        return version if backend_version is None else f"{version}:{backend_version}"
+
+    def _reload(self):
+        self.backend.reload()
+        self.bm25 = self.load_bm25()
+        result_cache.clear()
+
+    def invalidate(self):
+        with self._lock:
+            self._reload()
+            self._version = self.read_version()
+
+    def check_version(self):
+        now = time.monotonic()
+        if now - self._checked_at < INDEX_CHECK_INTERVAL:
+            return self._version
+
+        with self._lock:
+            if now - self._checked_at >= INDEX_CHECK_INTERVAL:
+                version = self.read_version()
+                if version != self._version:
+                    # Only reload when the marker changed after startup
+                    if self._checked_at:
+                        self._reload()
+                    self._version = version
+                self._checked_at = now
+        return self._version
+
+    # passes_precheck: cheap lexical gate run before any model inference
+    def passes_precheck(self, key):
+        if not LEXICAL_PRECHECK or self.bm25 is None:
+            return True
+        return bool(self.bm25.known_terms(tokenize(key)))
+
+    # ---------------------------------------------------------------------
+    # search: top_k hits per key for already encoded keys: one
+    # multi-embedding vector query, each ranking fused with its BM25 ranking
+    # via reciprocal rank fusion, and near-duplicates collapsed before the
+    # list is cut to top_k. Keys failing the pre-check get [].
+    # ---------------------------------------------------------------------
+    def search(self, keys, embeddings, top_k):
+        results = {key: [] for key in keys}
+        searchable = [key for key in keys if self.passes_precheck(key)]
+        if not searchable:
+            return results
+
+        candidates = top_k * CANDIDATE_FACTOR
+        lexical = self.bm25
+        with span("vector"):
+            vector_lists = self.backend.query([embeddings[key] for key in searchable], candidates)
+        for key, vector_hits in zip(searchable, vector_lists):
+            if lexical is None:
+                ranked = vector_hits
+            else:
+                with span("bm25"):
+                    lexical_hits = lexical.query(key, candidates)
+                ranked = reciprocal_rank_fusion([vector_hits, lexical_hits], candidates)
+            with span("collapse"):
+                vectors = self.backend.vectors([hit["id"] for hit in ranked]) if DUPLICATE_THRESHOLD <= 1 else {}
+                hits = collapse_duplicates(ranked, top_k, vectors)
+            for hit in hits:
+                hit["bank"] = self.bank
+                # Hits found by BM25 only get their cosine score, the common
+                # scale on which the results of several banks are merged
+                if "score" not in hit and hit["id"] in vectors:
+                    hit["score"] = float(vectors[hit["id"]] @ embeddings[key])
+            results[key] = hits
+        return results
+
+
+shards = {bank: Shard(bank) for bank in BANKS}
+
+# The first bank's collection and backend, for the offline tools
+# (calibrate_relevance.py, compare_backends.py)
+collection = shards[BANKS[0]].collection
+backend = shards[BANKS[0]].backend
+
+# One thread per bank; a single bank is searched inline
+shard_executor = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="shard") if len(shards) > 1 else None
+
+
+def check_index_version(bank=None):
+    if bank is not None:
+        return shards[bank].check_version()
+    return tuple(shard.check_version() for shard in shards.values())
+
+
+def invalidate_index():
+    for shard in shards.values():
+        shard.invalidate()
+
+
+# Embeddings of the given keys: cached ones, the rest encoded in one batched call
+def _encode(keys):
+    embeddings = {}
+    to_encode = []
+    for key in keys:
+        embedding = embedding_cache.get(key)
+        if embedding is None:
+            to_encode.append(key)
+        else:
+            embeddings[key] = embedding
+
+    if to_encode:
+        # The model lowercases its input anyway, so the normalized text encodes identically
+        with span("encode"):
+            encoded = encoder.encode(to_encode)
+        for key, embedding in zip(to_encode, encoded):
+            embedding_cache.set(key, embedding)
+            embeddings[key] = embedding
+    return embeddings
+
+
+# -------------------------------------------------------------------------
+# _search_many:
+#   - Core of both search functions, for already normalized, distinct keys.
+#   - Keys with no words, or failing the pre-check of every searched bank,
+#     get [] without touching the model.
+#   - The rest are encoded once and searched in one bank (`bank`) or in
+#     every bank in parallel; the hits of several banks are merged by cosine
+#     score and cut to top_k.
+# -------------------------------------------------------------------------
+def _search_many(keys, top_k, bank=None):
+    results = {key: [] for key in keys}
+    targets = [shards[bank]] if bank is not None else list(shards.values())
+    searchable = [key for key in keys
+                  if tokenize(key) and any(shard.passes_precheck(key) for shard in targets)]
+    if not searchable:
+        return results
+
+    embeddings = _encode(searchable)
+    if len(targets) == 1:
+        return {**results, **targets[0].search(searchable, embeddings, top_k)}
+
+    # The worker threads report their spans under this request
+    futures = [shard_executor.submit(contextvars.copy_context().run, shard.search, searchable, embeddings, top_k)
+               for shard in targets]
+    with span("shards"):
+        partials = [future.result() for future in futures]
+    for key in searchable:
+        results[key] = merge_hits([partial[key] for partial in partials], top_k)
+    return results
+
+
+# Best top_k of several banks' hit lists, by cosine score (stable for ties)
+def merge_hits(hit_lists, top_k):
+    merged = [hit for hits in hit_lists for hit in hits]
+    merged.sort(key=lambda hit: hit.get("score", -1.0), reverse=True)
+    return merged[:top_k]
+
+
+# The first top_k hits that are not among the `excluded` (bank, id) pairs
+def exclude_hits(hits, excluded, top_k):
+    excluded = {tuple(key) for key in excluded}
+    return [hit for hit in hits if (hit["bank"], hit["id"]) not in excluded][:top_k]
+
+
+# Answers carried by the bank's retrieval backend (the artifact), or None
+# when they must be read from PostgreSQL
+def lookup_answers(bank, question_ids):
+    return shards[bank].backend.answers(question_ids)
+
+
+def cache_stats():
+    return {"embeddings": embedding_cache.stats(), "results": result_cache.stats()}
+
+# -------------------------------------------------------------------------
+# 7. Define a function to search questions based on a query:
+#    - top_k determines how many results to retrieve (default=5).
+#    - bank restricts the search to one question bank; by default every
+#      bank of CCNA_BANKS is searched.
+#    - The query is embedded and searched by the vector backend, and the
+#      vector ranking is fused with the BM25 ranking.
+#    - Each hit is {"id", "bank", "question", "score", "bm25", "rrf"} (score/
+#      bm25 may be missing when only one retriever found the question); the
+#      id is the row id, in the bank's PostgreSQL table, set by preprocess.py.
+#    - An empty list means the query failed the lexical pre-check.
+#    - Results are served from result_cache when possible; callers get their
+#      own copies of the hit dicts, so they may modify them freely.
+# -------------------------------------------------------------------------
+def search_questions(query, top_k=5, bank=None):
+    version = check_index_version(bank)
+    key = normalize_query(query)
+    hits = result_cache.get_or_compute((version, bank, key, top_k), lambda: _search_many([key], top_k, bank)[key])
+    return [dict(hit) for hit in hits]
+
+# -------------------------------------------------------------------------
+# 8. Batch search:
+#    - Serves whatever it can from result_cache.
+#    - Everything else goes through one _search_many call: ONE batched
+#      encoder call and ONE multi-embedding query per searched bank.
+#    - Returns one hit list per input query, in input order.
+# -------------------------------------------------------------------------
+def search_questions_batch(queries, top_k=5, bank=None):
+    version = check_index_version(bank)
+    normalized = [normalize_query(query) for query in queries]
+
+    results = {}
+    for key in normalized:
+        if key not in results:
+            cached = result_cache.get((version, bank, key, top_k))
+            if cached is not None:
+                results[key] = cached
+
+    pending = [key for key in dict.fromkeys(normalized) if key not in results]
+    if pending:
+        for key, hits in _search_many(pending, top_k, bank).items():
+            result_cache.set((version, bank, key, top_k), hits)
+            results[key] = hits
+
+    return [[dict(hit) for hit in results[key]] for key in normalized]
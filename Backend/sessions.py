@@ -0,0 +1,110 @@
+import json                    # Session payloads in PostgreSQL
+import os                      # Store selection and limits
+import secrets                 # Unguessable session tokens
+from cache import LRUCache     # Bounded in-memory store
+
+# ----------------------------------------------------------------------------------------
+# Exam session settings:
+#   - CCNA_SESSION_STORE selects the store: "memory" (default) or "postgres". The
+#     Postgres store keeps sessions valid across restarts and shared by every backend
+#     process; the in-memory LRU still serves the hot sessions in front of it.
+#   - CCNA_SESSION_MAX bounds the in-memory LRU; CCNA_SESSION_TTL (seconds) is how
+#     long an exam can be answered after it was handed out.
+# ----------------------------------------------------------------------------------------
+SESSION_STORE = os.getenv("CCNA_SESSION_STORE", "memory")
+SESSION_MAX = int(os.getenv("CCNA_SESSION_MAX", "10000"))
+SESSION_TTL = int(os.getenv("CCNA_SESSION_TTL", "7200"))
+
+
+# ----------------------------------------------------------------------------------------
+# A session is a dict:
+#   {"query": ..., "questions": [{"question_id", "bank", "question", "options", "correct"}],
+#    "seen": [[bank, question_id], ...]}
+# where "options" is the shuffled option list shown to the student, "correct" the
+# index of the correct answer in it and "seen" every question handed out on the
+# topic so far (see /search). Only the token ever leaves the server.
+# ----------------------------------------------------------------------------------------
+def new_token():
+    return secrets.token_urlsafe(16)
+
+
+class MemorySessionStore:
+    def __init__(self, maxsize=SESSION_MAX, ttl=SESSION_TTL):
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl, name="exam_sessions")
+
+    def create(self, session):
+        token = new_token()
+        self.cache.set(token, session)
+        return token
+
+    def get(self, token):
+        return self.cache.get(token)
+
+    def stats(self):
+        return self.cache.stats()
+
+
+# ----------------------------------------------------------------------------------------
+# PostgresSessionStore:
+#   - Write-through: sessions are written to the exam_sessions table and kept in the
+#     in-memory LRU; a lookup that misses the LRU (another process, a restart, an
+#     evicted entry) reads the table by primary key.
+#   - A session read from the table is cached for the rest of its TTL only, so it
+#     expires at the same time in every process.
+#   - Expired rows are deleted opportunistically when new sessions are written.
+# ----------------------------------------------------------------------------------------
+class PostgresSessionStore(MemorySessionStore):
+    def __init__(self, maxsize=SESSION_MAX, ttl=SESSION_TTL):
+        super().__init__(maxsize, ttl)
+        import db
+        self.db = db
+        self.ttl = ttl
+        self.writes = 0
+        with db.connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS exam_sessions (
+                    token TEXT PRIMARY KEY,
+                    payload JSONB NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """)
+
+    def create(self, session):
+        token = new_token()
+        with self.db.connection() as conn, conn.cursor() as cur:
+            cur.execute("INSERT INTO exam_sessions (token, payload) VALUES (%s, %s)",
+                        (token, json.dumps(session)))
+            self.writes += 1
+            if self.writes % 1000 == 0:
+                cur.execute("DELETE FROM exam_sessions WHERE created_at < now() - make_interval(secs => %s)",
+                            (self.ttl,))
+        self.cache.set(token, session)
+        return token
+
+    def get(self, token):
+        session = self.cache.get(token)
+        if session is not None:
+            return session
+        with self.db.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT payload, %s - EXTRACT(EPOCH FROM now() - created_at) FROM exam_sessions "
+                "WHERE token = %s AND created_at >= now() - make_interval(secs => %s)",
+                (self.ttl, token, self.ttl)
+            )
+            row = cur.fetchone()
+        if row is None:
+            return None
+        # psycopg2 decodes JSONB to Python objects already
+        session = row[0] if isinstance(row[0], dict) else json.loads(row[0])
+        remaining = float(row[1])
+        if remaining > 0:
+            self.cache.set(token, session, ttl=remaining)
+        return session
+
+
+def create_session_store(kind=SESSION_STORE):
+    if kind == "memory":
+        return MemorySessionStore()
+    if kind == "postgres":
+        return PostgresSessionStore()
+    raise ValueError(f"Unknown session store {kind!r}; choose memory or postgres")
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The backend modules import each other by their flat names (see app.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Keep imports of generate_response offline and free of side effects
+os.environ.setdefault("CCNA_LLM_STUB", "1")
+os.environ.setdefault("CCNA_FEEDBACK_CACHE", "off")
@@ -0,0 +1,46 @@
+import os
+import numpy as np
+import artifact
+
+
+def write(directory, name, ids, version="1"):
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(len(ids), 4))
+    questions = [f"question {qid} é" for qid in ids]
+    answers = [[f"right {qid}", [f"wrong {qid}"]] for qid in ids]
+    artifact.write_artifact(os.path.join(directory, name), ids, embeddings, questions, answers,
+                            {"version": version, "embedding_backend": "test"})
+    return embeddings
+
+
+def test_round_trip(tmp_path):
+    embeddings = write(str(tmp_path), "bank-1.bin", [30, 10, 20])
+    bank = artifact.BankArtifact(str(tmp_path / "bank-1.bin"))
+
+    assert len(bank) == 3 and bank.version == "1"
+    assert bank.ids.tolist() == [10, 20, 30]
+    assert bank.questions[bank.position(30)] == "question 30 é"
+    assert bank.position(15) is None
+    assert bank.answers([20, 99]) == {20: ("right 20", ["wrong 20"])}
+
+    # Rows are sorted by id and L2-normalized (float16)
+    expected = embeddings[0] / np.linalg.norm(embeddings[0])
+    assert np.allclose(bank.embeddings[bank.position(30)], expected, atol=1e-3)
+
+
+def test_publish_open_and_prune(tmp_path):
+    directory = str(tmp_path)
+    assert artifact.current_name(directory) is None
+    for version in ("1", "2", "3"):
+        write(directory, f"bank-{version}.bin", [1, 2], version)
+        artifact.publish(directory, f"bank-{version}.bin")
+
+    assert artifact.open_current(directory).version == "3"
+    artifact.prune_versions(directory, keep=1)
+    assert sorted(name for name in os.listdir(directory) if name.endswith(".bin")) == ["bank-3.bin"]
+
+
+def test_artifact_dir_per_bank(monkeypatch):
+    monkeypatch.setattr(artifact, "ARTIFACT_DIR", "./artifacts/")
+    assert artifact.artifact_dir() == "./artifacts/"
+    assert artifact.artifact_dir("aws") == os.path.join("./artifacts/", "aws")
@@ -0,0 +1,39 @@
+import numpy as np
+from dedupe import UnionFind, find_groups, is_duplicate
+
+
+def make_bank(documents, answers, vectors):
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return {"ids": list(range(1, len(documents) + 1)), "documents": documents,
+            "metadatas": [{} for _ in documents], "answers": answers, "matrix": matrix}
+
+
+def test_union_find_keeps_the_smallest_root():
+    groups = UnionFind(5)
+    groups.union(3, 4)
+    groups.union(4, 1)
+    assert {groups.find(i) for i in (1, 3, 4)} == {1}
+    assert groups.find(2) == 2
+
+
+def test_groups_same_text_and_close_embeddings_transitively():
+    bank = make_bank(
+        ["What is a VLAN?", "what is a vlan", "Define a VLAN", "What is OSPF?"],
+        ["A", "A", "A", "B"],
+        [[1, 0, 0], [0, 1, 0], [0.02, 1, 0], [0, 0, 1]],
+    )
+    # 0 ~ 1 by text, 1 ~ 2 by embedding: one group, canonical first
+    assert find_groups(bank, threshold=0.95) == [[0, 1, 2]]
+
+
+def test_different_answers_are_kept_apart_unless_ignored():
+    bank = make_bank(["Port of SSH?", "port of ssh"], ["22", "23"], [[1, 0], [1, 0]])
+    assert find_groups(bank, threshold=0.95) == []
+    assert find_groups(bank, threshold=0.95, same_answer=False) == [[0, 1]]
+
+
+def test_is_duplicate():
+    assert is_duplicate({"duplicate_of": 4})
+    assert not is_duplicate({"duplicate_of": -1})
+    assert not is_duplicate(None)
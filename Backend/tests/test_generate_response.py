@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+import pytest
+import generate_response as gr
+
+
+def chunks(text, size):
+    return [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text[i:i + size]))])
+            for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("explanation", [
+    "  Because the mask is /24.\nStudy: Subnetting\n",
+    "Study: early line\nBody line.\nMore.",
+    "First\n\nSecond\r\nStudy: x",
+    "No study line at all",
+    "Stu",
+    "Line\nStudy: a\n\n  ",
+])
+@pytest.mark.parametrize("size", [1, 3, 64])
+def test_stream_unit_matches_split_study_topic(monkeypatch, explanation, size):
+    monkeypatch.setattr(gr, "build_unit_messages", lambda *args: [])
+    monkeypatch.setattr(gr, "complete", lambda messages, llm_client=None, stream=False: iter(chunks(explanation, size)))
+    collected = []
+
+    streamed = "".join(gr.stream_unit("q", "a", "b", collected))
+
+    assert streamed == gr.split_study_topic(explanation)[0]
+    assert "".join(collected) == explanation
+
+
+def test_split_study_topic():
+    assert gr.split_study_topic("Text.\nStudy: VLANs") == ("Text.", "VLANs")
+    assert gr.split_study_topic("Study: VLANs\nText.") == ("Study: VLANs\nText.", None)
+
+
+
+def test_grade():
+    result = gr.grade([("q1", "A", "A "), ("q2", "B", "C")])
+    assert result == {"correct": 1, "total": 2, "percent": 50.0, "results": [True, False]}
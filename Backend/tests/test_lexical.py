@@ -0,0 +1,36 @@
+from lexical import BM25Index, fingerprint, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_drops_stopwords_and_punctuation():
+    assert tokenize("What is the OSPF area-0?") == ["ospf", "area", "0"]
+
+
+def test_fingerprint_ignores_case_punctuation_and_spacing():
+    assert fingerprint("What is  a VLAN?") == fingerprint("what is a vlan")
+    assert fingerprint("What is a VLAN?") != fingerprint("What is a VPN?")
+
+
+def test_bm25_ranks_matching_questions_first():
+    index = BM25Index.build([1, 2, 3], ["ospf area types", "vlan trunk ports", "ospf cost and ospf area"])
+    hits = index.query("ospf area", 3)
+    assert [hit["id"] for hit in hits][:2] in ([1, 3], [3, 1])
+    assert all(0.0 < hit["bm25"] <= 1.0 for hit in hits)
+    assert index.query("chocolate cake", 3) == []
+
+
+def test_bm25_round_trip(tmp_path):
+    index = BM25Index.build([7, 8], ["static routes", "default gateway"])
+    path = str(tmp_path / "bm25.npz")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert loaded.query("gateway", 1) == index.query("gateway", 1)
+
+
+def test_rrf_merges_fields_of_the_same_id():
+    fused = reciprocal_rank_fusion(
+        [[{"id": 1, "score": 0.9}, {"id": 2, "score": 0.5}], [{"id": 2, "bm25": 0.8}, {"id": 3, "bm25": 0.1}]],
+        top_k=3,
+    )
+    assert [hit["id"] for hit in fused] == [2, 1, 3]
+    assert fused[0]["score"] == 0.5 and fused[0]["bm25"] == 0.8
+    assert fused[0]["rrf"] == 1 / 62 + 1 / 61
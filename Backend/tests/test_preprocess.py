@@ -0,0 +1,108 @@
+import importlib
+import json
+import sys
+from contextlib import contextmanager
+import numpy as np
+import pytest
+
+pytest.importorskip("chromadb")
+pytest.importorskip("psycopg2")
+
+
+class FakeModel:
+    def __init__(self):
+        self.encoded = []
+        self.fail_on_call = None
+
+    def encode(self, texts, batch_size=None):
+        self.encoded.append(list(texts))
+        if self.fail_on_call == len(self.encoded):
+            raise KeyboardInterrupt
+        return np.asarray([[len(text), 1.0, 0.5] for text in texts], dtype=np.float32)
+
+
+# preprocess.py over a Chroma store in tmp_path, with PostgreSQL replaced by a
+# list of (id, question) rows and the index rebuilds recorded instead of run
+@pytest.fixture
+def preprocess(tmp_path, monkeypatch):
+    import embeddings
+    import db
+    from chromadb.api.client import SharedSystemClient
+
+    # Chroma caches clients by path, and CHROMA_PATH is relative
+    SharedSystemClient.clear_system_cache()
+    monkeypatch.chdir(tmp_path)
+    model = FakeModel()
+    monkeypatch.setattr(embeddings, "load_model", lambda backend=None: model)
+    monkeypatch.delitem(sys.modules, "preprocess", raising=False)
+    module = importlib.import_module("preprocess")
+
+    module.rows = [(qid, f"question {qid}") for qid in range(1, 7)]
+    module.rebuilds = []
+
+    @contextmanager
+    def connection(timeout=None):
+        yield None
+
+    def iter_question_batches(conn, start_after_id, batch_size):
+        remaining = [row for row in module.rows if row[0] > start_after_id]
+        for start in range(0, len(remaining), batch_size):
+            yield remaining[start:start + batch_size]
+
+    monkeypatch.setattr(db, "connection", connection)
+    monkeypatch.setattr(module, "iter_question_batches", iter_question_batches)
+    monkeypatch.setattr(module, "build_bm25_index", lambda batch_size=None: module.rebuilds.append("bm25"))
+    monkeypatch.setattr(module, "cluster_topics", lambda collection, k=None, bank=None: module.rebuilds.append("topics"))
+    return module
+
+
+def test_unchanged_rows_are_skipped(preprocess):
+    assert preprocess.preprocess_questions(batch_size=4)["embedded"] == 6
+    assert preprocess.collection.count() == 6
+
+    preprocess.rows[2] = (3, "question 3, edited")
+    result = preprocess.preprocess_questions(batch_size=4)
+    assert (result["scanned"], result["embedded"]) == (6, 1)
+    assert preprocess.model.encoded[-1] == ["question 3, edited"]
+
+
+def test_resume_after_interruption(preprocess):
+    preprocess.model.fail_on_call = 2
+    with pytest.raises(KeyboardInterrupt):
+        preprocess.preprocess_questions(batch_size=2)
+    assert preprocess.load_checkpoint() == (2, True)
+    assert preprocess.rebuilds == []
+
+    preprocess.model.fail_on_call = None
+    result = preprocess.preprocess_questions(batch_size=2)
+    assert (result["scanned"], result["embedded"]) == (4, 4)
+    assert preprocess.collection.count() == 6
+    assert preprocess.load_checkpoint() == (0, False)
+
+
+def test_resumed_run_with_nothing_left_still_rebuilds(preprocess, monkeypatch):
+    # Interrupted after the last upsert, before the indexes were rebuilt
+    def interrupted(batch_size=None):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(preprocess, "build_bm25_index", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        preprocess.preprocess_questions(batch_size=4)
+    assert preprocess.load_checkpoint() == (6, True)
+
+    monkeypatch.setattr(preprocess, "build_bm25_index", lambda batch_size=None: preprocess.rebuilds.append("bm25"))
+    result = preprocess.preprocess_questions(batch_size=4)
+    assert result["embedded"] == 0
+    assert preprocess.rebuilds == ["bm25", "topics"]
+    with open(preprocess.INDEX_VERSION_PATH, encoding="utf-8") as f:
+        assert f.read()
+
+
+def test_checkpoint_of_another_model_is_ignored(preprocess):
+    preprocess.save_checkpoint(4)
+    assert preprocess.load_checkpoint() == (4, False)
+
+    with open(preprocess.CHECKPOINT_PATH, "w", encoding="utf-8") as f:
+        json.dump({"model": "another-model", "last_id": 4}, f)
+    assert preprocess.load_checkpoint() == (0, False)
+    assert preprocess.preprocess_questions(batch_size=4)["scanned"] == 6
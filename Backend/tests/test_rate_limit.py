@@ -0,0 +1,72 @@
+import email.utils
+import time
+from types import SimpleNamespace
+import pytest
+import rate_limit
+from rate_limit import QuotaTimeout, RateLimiter, TokenBucket, call_with_retry, retry_after
+
+
+def failure(headers):
+    return SimpleNamespace(response=SimpleNamespace(headers=headers))
+
+
+def test_token_bucket_times_out_when_empty():
+    bucket = TokenBucket(per_minute=60, capacity=2)
+    bucket.acquire(2)
+    with pytest.raises(QuotaTimeout):
+        bucket.acquire(1, timeout=0.05)
+
+
+def test_token_bucket_adjust_gives_units_back():
+    bucket = TokenBucket(per_minute=60, capacity=10)
+    bucket.acquire(10)
+    bucket.adjust(4)
+    bucket.acquire(4, timeout=0)
+
+
+def test_retry_after_headers():
+    assert retry_after(failure({"retry-after-ms": "1500"})) == 1.5
+    assert retry_after(failure({"retry-after": "3"})) == 3.0
+    date = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert 55 <= retry_after(failure({"retry-after": date})) <= 60
+    assert retry_after(failure({})) is None
+    assert retry_after(ValueError()) is None
+
+
+def test_call_with_retry_retries_retryable_errors(monkeypatch):
+    class Throttled(Exception):
+        pass
+
+    monkeypatch.setattr(rate_limit, "is_retryable", lambda exc: isinstance(exc, Throttled))
+    monkeypatch.setattr(rate_limit, "backoff_delay", lambda attempt, exc=None: 0.0)
+    calls = []
+
+    def call():
+        calls.append(1)
+        if len(calls) < 3:
+            raise Throttled()
+        return "ok", 5
+
+    limiter = RateLimiter(rpm=100, tpm=1000, concurrency=1, timeout=1)
+    assert call_with_retry(limiter, call, estimated_tokens=10) == "ok"
+    assert len(calls) == 3
+
+    with pytest.raises(ValueError):
+        call_with_retry(limiter, lambda: (_ for _ in ()).throw(ValueError()), estimated_tokens=10)
+
+
+def test_call_with_retry_holds_the_slot_until_the_stream_is_consumed():
+    limiter = RateLimiter(rpm=100, tpm=1000, concurrency=1, timeout=0.05)
+    stream = call_with_retry(limiter, lambda: (iter(["a", "b"]), None), estimated_tokens=10, stream=True)
+    with pytest.raises(QuotaTimeout):
+        limiter.acquire(10)
+    assert list(stream) == ["a", "b"]
+    limiter.acquire(10)
+    limiter.release()
+
+    stream = call_with_retry(limiter, lambda: (iter(["a", "b"]), None), estimated_tokens=10, stream=True)
+    assert next(stream) == "a"
+    stream.close()
+    stream.close()
+    limiter.acquire(10)
+    limiter.release()
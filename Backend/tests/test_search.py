@@ -0,0 +1,91 @@
+import importlib
+import os
+import sys
+import numpy as np
+import pytest
+import embedding_service
+from embeddings import backend_id
+
+
+def embed(text):
+    vector = np.zeros(32, dtype=np.float32)
+    for word in text.lower().replace("?", " ").split():
+        vector[sum(map(ord, word)) % 32] += 1.0
+    return vector / max(np.linalg.norm(vector), 1e-12)
+
+
+class FakeEncoder:
+    def encode(self, texts):
+        return [embed(text) for text in texts]
+
+
+BANKS = {
+    "ccna": ["what is an ospf area", "what is a vlan trunk", "What is a VLAN trunk?"],
+    "aws": ["what is an s3 bucket", "what is a vpc subnet"],
+}
+
+
+# search.py with two artifact-backed banks and a bag-of-words encoder
+@pytest.fixture
+def search(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CCNA_RETRIEVAL_BACKEND", "artifact")
+    monkeypatch.setenv("CCNA_BANKS", ",".join(BANKS))
+    monkeypatch.setenv("CCNA_ARTIFACT_DIR", str(tmp_path / "artifacts"))
+    monkeypatch.setattr(embedding_service, "get_encoder", lambda: FakeEncoder())
+    for name in ("banks", "artifact", "retrieval", "search"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+
+    artifact = importlib.import_module("artifact")
+    for bank, questions in BANKS.items():
+        directory = artifact.artifact_dir(bank)
+        os.makedirs(directory, exist_ok=True)
+        ids = list(range(1, len(questions) + 1))
+        artifact.write_artifact(os.path.join(directory, "bank-1.bin"), ids, [embed(q) for q in questions],
+                                questions, [[f"{bank} {qid}", []] for qid in ids],
+                                {"version": "1", "embedding_backend": backend_id()})
+        artifact.publish(directory, "bank-1.bin")
+    return importlib.import_module("search")
+
+
+def test_merge_hits_orders_by_score_across_banks(search):
+    merged = search.merge_hits([[{"id": 1, "score": 0.4}], [{"id": 1, "score": 0.9}, {"id": 2}]], 2)
+    assert merged == [{"id": 1, "score": 0.9}, {"id": 1, "score": 0.4}]
+
+
+def test_collapse_duplicates(search):
+    hits = [{"id": 1, "question": "What is a VLAN?"}, {"id": 2, "question": "what is a vlan"},
+            {"id": 3, "question": "Define a VLAN"}, {"id": 4, "question": "What is OSPF?"}]
+    vectors = {3: np.array([1.0, 0.0]), 4: np.array([0.99, 0.141])}
+    # 2 repeats 1's text, 4 is within the threshold of 3
+    assert [hit["id"] for hit in search.collapse_duplicates(hits, 5, vectors)] == [1, 3]
+    assert [hit["id"] for hit in search.collapse_duplicates(hits, 1, vectors)] == [1]
+
+
+def test_search_all_banks(search):
+    hits = search.search_questions("vlan trunk", top_k=3)
+    assert {hit["bank"] for hit in hits} == {"ccna", "aws"}
+    assert (hits[0]["bank"], hits[0]["id"]) == ("ccna", 2)
+    # The near-duplicate "What is a VLAN trunk?" is collapsed
+    assert ("ccna", 3) not in {(hit["bank"], hit["id"]) for hit in hits}
+    assert [hit["score"] for hit in hits] == sorted((hit["score"] for hit in hits), reverse=True)
+
+
+def test_search_one_bank(search):
+    hits = search.search_questions("vpc subnet", top_k=5, bank="aws")
+    assert {hit["bank"] for hit in hits} == {"aws"}
+    assert hits[0]["id"] == 2
+
+
+def test_batch_search_and_answers(search):
+    first, second = search.search_questions_batch(["ospf area", "s3 bucket"], top_k=1)
+    assert (first[0]["bank"], first[0]["id"]) == ("ccna", 1)
+    assert (second[0]["bank"], second[0]["id"]) == ("aws", 1)
+    assert search.lookup_answers("aws", [1, 9]) == {1: ("aws 1", [])}
+    assert search.search_questions_batch(["   "], top_k=1) == [[]]
+
+
+def test_exclude_hits(search):
+    hits = [{"bank": "ccna", "id": 1}, {"bank": "aws", "id": 1}, {"bank": "ccna", "id": 2}]
+    assert search.exclude_hits(hits, [["ccna", 1]], 5) == hits[1:]
+    assert search.exclude_hits(hits, [("aws", 1)], 1) == [hits[0]]
@@ -0,0 +1,39 @@
+import contextlib
+import sys
+import time
+from types import SimpleNamespace
+from cache import LRUCache
+from sessions import PostgresSessionStore
+
+
+def test_entry_ttl_overrides_the_cache_ttl():
+    cache = LRUCache(maxsize=4, ttl=60)
+    cache.set("short", 1, ttl=0.01)
+    cache.set("long", 2)
+    time.sleep(0.02)
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+
+
+def test_postgres_session_is_cached_for_its_remaining_ttl(monkeypatch):
+    rows = []
+
+    class Cursor:
+        def execute(self, sql, params=()):
+            pass
+
+        def fetchone(self):
+            return rows.pop(0)
+
+    @contextlib.contextmanager
+    def connection():
+        yield SimpleNamespace(cursor=lambda: contextlib.nullcontext(Cursor()))
+
+    monkeypatch.setitem(sys.modules, "db", SimpleNamespace(connection=connection))
+    store = PostgresSessionStore(maxsize=4, ttl=7200)
+
+    # Handed out long ago by another process: 0.01 s of its TTL left
+    rows.append(({"query": "vlan"}, 0.01))
+    assert store.get("token") == {"query": "vlan"}
+    time.sleep(0.02)
+    assert store.cache.get("token") is None
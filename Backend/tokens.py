@@ -0,0 +1,77 @@
+import re                      # Fallback tokenizer
+
+# ----------------------------------------------------------------------------------------
+# Token counting for prompt budgets:
+#   - Uses tiktoken (the tokenizer of the OpenAI models) when it is installed; it is
+#     an optional dependency.
+#   - Otherwise falls back to an approximation that splits words and punctuation and
+#     counts long words as several tokens (about 4 characters per token), which
+#     slightly over-counts English text, the safe side for a budget.
+# ----------------------------------------------------------------------------------------
+_fallback_pattern = re.compile(r"\w+|[^\w\s]")
+
+_encodings = {}
+
+
+def get_encoding(model):
+    if model not in _encodings:
+        try:
+            import tiktoken
+        except ImportError:
+            _encodings[model] = None
+        else:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("cl100k_base")
+    return _encodings[model]
+
+
+def _fallback_tokens(text):
+    tokens = []
+    for match in _fallback_pattern.finditer(text):
+        word = match.group()
+        # One token per started 4 characters, keeping the original text of each piece
+        tokens.extend(word[i:i + 4] for i in range(0, len(word), 4))
+    return tokens
+
+
+def count_tokens(text, model="gpt-4"):
+    encoding = get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(_fallback_tokens(text))
+
+
+# Chat overhead per message (role and separators) as documented for the OpenAI models
+def count_message_tokens(messages, model="gpt-4"):
+    return sum(count_tokens(message["content"], model) + 4 for message in messages) + 3
+
+
+# ----------------------------------------------------------------------------------------
+# truncate_tokens: cuts text to at most max_tokens tokens, marking the cut with "...".
+# ----------------------------------------------------------------------------------------
+TRUNCATION_MARKER = "..."
+
+
+def truncate_tokens(text, max_tokens, model="gpt-4"):
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    keep = max_tokens - count_tokens(TRUNCATION_MARKER, model)
+    if keep <= 0:
+        return ""
+
+    encoding = get_encoding(model)
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text)[:keep]).rstrip() + TRUNCATION_MARKER
+
+    # Cut at the end of the last fallback token that still fits
+    end = pieces = 0
+    for match in _fallback_pattern.finditer(text):
+        word = match.group()
+        for i in range(0, len(word), 4):
+            if pieces == keep:
+                return text[:end].rstrip() + TRUNCATION_MARKER
+            pieces += 1
+            end = match.start() + min(i + 4, len(word))
+    return text[:end].rstrip() + TRUNCATION_MARKER
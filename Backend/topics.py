@@ -0,0 +1,254 @@
+import os                      # Clustering settings
+import random                  # Exam sampling
+import threading               # Snapshot swaps of the topic buckets
+from collections import Counter
+import numpy as np             # k-means over the question embeddings
+from lexical import tokenize   # Topic labels from the question words
+from banks import DEFAULT_BANK, table_name, topics_table_name  # Per-bank tables
+
+# ----------------------------------------------------------------------------------------
+# Topic clusters:
+#   - At index time (preprocess.py) the question embeddings are grouped into topic
+#     clusters with spherical k-means. Each question's cluster id is stored in its
+#     Chroma metadata ("topic_cluster") and in questions.topic_cluster; the clusters
+#     themselves (id, label, size) go to the topic_clusters table. Other banks use
+#     their own tables (questions_<bank>, topic_clusters_<bank>; see banks.py).
+#   - At request time the web process only holds {cluster id: [question ids]} buckets
+#     read from PostgreSQL: building an exam needs no vector query at all.
+#   - CCNA_TOPIC_CLUSTERS fixes the number of clusters; by default it is
+#     sqrt(questions / 2), between MIN_CLUSTERS and MAX_CLUSTERS.
+# ----------------------------------------------------------------------------------------
+TOPIC_CLUSTERS = int(os.getenv("CCNA_TOPIC_CLUSTERS", "0"))
+MIN_CLUSTERS = 2
+MAX_CLUSTERS = 64
+KMEANS_ITERATIONS = 50
+LABEL_TERMS = 3
+
+# Page size used when reading the whole collection out of Chroma
+LOAD_PAGE_SIZE = 5000
+
+
+def default_cluster_count(n):
+    return int(min(max(round((n / 2) ** 0.5), MIN_CLUSTERS), MAX_CLUSTERS, n))
+
+
+# ----------------------------------------------------------------------------------------
+# kmeans:
+#   - Spherical k-means (cosine similarity) over L2-normalized rows, seeded with
+#     k-means++ so a run is deterministic for a given seed.
+#   - Returns (labels, centroids).
+# ----------------------------------------------------------------------------------------
+def kmeans(matrix, k, iterations=KMEANS_ITERATIONS, seed=0):
+    rng = np.random.default_rng(seed)
+    matrix = np.asarray(matrix, dtype=np.float32)
+    n = len(matrix)
+
+    # k-means++: each new centroid is drawn with probability proportional to its squared
+    # distance to the closest centroid chosen so far
+    centroids = np.empty((k, matrix.shape[1]), dtype=np.float32)
+    centroids[0] = matrix[rng.integers(n)]
+    distances = 1.0 - matrix @ centroids[0]
+    for i in range(1, k):
+        weights = np.clip(distances, 0.0, None) ** 2
+        total = weights.sum()
+        choice = rng.choice(n, p=weights / total) if total > 0 else rng.integers(n)
+        centroids[i] = matrix[choice]
+        distances = np.minimum(distances, 1.0 - matrix @ centroids[i])
+
+    labels = np.full(n, -1, dtype=np.int64)
+    for _ in range(iterations):
+        new_labels = np.argmax(matrix @ centroids.T, axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for i in range(k):
+            members = matrix[labels == i]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[i] = centroid / max(np.linalg.norm(centroid), 1e-12)
+            else:
+                # Re-seed an empty cluster with the point farthest from its centroid
+                fit = np.einsum("ij,ij->i", matrix, centroids[labels])
+                centroids[i] = matrix[int(np.argmin(fit))]
+    return labels, centroids
+
+
+# Labels a cluster with the words most specific to it (frequency in the cluster
+# relative to the whole bank)
+def cluster_labels(documents, labels, k, terms=LABEL_TERMS):
+    overall = Counter()
+    per_cluster = [Counter() for _ in range(k)]
+    for document, label in zip(documents, labels):
+        words = set(tokenize(document))
+        overall.update(words)
+        per_cluster[label].update(words)
+
+    names = []
+    for counts in per_cluster:
+        ranked = sorted(counts, key=lambda word: (-counts[word] * counts[word] / overall[word], word))
+        names.append(" / ".join(ranked[:terms]))
+    return names
+
+
+# ----------------------------------------------------------------------------------------
+# cluster_topics (index time):
+#   - Reads every embedding out of the Chroma collection, clusters them and writes
+#     the cluster ids back to Chroma (keeping the other metadata) and PostgreSQL.
+#   - Cluster ids are only meaningful within one run; web processes reload the
+#     buckets when the index version changes.
+#   - Questions marked as near-duplicates by dedupe.py get no cluster, so /exam
+#     never picks them.
+# ----------------------------------------------------------------------------------------
+def cluster_topics(collection, k=None, seed=0, bank=DEFAULT_BANK):
+    import db
+
+    table, topics_table = table_name(bank), topics_table_name(bank)
+
+    ids, documents, metadatas, embeddings = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=LOAD_PAGE_SIZE, offset=offset)
+        if not len(page["ids"]):
+            break
+        keep = [i for i, metadata in enumerate(page["metadatas"]) if (metadata or {}).get("duplicate_of", -1) < 0]
+        ids.extend(page["ids"][i] for i in keep)
+        documents.extend(page["documents"][i] for i in keep)
+        metadatas.extend(page["metadatas"][i] or {} for i in keep)
+        embeddings.append(np.asarray(page["embeddings"], dtype=np.float32)[keep])
+        offset += len(page["ids"])
+    if not ids:
+        return 0
+
+    matrix = np.vstack(embeddings)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    k = min(k or TOPIC_CLUSTERS or default_cluster_count(len(ids)), len(ids))
+    labels, _ = kmeans(matrix, k, seed=seed)
+    names = cluster_labels(documents, labels, k)
+    sizes = np.bincount(labels, minlength=k)
+
+    for start in range(0, len(ids), LOAD_PAGE_SIZE):
+        stop = start + LOAD_PAGE_SIZE
+        collection.update(
+            ids=ids[start:stop],
+            metadatas=[{**metadata, "topic_cluster": int(label)}
+                       for metadata, label in zip(metadatas[start:stop], labels[start:stop])]
+        )
+
+    with db.connection() as conn, conn.cursor() as cur:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS topic_cluster INTEGER")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {table}_topic_cluster_idx ON {table} (topic_cluster, id)")
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {topics_table} (
+                id INTEGER PRIMARY KEY,
+                label TEXT NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        cur.execute(f"UPDATE {table} SET topic_cluster = NULL WHERE topic_cluster IS NOT NULL")
+        cur.execute(
+            f"""
+            UPDATE {table} q
+               SET topic_cluster = v.cluster
+              FROM unnest(%s::int[], %s::int[]) AS v(id, cluster)
+             WHERE q.id = v.id
+            """,
+            ([int(doc_id) for doc_id in ids], [int(label) for label in labels])
+        )
+        cur.execute(f"DELETE FROM {topics_table}")
+        cur.execute(
+            f"INSERT INTO {topics_table} (id, label, size) SELECT * FROM unnest(%s::int[], %s::text[], %s::int[])",
+            (list(range(k)), names, [int(size) for size in sizes])
+        )
+    return k
+
+
+# ----------------------------------------------------------------------------------------
+# balanced_allocation:
+#   - Splits `size` questions over buckets of the given sizes as evenly as possible:
+#     every topic gets the same share unless it has fewer questions, in which case
+#     the rest is spread over the larger topics. Leftovers go to random topics.
+#   - Returns one count per bucket; the total is min(size, sum(sizes)).
+# ----------------------------------------------------------------------------------------
+def balanced_allocation(sizes, size, rng=random):
+    counts = [0] * len(sizes)
+    remaining = min(size, sum(sizes))
+    open_buckets = [i for i, bucket_size in enumerate(sizes) if bucket_size]
+    while remaining and open_buckets:
+        share = remaining // len(open_buckets)
+        if share == 0:
+            for i in rng.sample(open_buckets, remaining):
+                counts[i] += 1
+            break
+        for i in open_buckets:
+            take = min(share, sizes[i] - counts[i])
+            counts[i] += take
+            remaining -= take
+        open_buckets = [i for i in open_buckets if counts[i] < sizes[i]]
+    return counts
+
+
+# ----------------------------------------------------------------------------------------
+# TopicIndex (request time):
+#   - Holds the topic buckets {cluster id: [question ids sorted by id]} and the
+#     cluster labels, read from PostgreSQL in two queries.
+#   - snapshot(version) reloads them when the search index version changed (i.e.
+#     preprocess.py clustered again); the snapshot is swapped atomically.
+# ----------------------------------------------------------------------------------------
+class TopicIndex:
+    def __init__(self, bank=DEFAULT_BANK):
+        self.table = table_name(bank)
+        self.topics_table = topics_table_name(bank)
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = None
+
+    def load(self):
+        import db
+
+        with db.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (self.topics_table,))
+            if not cur.fetchone()[0]:
+                return {}, {}
+            cur.execute(f"SELECT id, label FROM {self.topics_table} ORDER BY id")
+            labels = dict(cur.fetchall())
+            cur.execute(f"SELECT topic_cluster, id FROM {self.table} WHERE topic_cluster IS NOT NULL ORDER BY id")
+            rows = cur.fetchall()
+
+        buckets = {cluster: [] for cluster in labels}
+        for cluster, question_id in rows:
+            buckets.setdefault(cluster, []).append(question_id)
+        return buckets, labels
+
+    def snapshot(self, version=None):
+        with self._lock:
+            if self._snapshot is None or version != self._version:
+                self._snapshot = self.load()
+                self._version = version
+            return self._snapshot
+
+    def topics(self, version=None):
+        buckets, labels = self.snapshot(version)
+        return [{"id": cluster, "label": labels.get(cluster, ""), "size": len(ids)}
+                for cluster, ids in sorted(buckets.items())]
+
+    # Topic-balanced sample of `size` distinct question ids, optionally restricted
+    # to some topics; O(size) apart from the per-topic allocation
+    def sample(self, size, topics=None, version=None, rng=random):
+        buckets, _ = self.snapshot(version)
+        clusters = [cluster for cluster in sorted(buckets) if topics is None or cluster in topics]
+        counts = balanced_allocation([len(buckets[cluster]) for cluster in clusters], size, rng)
+        picked = []
+        for cluster, count in zip(clusters, counts):
+            picked.extend((cluster, question_id) for question_id in rng.sample(buckets[cluster], count))
+        rng.shuffle(picked)
+        return picked
+
+    # One page (1-based) of a topic's question ids and the topic's total size;
+    # None when the topic does not exist
+    def page(self, cluster, page, page_size, version=None):
+        buckets, labels = self.snapshot(version)
+        if cluster not in buckets:
+            return None
+        ids = buckets[cluster]
+        start = (page - 1) * page_size
+        return {"label": labels.get(cluster, ""), "ids": ids[start:start + page_size], "total": len(ids)}
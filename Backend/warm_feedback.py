@@ -0,0 +1,84 @@
+import argparse                                   # Command-line options
+import os                                         # Environment switch for the stub model
+import time                                       # Progress reporting
+from concurrent.futures import ThreadPoolExecutor
+from banks import DEFAULT_BANK, table_name        # Question bank to warm up
+
+# ----------------------------------------------------------------------------
+# Feedback warm-up job:
+#   - Walks the whole question bank and pre-generates the explanation unit of
+#     every (question, incorrect option) pair that is not cached yet, so most
+#     /validate calls are served entirely from the feedback cache.
+#   - --stub runs against the local stub model (llm_stub.py), which is useful
+#     to exercise the pipeline and the cache without network access.
+# ----------------------------------------------------------------------------
+def iter_questions(batch_size, bank=DEFAULT_BANK):
+    import db
+    with db.connection() as conn:
+        with conn.cursor(name="warm_feedback") as cur:
+            cur.itersize = batch_size
+            cur.execute(f"SELECT question, correct_answer, incorrect_answers FROM {table_name(bank)} ORDER BY id")
+            for question, correct_answer, incorrect_answers in cur:
+                yield question, correct_answer, incorrect_answers or []
+
+
+def warm(batch_size=500, workers=4, limit=None, bank=DEFAULT_BANK):
+    import generate_response as gr
+
+    started = time.perf_counter()
+    scanned = generated = failed = 0
+
+    def explain(key, item):
+        try:
+            return key, gr.explain_unit(*item)
+        except Exception as e:
+            gr.logger.error(f"Could not explain {item[0][:60]!r} / {item[2]!r}: {e}")
+            return key, None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        batch = []
+        for question, correct_answer, incorrect_answers in iter_questions(batch_size, bank):
+            for chosen in incorrect_answers:
+                item = (question, correct_answer, chosen)
+                batch.append((gr.feedback_key(gr.PROMPT_VERSION, *item), item))
+            scanned += 1
+            if limit and scanned >= limit:
+                break
+            if len(batch) >= batch_size:
+                counts = flush(gr, executor, explain, batch)
+                generated, failed = generated + counts[0], failed + counts[1]
+                batch = []
+        if batch:
+            counts = flush(gr, executor, explain, batch)
+            generated, failed = generated + counts[0], failed + counts[1]
+
+    elapsed = time.perf_counter() - started
+    print(f"Scanned {scanned} questions, generated {generated} explanations "
+          f"({failed} failed) in {elapsed:.1f}s")
+    return {"scanned": scanned, "generated": generated, "failed": failed}
+
+
+# Generates the uncached units of one batch and stores them in one write
+def flush(gr, executor, explain, batch):
+    cached = gr.feedback_cache.get_many([key for key, _ in batch])
+    todo = {key: item for key, item in batch if key not in cached}
+    results = list(executor.map(lambda pair: explain(*pair), todo.items()))
+    done = [(key, gr.PROMPT_VERSION, text) for key, text in results if text is not None]
+    gr.feedback_cache.put_many(done)
+    return len(done), len(results) - len(done)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate feedback for every (question, incorrect option) pair.")
+    parser.add_argument("--stub", action="store_true", help="Use the local stub model instead of Azure OpenAI.")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent model calls.")
+    parser.add_argument("--batch-size", type=int, default=500, help="Units looked up/stored per cache round trip.")
+    parser.add_argument("--limit", type=int, help="Only process the first N questions.")
+    parser.add_argument("--bank", default=DEFAULT_BANK, help="Question bank to walk.")
+    args = parser.parse_args()
+
+    if args.stub:
+        # Must be set before generate_response creates its client
+        os.environ["CCNA_LLM_STUB"] = "1"
+
+    warm(args.batch_size, args.workers, args.limit, args.bank)
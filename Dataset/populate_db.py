@@ -1,53 +1,322 @@
-import json
-import psycopg2
-
-# Load the JSON data
-with open('CCNA.json', 'r', encoding='utf-8') as file:
-    data = json.load(file)
-
-# Database connection parameters
-db_params = {
-    'dbname': 'ccna_db',
-    'user': '**********',
-    'password': '***********',
-    'host': 'localhost',
-    'port': 5432
-}
-
-try:
-    # Connect to the database
-    conn = psycopg2.connect(**db_params)
-    cursor = conn.cursor()
-
-    # Create the table if it doesn't exist
-    create_table_query = """
-    CREATE TABLE IF NOT EXISTS questions (
-        id SERIAL PRIMARY KEY,
-        question TEXT NOT NULL,
-        correct_answer TEXT NOT NULL,
-        incorrect_answers TEXT[] NOT NULL
-    )
-    """
-    cursor.execute(create_table_query)
-
-    # Insert data into the table
-    insert_query = """
-    INSERT INTO questions (question, correct_answer, incorrect_answers)
-    VALUES (%s, %s, %s)
-    """
-    for item in data:
-        cursor.execute(insert_query, (item['question'], item['correct_answer'], item['incorrect_answers']))
-
-    # Commit changes
-    conn.commit()
-    print("Table created and data inserted successfully!")
-
-except Exception as e:
-    print(f"An error occurred: {e}")
-
-finally:
-    # Close the database connection
-    if cursor:
-        cursor.close()
-    if conn:
-        conn.close()
+import argparse
+import csv
+import io
+import json
+import re
+import os
+import sys
+import time
+import psycopg2
+
+# Database connection parameters (overridable through the same CCNA_DB_*
+# environment variables as Backend/db.py)
+db_params = {
+    'dbname': os.getenv('CCNA_DB_NAME', 'ccna_db'),
+    'user': os.getenv('CCNA_DB_USER', '**********'),
+    'password': os.getenv('CCNA_DB_PASSWORD', '***********'),
+    'host': os.getenv('CCNA_DB_HOST', 'localhost'),
+    'port': int(os.getenv('CCNA_DB_PORT', '5432'))
+}
+
+# Size of the chunks read from the dataset file while streaming it
+READ_CHUNK_SIZE = 1 << 16
+
+# --------------------------------------------------------------------
+# Question banks:
+#   - Every certification bank has its own table: "questions" for the
+#     default CCNA bank, "questions_<bank>" for the others. The naming
+#     rules are shared with the server (Backend/banks.py).
+# --------------------------------------------------------------------
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Backend"))
+from banks import DEFAULT_BANK, table_name  # noqa: E402
+
+# --------------------------------------------------------------------
+# Schema:
+#   - question_key holds the normalized question text; the unique index
+#     on it is what makes reloading idempotent.
+#   - The ALTER/UPDATE statements upgrade tables created by older versions
+#     of this script, which had no key column.
+#   - {table} is the table of the bank being loaded (see table_name).
+# --------------------------------------------------------------------
+create_table_query = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id SERIAL PRIMARY KEY,
+    question TEXT NOT NULL,
+    correct_answer TEXT NOT NULL,
+    incorrect_answers TEXT[] NOT NULL,
+    question_key TEXT
+)
+"""
+
+migrate_key_query = """
+ALTER TABLE {table} ADD COLUMN IF NOT EXISTS question_key TEXT;
+UPDATE {table}
+   SET question_key = lower(btrim(regexp_replace(question, '\\s+', ' ', 'g')))
+ WHERE question_key IS NULL;
+"""
+
+# Older loads may already contain duplicates; keep the oldest row of each key
+dedupe_existing_query = """
+DELETE FROM {table} q
+ USING {table} older
+ WHERE q.question_key = older.question_key
+   AND q.id > older.id
+"""
+
+create_key_index_query = """
+CREATE UNIQUE INDEX IF NOT EXISTS {table}_question_key_idx ON {table} (question_key)
+"""
+
+# Exact-text lookups on the raw question column go through a hash index
+# instead of a sequential scan (the backend itself looks answers up by id)
+create_text_index_query = """
+CREATE INDEX IF NOT EXISTS {table}_question_hash_idx ON {table} USING hash (question)
+"""
+
+# --------------------------------------------------------------------
+# Staging + merge:
+#   - Rows are COPY'd into a temporary staging table in one pass.
+#   - DISTINCT ON keeps the last occurrence of a key inside the input file.
+#   - Rows whose content did not change are left alone (the WHERE clause on
+#     DO UPDATE), so a second run touches nothing.
+#   - xmax = 0 distinguishes freshly inserted rows from updated ones.
+# --------------------------------------------------------------------
+create_staging_query = """
+CREATE TEMP TABLE questions_staging (
+    seq BIGINT NOT NULL,
+    question TEXT NOT NULL,
+    correct_answer TEXT NOT NULL,
+    incorrect_answers TEXT[] NOT NULL,
+    question_key TEXT NOT NULL
+) ON COMMIT DROP
+"""
+
+copy_staging_query = """
+COPY questions_staging (seq, question, correct_answer, incorrect_answers, question_key)
+FROM STDIN WITH (FORMAT csv)
+"""
+
+merge_query = """
+WITH merged AS (
+    INSERT INTO {table} (question, correct_answer, incorrect_answers, question_key)
+    SELECT DISTINCT ON (question_key) question, correct_answer, incorrect_answers, question_key
+      FROM questions_staging
+     ORDER BY question_key, seq DESC
+    ON CONFLICT (question_key) DO UPDATE
+       SET question = EXCLUDED.question,
+           correct_answer = EXCLUDED.correct_answer,
+           incorrect_answers = EXCLUDED.incorrect_answers
+     WHERE ({table}.question, {table}.correct_answer, {table}.incorrect_answers)
+           IS DISTINCT FROM
+           (EXCLUDED.question, EXCLUDED.correct_answer, EXCLUDED.incorrect_answers)
+    RETURNING (xmax = 0) AS inserted
+)
+SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged
+"""
+
+_whitespace = re.compile(r"\s+")
+
+
+# --------------------------------------------------------------------
+# normalize_question:
+#   - Must stay in sync with the SQL expression in migrate_key_query.
+# --------------------------------------------------------------------
+def normalize_question(question):
+    return _whitespace.sub(" ", question.strip()).lower()
+
+
+# --------------------------------------------------------------------
+# iter_json_items:
+#   - Streams the objects of a top-level JSON array without loading the
+#     whole file, decoding one item at a time from a rolling buffer.
+# --------------------------------------------------------------------
+def iter_json_items(path):
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as file:
+        buffer, eof, opened = "", False, False
+        while True:
+            buffer = buffer.lstrip()
+            if opened:
+                buffer = buffer.lstrip(", \t\r\n")
+            if buffer:
+                if not opened:
+                    if buffer[0] != "[":
+                        raise ValueError(f"{path}: expected a JSON array")
+                    buffer, opened = buffer[1:], True
+                    continue
+                if buffer[0] == "]":
+                    return
+                try:
+                    item, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    yield item
+                    buffer = buffer[end:]
+                    continue
+            elif eof:
+                raise ValueError(f"{path}: unexpected end of file")
+
+            chunk = file.read(READ_CHUNK_SIZE)
+            eof = not chunk
+            buffer += chunk
+
+
+# --------------------------------------------------------------------
+# iter_txt_items:
+#   - Reads the semicolon-delimited format used by CCNA.txt:
+#     question;correct_answer;incorrect_1;incorrect_2;...
+# --------------------------------------------------------------------
+def iter_txt_items(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        for line_no, line in enumerate(file, 1):
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            fields = line.split(";")
+            if len(fields) < 3:
+                print(f"Skipping malformed line {line_no}: expected at least 3 fields")
+                continue
+            yield {
+                'question': fields[0].strip(),
+                'correct_answer': fields[1].strip(),
+                'incorrect_answers': [field.strip() for field in fields[2:]],
+            }
+
+
+def iter_items(path, fmt=None):
+    fmt = fmt or ("txt" if path.lower().endswith(".txt") else "json")
+    return iter_txt_items(path) if fmt == "txt" else iter_json_items(path)
+
+
+# --------------------------------------------------------------------
+# Text array literal for the TEXT[] column in COPY's CSV format.
+# --------------------------------------------------------------------
+def to_pg_array(values):
+    quoted = ('"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"' for value in values)
+    return "{" + ",".join(quoted) + "}"
+
+
+# --------------------------------------------------------------------
+# CopySource:
+#   - File-like object that renders items as CSV lazily, so COPY consumes
+#     the dataset while it is being parsed instead of after.
+# --------------------------------------------------------------------
+class CopySource(io.TextIOBase):
+    def __init__(self, items):
+        self._rows = self._render(items)
+        self._buffer = ""
+        self.count = 0
+
+    def _render(self, items):
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n", quoting=csv.QUOTE_NONNUMERIC)
+        for item in items:
+            question = item['question']
+            self.count += 1
+            writer.writerow((
+                self.count,
+                question,
+                item['correct_answer'],
+                to_pg_array(item['incorrect_answers']),
+                normalize_question(question),
+            ))
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._rows, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+# --------------------------------------------------------------------
+# ensure_schema: create or upgrade the questions table of a bank.
+# --------------------------------------------------------------------
+def ensure_schema(cursor, table="questions"):
+    cursor.execute(create_table_query.format(table=table))
+    cursor.execute(migrate_key_query.format(table=table))
+    cursor.execute("SELECT to_regclass(%s)", (f"{table}_question_key_idx",))
+    if cursor.fetchone()[0] is None:
+        cursor.execute(dedupe_existing_query.format(table=table))
+        if cursor.rowcount:
+            print(f"Removed {cursor.rowcount} duplicate rows left by earlier loads")
+        cursor.execute(create_key_index_query.format(table=table))
+    cursor.execute(create_text_index_query.format(table=table))
+
+
+# --------------------------------------------------------------------
+# load_questions:
+#   - Streams the file through COPY into the staging table and merges it
+#     into the bank's table in a single transaction.
+#   - Returns the inserted / updated / skipped counts.
+# --------------------------------------------------------------------
+def load_questions(conn, path, fmt=None, bank=DEFAULT_BANK):
+    table = table_name(bank)
+    with conn.cursor() as cursor:
+        ensure_schema(cursor, table)
+        cursor.execute(create_staging_query)
+
+        source = CopySource(iter_items(path, fmt))
+        cursor.copy_expert(copy_staging_query, source)
+
+        cursor.execute(merge_query.format(table=table))
+        inserted, updated = cursor.fetchone()
+    conn.commit()
+
+    return {
+        'inserted': inserted,
+        'updated': updated,
+        'skipped': source.count - inserted - updated,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load a question bank into PostgreSQL.")
+    parser.add_argument("path", nargs="?", default="CCNA.json",
+                        help="JSON array file or semicolon-delimited .txt file.")
+    parser.add_argument("--format", choices=("json", "txt"),
+                        help="Input format (default: guessed from the file extension).")
+    parser.add_argument("--bank", default=DEFAULT_BANK,
+                        help="Question bank to load into (default: ccna, the questions table).")
+    args = parser.parse_args()
+
+    conn = None
+    try:
+        # Connect to the database
+        conn = psycopg2.connect(**db_params)
+
+        started = time.perf_counter()
+        counts = load_questions(conn, args.path, args.format, args.bank)
+        elapsed = time.perf_counter() - started
+
+        print(
+            f"Loaded {args.path} into bank {args.bank} in {elapsed:.2f}s: {counts['inserted']} inserted, "
+            f"{counts['updated']} updated, {counts['skipped']} skipped"
+        )
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"An error occurred: {e}")
+
+    finally:
+        # Close the database connection
+        if conn:
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
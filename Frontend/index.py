@@ -1,8 +1,11 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import os
-import random
+import json
+import time
 
 # Load environment variables from the .env file
 load_dotenv()
@@ -11,6 +14,114 @@ load_dotenv()
 BACKEND_URL_SEARCH = os.getenv("BACKEND_URL_SEARCH", "http://127.0.0.1:5000/search")
 BACKEND_URL_VALIDATE = os.getenv("BACKEND_URL_VALIDATE", "http://127.0.0.1:5000/validate")
 
+# --------------------------------------------------------------------
+# Backend call settings (seconds):
+#   - BACKEND_CONNECT_TIMEOUT: establishing the TCP connection.
+#   - BACKEND_READ_TIMEOUT: waiting for a /search response.
+#   - BACKEND_FEEDBACK_TIMEOUT: longest silence on the /validate feedback
+#     stream (the model can take a while before its first token).
+#   - SEARCH_CACHE_TTL: how long a user's question set for a topic is reused;
+#     keep it well below the backend's exam session TTL (CCNA_SESSION_TTL).
+# --------------------------------------------------------------------
+CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("BACKEND_READ_TIMEOUT", "30"))
+FEEDBACK_TIMEOUT = float(os.getenv("BACKEND_FEEDBACK_TIMEOUT", "120"))
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "300"))
+
+
+# --------------------------------------------------------------------
+# http_session: one requests.Session for the whole Streamlit server,
+# created once and reused by every script rerun, so calls go over pooled
+# keep-alive connections instead of a new TCP connection each time.
+# --------------------------------------------------------------------
+@st.cache_resource
+def http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# Background threads that prefetch the next question set
+@st.cache_resource
+def prefetch_executor():
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="prefetch")
+
+
+# --------------------------------------------------------------------
+# request_questions: asks the backend for a question set on a topic.
+#   - exclude_session is the exam session token of the set being answered:
+#     the backend then skips the questions already handed out, so the
+#     next set is a new one.
+#   - Returns the JSON payload of a 200 (questions) or 400 (invalid or
+#     off-topic query, with an "error" message).
+#   - Raises requests.RequestException for anything else, so failures
+#     are never cached.
+#   - Makes no Streamlit calls: it also runs on the prefetch threads.
+# --------------------------------------------------------------------
+def request_questions(session, topic, exclude_session=None):
+    body = {"query": topic}
+    if exclude_session:
+        body["exclude_session"] = exclude_session
+    response = session.post(BACKEND_URL_SEARCH, json=body, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    if response.status_code in (200, 400):
+        return response.json()
+    response.raise_for_status()
+    raise requests.exceptions.HTTPError(f"Unexpected status {response.status_code}: {response.text}")
+
+
+# The question set of a topic, reused for SEARCH_CACHE_TTL. The cache is per
+# user (st.session_state): every set carries its own exam session token,
+# which must not be shared between users.
+def fetch_questions(topic):
+    cache = st.session_state.setdefault("question_cache", {})
+    cached = cache.get(topic)
+    if cached is not None and time.monotonic() - cached[0] < SEARCH_CACHE_TTL:
+        return cached[1]
+    data = request_questions(http_session(), topic)
+    if "error" not in data:
+        cache[topic] = (time.monotonic(), data)
+    return data
+
+
+# Starts fetching the next question set for the topic (excluding the
+# questions of exam_session) while the current one is answered
+def start_prefetch(topic, exam_session):
+    future = prefetch_executor().submit(request_questions, http_session(), topic, exam_session)
+    st.session_state["prefetch"] = (topic, exam_session, future)
+
+
+# Takes the prefetched set for the topic (waiting for it if it is still
+# on its way; the request timeouts bound the wait), or fetches one now
+def next_questions(topic, exam_session):
+    prefetched = st.session_state.pop("prefetch", None)
+    if prefetched is not None and prefetched[:2] == (topic, exam_session):
+        return prefetched[2].result()
+    return request_questions(http_session(), topic, exam_session)
+
+
+# True when a question set has no question in common with the current one
+def is_new_set(data, current):
+    shown = {question["question"] for question in current or []}
+    return not any(question["question"] in shown for question in data.get("results", []))
+
+
+# --------------------------------------------------------------------
+# iter_sse: parses a Server-Sent Events response into (event, data) pairs.
+# --------------------------------------------------------------------
+def iter_sse(response):
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
 # Configure the basic layout and appearance of the Streamlit app
 st.set_page_config(
     page_title="CCNA Exam Helper",
@@ -31,108 +142,117 @@ st.markdown("""
 # Prompt the user to enter a CCNA-related topic
 topic = st.text_input("Enter a CCNA topic (e.g., Routing, OSPF, Switching, etc.):", "")
 
-# Trigger the question-fetching process when the button is clicked
-if st.button("Fetch Questions"):
+# "Fetch Questions" starts a topic; "Next Questions" moves on to a fresh set
+# of the current topic, which is normally already prefetched
+fetch_column, next_column = st.columns(2)
+fetch_clicked = fetch_column.button("Fetch Questions")
+next_clicked = next_column.button("Next Questions", disabled="quiz_topic" not in st.session_state)
+
+# Trigger the question-fetching process when a button is clicked
+if fetch_clicked or next_clicked:
+    quiz_topic = topic.strip() if fetch_clicked else st.session_state["quiz_topic"]
     # Check if the user has entered a valid topic (non-empty string)
-    if not topic.strip():
+    if not quiz_topic:
         st.warning("Please enter a topic to fetch questions.")
     else:
         with st.spinner("Fetching questions..."):
             try:
                 # Send the topic to the backend to retrieve relevant questions
-                response = requests.post(BACKEND_URL_SEARCH, json={"query": topic})
+                if fetch_clicked:
+                    data = fetch_questions(quiz_topic)
+                else:
+                    data = next_questions(quiz_topic, st.session_state.get("exam_session"))
 
-                # Check response status and handle accordingly
-                if response.status_code == 400:
+                if "error" in data:
                     # The request was invalid; display the error message from the backend
-                    error_msg = response.json().get("error", "Invalid request.")
-                    st.error(error_msg)
-                elif response.status_code == 200:
-                    # The request was successful; parse the JSON response
-                    data = response.json()
-                    results = data.get("results", [])
-                    
+                    st.error(data.get("error", "Invalid request."))
+                elif not data.get("results"):
                     # If no questions were found for the entered topic
-                    if not results:
-                        st.error("No questions found for the provided topic. Try another topic.")
-                    else:
-                        # Store the retrieved questions in session state
-                        st.session_state["questions"] = results
-                        # Reset user answers and correct answers for new search
-                        st.session_state["answers"] = []
-                        st.session_state["correct_answers"] = []
-                        st.success("Questions fetched successfully! Scroll down to answer them.")
+                    st.error("No questions found for the provided topic. Try another topic.")
                 else:
-                    # Any other unexpected status code is handled here
-                    st.error(f"Unexpected error: {response.status_code}")
-                    st.error(response.text)
+                    if next_clicked and not is_new_set(data, st.session_state.get("questions")):
+                        # The backend starts over once a topic runs out of questions
+                        st.info("You have seen every question on this topic; starting over.")
+                    # Store the retrieved questions and the exam session token in session state
+                    st.session_state["questions"] = data["results"]
+                    st.session_state["exam_session"] = data.get("session")
+                    st.session_state["quiz_topic"] = quiz_topic
+                    # Reset the previous answers for the new search
+                    for key in [key for key in st.session_state if key[:1] == "q" and key[1:].isdigit()]:
+                        del st.session_state[key]
+                    # Get the following set ready while this one is answered
+                    start_prefetch(quiz_topic, data.get("session"))
+                    st.success("Questions fetched successfully! Scroll down to answer them.")
 
-            # Catch connection or request errors
+            # Catch connection or request errors (including a failed prefetch)
             except requests.exceptions.RequestException as e:
                 st.error(f"Error fetching questions: {e}")
 
 # If there are questions in session state, display them for user interaction
 if "questions" in st.session_state and st.session_state["questions"]:
     st.markdown("### Answer the Questions Below:")
-    question_texts = []
-    correct_answers = []
-    user_answers = []
+    chosen_options = []
 
-    # Loop through each question from the backend results
+    # Loop through each question from the backend results; the options are
+    # already shuffled by the backend, which keeps the correct answers
     for question_data in st.session_state["questions"]:
         question_id = question_data["id"]
         question_text = question_data["question"]
-        correct_answer = question_data["correct_answer"]
-        incorrect_answers = question_data["incorrect_answers"]
-
-        # Prepare question options (correct + incorrect answers) if not already done
-        if f"q{question_id}_options" not in st.session_state:
-            options = [correct_answer] + incorrect_answers
-            random.shuffle(options)  # Randomize option order
-            st.session_state[f"q{question_id}_options"] = options
-        else:
-            # Reuse previously stored options if they've already been shuffled
-            options = st.session_state[f"q{question_id}_options"]
+        options = question_data["options"]
 
         # Display the question number and text
         st.markdown(f"**{question_id}. {question_text}**")
 
-        # Provide a radio button for the user to select their answer
-        user_answer = st.radio(
+        # Provide a radio button for the user to select their answer (by option index)
+        chosen = st.radio(
             label="",  # Label is omitted for a cleaner look
-            options=options,
+            options=range(len(options)),
+            format_func=lambda i, options=options: options[i],
             key=f"q{question_id}"
         )
 
-        # Collect data for later validation
-        question_texts.append(question_text)
-        correct_answers.append(correct_answer)
-        user_answers.append(user_answer)
+        # Collect the chosen option index for later validation
+        chosen_options.append(chosen)
 
     # When the user is ready, submit the answers for validation
     if st.button("Submit Answers"):
-        with st.spinner("Submitting answers..."):
-            try:
-                # Send the user's answers to the backend for validation
-                response = requests.post(
-                    BACKEND_URL_VALIDATE,
-                    json={
-                        "query": topic,
-                        "questions": question_texts,
-                        "correct_answers": correct_answers,
-                        "user_answers": user_answers
-                    }
-                )
-                # Raise an exception if the backend response is not successful (4xx/5xx)
-                response.raise_for_status()
-
-                # Extract the feedback from the response and display it
-                feedback = response.json().get("feedback", {})
-                st.markdown("### Feedback:")
-                st.markdown(feedback.get("feedback", ""))
+        try:
+            # Send the user's answers to the backend for validation and stream
+            # the feedback back as it is generated
+            response = http_session().post(
+                BACKEND_URL_VALIDATE,
+                json={
+                    "session": st.session_state["exam_session"],
+                    "answers": chosen_options,
+                    "stream": True
+                },
+                stream=True,
+                timeout=(CONNECT_TIMEOUT, FEEDBACK_TIMEOUT)
+            )
+            # Raise an exception if the backend response is not successful (4xx/5xx)
+            response.raise_for_status()
 
-            except requests.exceptions.RequestException as e:
-                st.error(f"Error submitting answers: {e}")
+            # Render the score, then the feedback token by token in a single placeholder
+            st.markdown("### Feedback:")
+            score_area = st.container()
+            placeholder = st.empty()
+            placeholder.markdown("_Generating feedback..._")
+            feedback_text = ""
+            with response:
+                for event, payload in iter_sse(response):
+                    if event == "score":
+                        # The local grade arrives before any feedback text
+                        score_area.metric("Score", f"{payload['correct']} / {payload['total']}", f"{payload['percent']}%")
+                    elif event == "token":
+                        feedback_text += payload.get("text", "")
+                        placeholder.markdown(feedback_text)
+                    elif event == "done":
+                        placeholder.markdown(payload.get("feedback", feedback_text))
+                    elif event == "error":
+                        st.error(payload.get("error", "An error occurred while generating feedback."))
+
+        except requests.exceptions.RequestException as e:
+            st.error(f"Error submitting answers: {e}")
 
 # Display a small footer at the bottom of the app
 st.markdown("""